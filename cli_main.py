@@ -1,18 +1,27 @@
 import argparse
 import asyncio
+import sys
 from datetime import datetime
 from os.path import exists
 from pathlib import Path
 
-from conf import BASE_DIR
-from uploader.douyin_uploader.main import douyin_setup, DouYinVideo
-from uploader.ks_uploader.main import ks_setup, KSVideo
-from uploader.tencent_uploader.main import weixin_setup, TencentVideo
-from uploader.tk_uploader.main_chrome import tiktok_setup, TiktokVideo
+from conf import BASE_DIR, ACCOUNT_CHECK_WORKERS, JOB_MAX_ATTEMPTS, UPLOAD_PREFLIGHT
+from uploader.douyin_uploader.main import douyin_setup, DouYinVideo, cookie_auth as douyin_cookie_auth
+from uploader.ks_uploader.main import ks_setup, KSVideo, cookie_auth as ks_cookie_auth
+from uploader.tencent_uploader.main import weixin_setup, TencentVideo, cookie_auth as tencent_cookie_auth
+from uploader.tk_uploader.main_chrome import tiktok_setup, TiktokVideo, cookie_auth as tiktok_cookie_auth
+from utils.account_health import check_accounts, format_results_table, write_results
 from utils.base_social_media import get_supported_social_media, get_cli_action, SOCIAL_MEDIA_DOUYIN, \
-    SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_KUAISHOU
+    SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_KUAISHOU, SOCIAL_MEDIA_BILIBILI
+from utils.browser_pool import browser_pool
 from utils.constant import TencentZoneTypes
+from utils.dedup import DedupIndex
 from utils.files_times import get_title_and_hashtags
+from utils.fingerprint import file_fingerprint
+from utils.job_store import JobStore, STATE_SKIPPED, STATE_FAILED
+from utils.pacing import upload_pacer
+from utils.preflight import preflight_check
+from utils.upload_scheduler import UploadScheduler
 
 
 def parse_schedule(schedule_raw):
@@ -23,7 +32,124 @@ def parse_schedule(schedule_raw):
     return schedule
 
 
+async def check_accounts_main(argv):
+    parser = argparse.ArgumentParser(prog="cli_main.py check-accounts",
+                                     description="Validate all stored accounts in cookies/ concurrently.")
+    parser.add_argument("-p", "--platforms", nargs="+", choices=get_supported_social_media(),
+                        help="Only check these platforms, default all")
+    parser.add_argument("-w", "--workers", type=int, default=ACCOUNT_CHECK_WORKERS,
+                        help="Concurrent checks per platform")
+    parser.add_argument("-o", "--output", default=str(BASE_DIR / "logs" / "check_accounts.json"),
+                        help="Path of the json result file")
+    args = parser.parse_args(argv)
+
+    auth_funcs = {
+        SOCIAL_MEDIA_DOUYIN: douyin_cookie_auth,
+        SOCIAL_MEDIA_TENCENT: tencent_cookie_auth,
+        SOCIAL_MEDIA_TIKTOK: tiktok_cookie_auth,
+        SOCIAL_MEDIA_KUAISHOU: ks_cookie_auth,
+    }
+    results = await check_accounts(auth_funcs, platforms=args.platforms, workers=args.workers)
+    if not results:
+        print(f"No account files found in {BASE_DIR / 'cookies'}")
+        return
+    print(format_results_table(results))
+    write_results(results, args.output)
+    print(f"{sum(r['valid'] for r in results)}/{len(results)} accounts valid, results saved to {args.output}")
+
+
+def build_upload_app(job):
+    """
+    Recreate the uploader of a stored job.
+    :returns: the callable to run, None if the platform cannot be resumed from the cli
+    """
+    file = Path(job.file)
+    if job.platform == SOCIAL_MEDIA_DOUYIN:
+        return DouYinVideo(job.title, file, job.tags, job.publish_date, job.account_file,
+                           job.options.get("thumbnail_path")).main
+    elif job.platform == SOCIAL_MEDIA_TIKTOK:
+        return TiktokVideo(job.title, file, job.tags, job.publish_date, job.account_file,
+                           job.options.get("thumbnail_path")).main
+    elif job.platform == SOCIAL_MEDIA_TENCENT:
+        return TencentVideo(job.title, file, job.tags, job.publish_date, job.account_file,
+                            job.options.get("category")).main
+    elif job.platform == SOCIAL_MEDIA_KUAISHOU:
+        return KSVideo(job.title, file, job.tags, job.publish_date, job.account_file).main
+    elif job.platform == SOCIAL_MEDIA_BILIBILI:
+        from uploader.bilibili_uploader.main import read_cookie_json_file, extract_keys_from_json, BilibiliUploader
+        cookie_data = extract_keys_from_json(read_cookie_json_file(job.account_file))
+        dtime = int(job.publish_date.timestamp()) if job.publish_date else 0
+        return BilibiliUploader(cookie_data, file, job.title, job.title, job.options.get("tid"), job.tags,
+                                dtime).upload
+    return None
+
+
+async def resume_main(argv):
+    parser = argparse.ArgumentParser(prog="cli_main.py resume",
+                                     description="Run the unfinished upload jobs recorded in db/jobs.db.")
+    parser.add_argument("-p", "--platforms", nargs="+", help="Only resume jobs of these platforms")
+    parser.add_argument("-m", "--max-attempts", type=int, default=JOB_MAX_ATTEMPTS,
+                        help="Skip failed jobs that were already tried this many times")
+    parser.add_argument("-l", "--list", action="store_true", help="Only list the unfinished jobs")
+    args = parser.parse_args(argv)
+
+    store = JobStore()
+    dedup = DedupIndex()
+    try:
+        store.requeue_interrupted()
+        jobs = store.unfinished(args.platforms, args.max_attempts)
+        print(f"{len(jobs)} unfinished jobs, all jobs: {store.stats()}")
+        if args.list:
+            for job in jobs:
+                print(f"#{job.id:<6}{job.name:<60}{job.state:<10}attempts={job.attempts} {job.error or ''}")
+            return
+
+        setups = {
+            SOCIAL_MEDIA_DOUYIN: douyin_setup,
+            SOCIAL_MEDIA_TENCENT: weixin_setup,
+            SOCIAL_MEDIA_TIKTOK: tiktok_setup,
+            SOCIAL_MEDIA_KUAISHOU: ks_setup,
+        }
+        valid_accounts = {}
+        scheduler = UploadScheduler(store=store, dedup=dedup, pacer=upload_pacer)
+        for job in jobs:
+            # 在校验 cookie(启动浏览器)之前先排除已发布过的视频
+            if job.fingerprint and dedup.is_published(job.fingerprint, job.platform, job.account):
+                print(f"skip #{job.id} {job.name}: already published")
+                store.mark_finished(job.id, STATE_SKIPPED, "already published")
+                continue
+            problems = preflight_check(job.file, job.platform)[1] if UPLOAD_PREFLIGHT else []
+            if problems:
+                print(f"skip #{job.id} {job.name}: {'; '.join(problems)}")
+                store.mark_finished(job.id, STATE_FAILED, "preflight: " + "; ".join(problems))
+                continue
+            account_key = (job.platform, job.account_file)
+            if account_key not in valid_accounts:
+                setup = setups.get(job.platform)
+                valid_accounts[account_key] = await setup(job.account_file, handle=False) if setup else True
+            if not valid_accounts[account_key]:
+                print(f"skip #{job.id} {job.name}: cookie of {job.account} is invalid, log in again first")
+                continue
+            run = build_upload_app(job)
+            if run is None:
+                print(f"skip #{job.id} {job.name}: {job.platform} jobs cannot be resumed from the cli")
+                continue
+            scheduler.add(job.platform, job.account, run, name=job.name, store_id=job.id, fingerprint=job.fingerprint)
+        await scheduler.run()
+        print(f"all jobs: {store.stats()}")
+    finally:
+        store.close()
+        dedup.close()
+
+
 async def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "check-accounts":
+        await check_accounts_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "resume":
+        await resume_main(sys.argv[2:])
+        return
+
     # 主解析器
     parser = argparse.ArgumentParser(description="Upload video to multiple social-media.")
     parser.add_argument("platform", metavar='platform', choices=get_supported_social_media(), help="Choose social-media platform: douyin tencent tiktok kuaishou")
@@ -42,6 +168,10 @@ async def main():
             action_parser.add_argument("-pt", "--publish_type", type=int, choices=[0, 1],
                                        help="0 for immediate, 1 for scheduled", default=0)
             action_parser.add_argument('-t', '--schedule', help='Schedule UTC time in %Y-%m-%d %H:%M format')
+            action_parser.add_argument('--headless', action='store_true',
+                                       help='Run the browser headless (default from UPLOAD_HEADLESS in conf.py)')
+            action_parser.add_argument('--force', action='store_true',
+                                       help='Upload even if this video was already published to the account')
         elif action == 'watch':
             # 为watch命令添加参数说明
             action_parser.add_argument("-d", "--days", type=int, 
@@ -59,9 +189,18 @@ async def main():
     
     # 定时上传视频
     python cli_main.py douyin test upload "path/to/video.mp4" -pt 1 -t "2024-6-14 12:00"
+
+    # 在没有图形界面的服务器上以无头模式上传
+    python cli_main.py douyin test upload "path/to/video.mp4" --headless
     
     # 查看已计划的视频
     python cli_main.py douyin test watch -d 7 -l 20
+
+    # 并发校验 cookies 目录下所有账号
+    python cli_main.py check-accounts -w 4
+
+    # 继续上次中断的批量上传任务
+    python cli_main.py resume
     '''
     
     parser.formatter_class = argparse.RawDescriptionHelpFormatter  # 使示例格式保持原样
@@ -90,34 +229,53 @@ async def main():
         elif args.platform == SOCIAL_MEDIA_KUAISHOU:
             await ks_setup(str(account_file), handle=True)
     elif args.action == 'upload':
-        title, tags = get_title_and_hashtags(args.video_file)
-        video_file = args.video_file
+        # 同一内容的视频已发布到该账号时直接跳过，不启动浏览器；--force 时不计算指纹也不记录
+        dedup = None if args.force else DedupIndex()
+        try:
+            fingerprint = file_fingerprint(args.video_file) if dedup is not None else None
+            if dedup is not None and dedup.is_published(fingerprint, args.platform, args.account_name):
+                print(f"{args.video_file} was already published to {args.platform}/{args.account_name}, "
+                      f"use --force to upload again")
+                return
+            # 时长、编码等不符合平台限制时不启动浏览器
+            problems = preflight_check(args.video_file, args.platform)[1] if UPLOAD_PREFLIGHT else []
+            if problems:
+                print(f"{args.video_file} cannot be uploaded to {args.platform}: {'; '.join(problems)}")
+                return
+            title, tags = get_title_and_hashtags(args.video_file)
+            video_file = args.video_file
 
-        if args.publish_type == 0:
-            print("Uploading immediately...")
-            publish_date = 0
-        else:
-            print("Scheduling videos...")
-            publish_date = parse_schedule(args.schedule)
+            if args.publish_type == 0:
+                print("Uploading immediately...")
+                publish_date = 0
+            else:
+                print("Scheduling videos...")
+                publish_date = parse_schedule(args.schedule)
 
-        if args.platform == SOCIAL_MEDIA_DOUYIN:
-            await douyin_setup(account_file, handle=False)
-            app = DouYinVideo(title, video_file, tags, publish_date, account_file)
-        elif args.platform == SOCIAL_MEDIA_TIKTOK:
-            await tiktok_setup(account_file, handle=True)
-            app = TiktokVideo(title, video_file, tags, publish_date, account_file)
-        elif args.platform == SOCIAL_MEDIA_TENCENT:
-            await weixin_setup(account_file, handle=True)
-            category = TencentZoneTypes.LIFESTYLE.value  # 标记原创需要否则不需要传
-            app = TencentVideo(title, video_file, tags, publish_date, account_file, category)
-        elif args.platform == SOCIAL_MEDIA_KUAISHOU:
-            await ks_setup(account_file, handle=True)
-            app = KSVideo(title, video_file, tags, publish_date, account_file)
-        else:
-            print("Wrong platform, please check your input")
-            exit()
+            if args.platform == SOCIAL_MEDIA_DOUYIN:
+                await douyin_setup(account_file, handle=False)
+                app = DouYinVideo(title, video_file, tags, publish_date, account_file)
+            elif args.platform == SOCIAL_MEDIA_TIKTOK:
+                await tiktok_setup(account_file, handle=True)
+                app = TiktokVideo(title, video_file, tags, publish_date, account_file)
+            elif args.platform == SOCIAL_MEDIA_TENCENT:
+                await weixin_setup(account_file, handle=True)
+                category = TencentZoneTypes.LIFESTYLE.value  # 标记原创需要否则不需要传
+                app = TencentVideo(title, video_file, tags, publish_date, account_file, category)
+            elif args.platform == SOCIAL_MEDIA_KUAISHOU:
+                await ks_setup(account_file, handle=True)
+                app = KSVideo(title, video_file, tags, publish_date, account_file)
+            else:
+                print("Wrong platform, please check your input")
+                exit()
 
-        await app.main()
+            if args.headless:
+                app.headless = True
+            if await app.main() and dedup is not None:
+                dedup.record(fingerprint, args.platform, args.account_name, video_file)
+        finally:
+            if dedup is not None:
+                dedup.close()
     elif args.action == 'watch':
         print(f"Watching scheduled videos for account {args.account_name} on platform {args.platform}")
         print(f"Showing videos scheduled for the next {args.days} days (limit: {args.limit})")
@@ -127,5 +285,13 @@ async def main():
         print(f"注意: watch功能尚未完全实现，此命令仅用于演示")
 
 
+async def run():
+    try:
+        await main()
+    finally:
+        # 关闭共享的 playwright driver 和常驻浏览器
+        await browser_pool.close()
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(run())
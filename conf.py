@@ -3,3 +3,107 @@ from pathlib import Path
 BASE_DIR = Path(__file__).parent.resolve()
 XHS_SERVER = "http://127.0.0.1:11901"
 LOCAL_CHROME_PATH = "C:/Program Files/Google/Chrome/Application/chrome.exe"   # change me necessary！ for example C:/Program Files/Google/Chrome/Application/chrome.exe
+BROWSER_POOL_SIZE = 1   # 每种浏览器配置(引擎+路径+参数)保持的常驻浏览器数量
+CACHE_DIR = BASE_DIR / "cache"
+COOKIE_CACHE_FILE = CACHE_DIR / "cookie_validity.json"
+COOKIE_CACHE_TTL = 30 * 60   # cookie 校验结果缓存时间(秒)，0 表示每次都重新校验
+ACCOUNT_CHECK_WORKERS = 4   # check-accounts 每个平台同时校验的账号数
+# 并发上传调度: 每个平台同时上传的任务数、每个账号同时上传的任务数
+PLATFORM_CONCURRENCY = {"douyin": 2, "tencent": 2, "kuaishou": 2, "tiktok": 2, "bilibili": 2, "xhs": 1}
+ACCOUNT_CONCURRENCY = 1
+# 持久化浏览器 profile: 每个账号使用独立的 user-data 目录，保留静态资源缓存和登录态
+PERSISTENT_PROFILE = False
+PROFILE_DIR = BASE_DIR / "profiles"
+# 在创作者页面拦截图片、字体、媒体和第三方埋点请求(开启后 playwright 会禁用该 context 的 HTTP 缓存)
+BLOCK_RESOURCES = False
+# 监听上传分片和提交请求，平台接收文件后立即重新检测页面状态，是否完成仍以页面为准
+UPLOAD_NETWORK_DETECT = True
+# 点击发布后等待发布成功的次数和每次等待页面跳转的时间(秒)，都未成功时本次上传失败
+PUBLISH_ATTEMPTS = 6
+PUBLISH_WAIT = 10
+# 上传时使用无头浏览器，视频号等需要 H.264 预览的平台请同时配置 LOCAL_CHROME_PATH
+UPLOAD_HEADLESS = False
+# 没有图形界面的 Linux 服务器上，有头模式自动使用 Xvfb 虚拟显示
+XVFB_FALLBACK = True
+XVFB_SCREEN = "1920x1080x24"
+# 上传任务持久化(SQLite WAL)，进程中断后可用 `cli_main.py resume` 继续未完成的任务
+JOB_DB_FILE = BASE_DIR / "db" / "jobs.db"
+JOB_STORE_FLUSH_INTERVAL = 1.0   # 非终态的状态变更最多缓存多久(秒)后批量写入
+JOB_MAX_ATTEMPTS = 3   # resume 时超过该尝试次数的失败任务不再重试
+# 视频内容指纹: 抽样模式只读取头、尾和若干等距块，适合 NFS 上的大文件；结果按 (设备, inode, 大小, mtime) 缓存
+FINGERPRINT_SAMPLED = False
+FINGERPRINT_SAMPLE_BLOCKS = 16
+FINGERPRINT_WORKERS = 4   # 同时计算指纹的文件数
+# 上传前预检(不启动浏览器): 解析 mp4 的时长、分辨率和编码，不符合平台限制的视频直接跳过
+UPLOAD_PREFLIGHT = True
+# 各平台的默认限制，以创作者中心的最新说明为准: 大小(MB)、时长(秒)、长边像素、视频编码，可选 max_bitrate_kbps
+PREFLIGHT_LIMITS = {
+    "douyin": {"max_size_mb": 16 * 1024, "max_duration": 60 * 60, "max_long_side": 4096,
+               "codecs": ["avc1", "avc3", "hvc1", "hev1"]},
+    "tencent": {"max_size_mb": 20 * 1024, "max_duration": 8 * 60 * 60, "max_long_side": 4096,
+                "codecs": ["avc1", "avc3", "hvc1", "hev1"]},
+    "kuaishou": {"max_size_mb": 4 * 1024, "max_duration": 60 * 60, "max_long_side": 4096,
+                 "codecs": ["avc1", "avc3", "hvc1", "hev1"]},
+    "tiktok": {"max_size_mb": 10 * 1024, "max_duration": 60 * 60, "max_long_side": 4096,
+               "codecs": ["avc1", "avc3", "hvc1", "hev1"]},
+    "bilibili": {"max_size_mb": 16 * 1024, "max_duration": 10 * 60 * 60, "max_long_side": 7680,
+                 "codecs": ["avc1", "avc3", "hvc1", "hev1", "av01"]},
+}
+# 上传前把 moov 位于文件末尾的 mp4 转换为 faststart 布局(moov 在前)，平台可以更快完成转码和预览，结果按视频指纹缓存
+UPLOAD_FASTSTART = False
+FASTSTART_CACHE_DIR = CACHE_DIR / "faststart"
+# 上传前用本地 ffmpeg 按平台转码(降低分辨率和码率上限)，减少上传的数据量；参数相同的平台共用同一个转码结果
+UPLOAD_TRANSCODE = False
+FFMPEG_PATH = "ffmpeg"
+TRANSCODE_WORKERS = 0   # 同时运行的 ffmpeg 进程数，0 表示 CPU 核数
+TRANSCODE_CACHE_DIR = CACHE_DIR / "transcode"
+TRANSCODE_CACHE_MAX_MB = 20 * 1024   # 转码缓存的总大小上限，超出后删除最久未使用的文件
+# 长边像素、视频码率上限(kbps)、视频编码器、音频码率(kbps)
+TRANSCODE_PROFILES = {
+    "douyin": {"max_long_side": 1920, "video_bitrate_kbps": 6000, "codec": "libx264", "audio_bitrate_kbps": 128},
+    "kuaishou": {"max_long_side": 1920, "video_bitrate_kbps": 6000, "codec": "libx264", "audio_bitrate_kbps": 128},
+    "tiktok": {"max_long_side": 1920, "video_bitrate_kbps": 6000, "codec": "libx264", "audio_bitrate_kbps": 128},
+    "tencent": {"max_long_side": 1920, "video_bitrate_kbps": 4000, "codec": "libx264", "audio_bitrate_kbps": 128},
+    "bilibili": {"max_long_side": 1920, "video_bitrate_kbps": 8000, "codec": "libx264", "audio_bitrate_kbps": 192},
+}
+# bilibili 分片上传: 并发分片数按吞吐量在范围内自适应调整(AIMD)，每条上传线路记住上次的最佳值作为起点
+BILIBILI_ADAPTIVE_UPLOAD = True   # False 时使用 biliup 自带的固定线程数上传
+BILIBILI_UPLOAD_TASKS = 3
+BILIBILI_UPLOAD_TASKS_MIN = 1
+BILIBILI_UPLOAD_TASKS_MAX = 16
+BILIBILI_LINE_STATS_FILE = CACHE_DIR / "bilibili_lines.json"
+# bilibili 断点续传: 记录已上传分片的清单，重试时只上传缺失的分片；超过有效期的清单作废(upos 会话同样会过期)
+BILIBILI_MANIFEST_DIR = CACHE_DIR / "bilibili_manifests"
+BILIBILI_MANIFEST_TTL = 24 * 60 * 60
+# bilibili 上传线路选择: 并发探测各线路的延迟和单连接速度，结果(含实际上传的分片速度)缓存一段时间内不再探测
+BILIBILI_LINE_TTL = 30 * 60
+BILIBILI_LINE_PROBE_BYTES = 512 * 1024
+# 小红书本地签名: 每个 a1 保持若干个已加载 xiaohongshu.com 的常驻页面，签名时直接调用 window._webmsxyw
+XHS_SIGN_PAGES = 2   # 每个 a1 的页面数，即同时进行的签名数
+XHS_SIGN_MAX_ACCOUNTS = 4   # 同时保留页面的 a1 数量，超出时关闭最久未使用的
+XHS_SIGN_PAGE_MAX_USES = 500   # 页面签名次数或存活时间(秒)超过上限后重新加载
+XHS_SIGN_PAGE_MAX_AGE = 30 * 60
+XHS_SIGN_RETRIES = 3
+XHS_SIGN_HEADLESS = True
+# 小红书签名服务(XHS_SERVER): 同时到达的同一 a1 的签名请求合并为一次调用；客户端保持长连接
+XHS_SIGN_BATCH_SIZE = 32
+XHS_SIGN_BATCH_WINDOW = 0.002   # 合并请求的等待时间(秒)
+XHS_SIGN_CONNECTIONS = 8   # 客户端连接池大小
+XHS_SIGN_TIMEOUT = 30
+# 小红书话题建议缓存: 按规范化后的标签缓存 get_suggest_topic 的结果
+XHS_TOPIC_CACHE_FILE = CACHE_DIR / "xhs_topics.json"
+XHS_TOPIC_CACHE_TTL = 7 * 24 * 60 * 60
+XHS_TOPIC_CACHE_EMPTY_TTL = 24 * 60 * 60   # 没有建议话题的标签较快过期
+XHS_TOPIC_CACHE_MAX = 5000   # 最多缓存的标签数，超出时删除最久未使用的
+XHS_TOPIC_WORKERS = 4   # 同时查询的标签数
+# 上传节奏(风控间隔): 每个账号、每个平台的令牌桶，interval 为补充一个令牌的秒数，burst 为最多可连续上传的次数
+UPLOAD_PACING = {
+    "xhs": {"account_interval": 30, "account_burst": 1, "platform_interval": 10, "platform_burst": 2},
+    "bilibili": {"account_interval": 30, "account_burst": 1, "platform_interval": 10, "platform_burst": 2},
+}
+# 发布时间规划: 每个账号每天的发布时间点、每日上限、两次发布的最小间隔(秒)和禁止发布的时间段
+# blackouts 中 ("HH:MM", "HH:MM") 为每天的时间段，(datetime, datetime) 为具体日期范围；平台配置覆盖 default
+PUBLISH_RULES = {
+    "default": {"daily_times": [16], "daily_cap": 1, "min_gap": 2 * 60 * 60, "blackouts": [("00:00", "06:00")]},
+}
+PUBLISH_LEDGER_FILE = BASE_DIR / "db" / "publish_slots.json"   # 未写入任务数据库的发布时间记录
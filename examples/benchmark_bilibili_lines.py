@@ -0,0 +1,48 @@
+import argparse
+import time
+
+import requests
+
+from conf import BILIBILI_LINE_STATS_FILE, BILIBILI_LINE_TTL
+from uploader.bilibili_uploader.upos import UPOS_LINES, LineStats, probe_lines, select_line
+
+
+def print_table(line_stats: LineStats, lines, probed):
+    print(f"{'line':<8}{'latency ms':>12}{'MB/s/conn':>12}{'tasks':>7}{'age s':>8}  source")
+    now = time.time()
+    for line in lines:
+        entry = line_stats.get(line)
+        latency = entry.get("latency")
+        throughput = entry.get("connection_throughput") or 0
+        age = now - entry["measured_at"] if "measured_at" in entry else None
+        print(f"{line:<8}{latency * 1000 if latency is not None else float('nan'):>12.0f}"
+              f"{throughput / 1024 / 1024:>12.2f}{entry.get('tasks', '-'):>7}"
+              f"{age if age is not None else float('nan'):>8.0f}  "
+              f"{'probed' if line in probed else 'cached'}/{entry.get('source', '-')}")
+
+
+def main(lines, stats_file, force, ttl):
+    line_stats = LineStats(stats_file)
+    session = requests.Session()
+    stale = lines if force else [line for line in lines if not line_stats.fresh(line, ttl)]
+
+    start = time.perf_counter()
+    probe_lines(session, stale, line_stats)
+    print(f"probed {len(stale)}/{len(lines)} lines in {time.perf_counter() - start:.2f}s")
+    print_table(line_stats, lines, set(stale))
+
+    # 紧接着的第二次上传应直接使用缓存，不再探测
+    start = time.perf_counter()
+    line = select_line(session, line_stats, lines, ttl)
+    print(f"select_line -> {line} in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="并发探测 bilibili 上传线路的延迟和单连接速度，并展示缓存的测量结果")
+    parser.add_argument("-l", "--lines", nargs="*", default=list(UPOS_LINES), choices=list(UPOS_LINES),
+                        help="要探测的线路")
+    parser.add_argument("--stats", default=BILIBILI_LINE_STATS_FILE, help="线路测量结果文件")
+    parser.add_argument("--ttl", type=float, default=BILIBILI_LINE_TTL, help="测量结果的有效期(秒)")
+    parser.add_argument("-f", "--force", action="store_true", help="忽略缓存，重新探测所有线路")
+    args = parser.parse_args()
+    main(args.lines, args.stats, args.force, args.ttl)
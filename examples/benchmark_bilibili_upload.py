@@ -0,0 +1,183 @@
+import argparse
+import json
+import shutil
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from uploader.bilibili_uploader.upos import UposUploader, LineStats, AdaptiveConcurrency, ManifestStore
+
+READ_SIZE = 64 * 1024
+
+
+class BandwidthLimit(object):
+    """Shared link capacity plus a cap per connection, like one slow TCP flow on a faster uplink."""
+
+    def __init__(self, total_mbps: float, connection_mbps: float):
+        self.total_rate = total_mbps * 1024 * 1024
+        self.connection_rate = connection_mbps * 1024 * 1024
+        self._lock = threading.Lock()
+        self._available_at = 0.0
+
+    def consume(self, size: int, connection_clock: float) -> float:
+        """Sleep until `size` bytes may have arrived, returns the new clock of the connection."""
+        now = time.monotonic()
+        with self._lock:
+            self._available_at = max(now, self._available_at) + size / self.total_rate
+            link_done = self._available_at
+        connection_done = max(now, connection_clock) + size / self.connection_rate
+        delay = max(link_done, connection_done) - now
+        if delay > 0:
+            time.sleep(delay)
+        return connection_done
+
+
+class StandInState(object):
+    """What the stand-in received, and an optional failure injected after `fail_after` chunks."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.puts = 0
+        self.received = set()
+        self.fail_after = None
+
+
+def make_handler(limit: BandwidthLimit, chunk_size: int, latency: float, state: StandInState):
+    class UposStandIn(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, payload: dict):
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            time.sleep(latency)
+            if urlparse(self.path).path == "/preupload":
+                host, port = self.server.server_address
+                self._reply({"OK": 1, "chunk_size": chunk_size, "auth": "bench", "biz_id": 1,
+                             "endpoint": f"//{host}:{port}", "upos_uri": "upos://ugcboss/bench.mp4"})
+            else:
+                self._reply({"OK": 1})
+
+        def do_POST(self):
+            time.sleep(latency)
+            length = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(length)
+            query = parse_qs(urlparse(self.path).query, keep_blank_values=True)
+            self._reply({"OK": 1, "upload_id": "bench"} if "uploads" in query else {"OK": 1})
+
+        def do_PUT(self):
+            time.sleep(latency)
+            remaining = int(self.headers.get("Content-Length") or 0)
+            clock = 0.0
+            while remaining:
+                data = self.rfile.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                clock = limit.consume(len(data), clock)
+            with state.lock:
+                if state.fail_after is not None and state.puts >= state.fail_after:
+                    failed = True
+                else:
+                    failed = False
+                    state.puts += 1
+                    state.received.add(parse_qs(urlparse(self.path).query)["chunk"][0])
+            if failed:
+                # 模拟上传中途断网
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._reply({"OK": 1})
+
+    return UposStandIn
+
+
+def run(file, base_url, stats, manifests, tasks=None, fixed=False):
+    uploader = UposUploader(requests.Session(), "bda2", tasks=tasks, line_stats=stats, manifests=manifests,
+                            preupload_url=f"{base_url}/preupload", scheme="http")
+    if fixed:
+        uploader.controller = AdaptiveConcurrency(tasks, tasks, tasks)
+    start = time.perf_counter()
+    uploader.upload(file)
+    elapsed = time.perf_counter() - start
+    return file.stat().st_size / 1024 / 1024 / elapsed, uploader.controller
+
+
+def resume_test(file, base_url, stats, manifests, state: StandInState, chunks: int):
+    """Fail the first upload halfway, then check the retry only sends the missing chunks."""
+    state.puts, state.received, state.fail_after = 0, set(), chunks // 2
+    uploader = UposUploader(requests.Session(), "bda2", tasks=4, line_stats=stats, manifests=manifests,
+                            preupload_url=f"{base_url}/preupload", scheme="http")
+    try:
+        uploader.upload(file)
+        print("resume: the first upload was expected to fail")
+        return
+    except requests.HTTPError:
+        pass
+    first = uploader.uploaded_chunks
+    state.fail_after = None
+    retry = UposUploader(requests.Session(), "bda2", tasks=4, line_stats=stats, manifests=manifests,
+                         preupload_url=f"{base_url}/preupload", scheme="http")
+    retry.upload(file)
+    ok = first + retry.uploaded_chunks == chunks and len(state.received) == chunks
+    print(f"resume: first attempt {first} chunks, retry {retry.uploaded_chunks} chunks, "
+          f"server received {len(state.received)}/{chunks} distinct chunks -> {'ok' if ok else 'FAILED'}")
+
+
+def main(size_mb, chunk_mb, total_mbps, connection_mbps, latency, fixed_tasks, adaptive_runs):
+    limit = BandwidthLimit(total_mbps, connection_mbps)
+    state = StandInState()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(limit, chunk_mb * 1024 * 1024, latency, state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    workdir = Path(tempfile.mkdtemp(prefix="bili_bench_"))
+    file = workdir / "bench.mp4"
+    with open(file, "wb") as f:
+        f.truncate(size_mb * 1024 * 1024)
+    stats = LineStats(workdir / "lines.json")
+    manifests = ManifestStore(workdir / "manifests")
+    print(f"file={size_mb}MB chunk={chunk_mb}MB link={total_mbps}MB/s per-connection={connection_mbps}MB/s "
+          f"latency={latency * 1000:.0f}ms")
+    print(f"{'mode':<22}{'MB/s':>8}  tasks")
+    try:
+        for tasks in fixed_tasks:
+            speed, controller = run(file, base_url, stats, manifests, tasks, fixed=True)
+            print(f"{f'fixed {tasks}':<22}{speed:>8.2f}  {tasks}")
+        # 第一次从 1 个并发开始探测，之后的上传从该线路记录的最佳值开始
+        for index in range(adaptive_runs):
+            speed, controller = run(file, base_url, stats, manifests, tasks=1 if index == 0 else None)
+            limits = [limit for limit, _ in controller.history]
+            print(f"{f'adaptive run {index + 1}':<22}{speed:>8.2f}  {limits} -> {controller.best_limit}")
+        resume_test(file, base_url, stats, manifests, state, -(-size_mb // chunk_mb))
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="在本地模拟的 upos 服务上对比固定并发和自适应并发的分片上传速度")
+    parser.add_argument("-s", "--size", type=int, default=256, help="测试文件大小(MB)")
+    parser.add_argument("-c", "--chunk", type=int, default=4, help="分片大小(MB)")
+    parser.add_argument("--total", type=float, default=40, help="模拟的总带宽(MB/s)")
+    parser.add_argument("--per-connection", type=float, default=6, help="模拟的单连接带宽(MB/s)")
+    parser.add_argument("--latency", type=float, default=0.03, help="每个请求的延迟(秒)")
+    parser.add_argument("--fixed", type=int, nargs="*", default=[1, 3, 8], help="对比的固定并发数")
+    parser.add_argument("--runs", type=int, default=2, help="自适应上传的次数")
+    args = parser.parse_args()
+    main(args.size, args.chunk, args.total, args.per_connection, args.latency, args.fixed, args.runs)
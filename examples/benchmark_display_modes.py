@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from pathlib import Path
+
+from playwright.async_api import async_playwright
+
+from conf import BASE_DIR, LOCAL_CHROME_PATH
+from utils.display import upload_launch_options, ensure_display, has_display
+
+# 模拟创作者页面的上传预览：选择文件后用 <video> 解码播放
+PREVIEW_HTML = """
+<input type="file" id="file" accept="video/*">
+<video id="preview" muted autoplay loop width="640"></video>
+<script>
+document.getElementById('file').addEventListener('change', (event) => {
+    const video = document.getElementById('preview');
+    video.src = URL.createObjectURL(event.target.files[0]);
+    video.play();
+});
+</script>
+"""
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def descendants(pid: int) -> list:
+    """All live descendant pids of `pid`, read from /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        ppid = int(stat[stat.rindex(")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    result, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            result.append(child)
+            stack.append(child)
+    return result
+
+
+def process_usage(pids) -> tuple:
+    """:returns: (cpu seconds, rss bytes) summed over `pids`"""
+    cpu, rss = 0.0, 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "r") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # utime, stime, rss(pages) 分别是第 14、15、24 个字段
+        cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        rss += int(fields[21]) * PAGE_SIZE
+    return cpu, rss
+
+
+async def run_once(playwright, launch_options, video_file, seconds):
+    """Launch a browser, preview the video for `seconds` and return (cpu seconds, peak rss bytes)."""
+    browser = await playwright.chromium.launch(**launch_options)
+    peak_rss, cpu = 0, 0.0
+    try:
+        page = await browser.new_page()
+        await page.set_content(PREVIEW_HTML)
+        await page.locator("#file").set_input_files(video_file)
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            cpu, rss = process_usage(descendants(os.getpid()))
+            peak_rss = max(peak_rss, rss)
+            await asyncio.sleep(0.2)
+    finally:
+        await browser.close()
+    return cpu, peak_rss
+
+
+async def main(video_file, runs, seconds, modes):
+    executable_path = LOCAL_CHROME_PATH or None
+    print(f"video={video_file} runs={runs} seconds={seconds} chrome={executable_path or 'bundled chromium'}")
+    print(f"{'mode':<10}{'cpu(s)':>10}{'cpu p95':>10}{'rss(MB)':>10}{'rss max':>10}")
+    # Xvfb 要在 playwright driver 启动前创建，启动后 os.environ 里的 DISPLAY 会指向它，先记下真实的显示
+    real_display = os.environ.get("DISPLAY")
+    headed_available = has_display()
+    xvfb_available = "xvfb" in modes and ensure_display(force_xvfb=True)
+    async with async_playwright() as playwright:
+        # driver 进程本身的开销在每种模式下都一样，先记下基线
+        baseline_cpu, baseline_rss = process_usage(descendants(os.getpid()))
+        for mode in modes:
+            if mode == "headed" and not headed_available:
+                print(f"{mode:<10}skipped, no DISPLAY")
+                continue
+            if mode == "xvfb" and not xvfb_available:
+                print(f"{mode:<10}skipped, Xvfb not available")
+                continue
+            launch_options = upload_launch_options(mode == "headless", executable_path=executable_path)
+            if mode == "headed" and real_display:
+                launch_options["env"] = {**os.environ, "DISPLAY": real_display}
+            cpu_samples, rss_samples = [], []
+            for _ in range(runs):
+                cpu, rss = await run_once(playwright, launch_options, video_file, seconds)
+                cpu_samples.append(cpu - baseline_cpu)
+                rss_samples.append((rss - baseline_rss) / 1024 / 1024)
+                # 每次运行后 driver 的 cpu 会继续累积，重新取基线
+                baseline_cpu, baseline_rss = process_usage(descendants(os.getpid()))
+            cpu_samples.sort()
+            p95 = cpu_samples[min(len(cpu_samples) - 1, int(len(cpu_samples) * 0.95))]
+            print(f"{mode:<10}{statistics.mean(cpu_samples):>10.2f}{p95:>10.2f}"
+                  f"{statistics.mean(rss_samples):>10.1f}{max(rss_samples):>10.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="对比有头、Xvfb 和无头模式下每次上传预览的 CPU 和内存占用(仅 Linux)")
+    parser.add_argument("video", nargs="?", default=next(Path(BASE_DIR / "videos").glob("*.mp4"), None),
+                        help="用于预览的视频文件，默认取 videos 目录下第一个 mp4")
+    parser.add_argument("-n", "--runs", type=int, default=3, help="每种模式运行的次数")
+    parser.add_argument("-s", "--seconds", type=float, default=15, help="每次预览视频的时长")
+    parser.add_argument("-m", "--modes", nargs="+", default=["headed", "xvfb", "headless"],
+                        choices=["headed", "xvfb", "headless"])
+    args = parser.parse_args()
+    if not args.video:
+        parser.error("no video file given and videos/ has no mp4")
+    asyncio.run(main(str(args.video), args.runs, args.seconds, args.modes))
@@ -0,0 +1,75 @@
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from conf import BASE_DIR, FINGERPRINT_WORKERS
+from utils.fingerprint import hash_full, hash_sampled, fingerprint_files, get_fingerprint_cache
+
+
+def collect_files(paths) -> list:
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.glob("*.mp4")))
+        elif path.is_file():
+            files.append(path)
+    return files
+
+
+def generate_file(size_mb: int) -> Path:
+    """A throwaway file of random data, used when no video is given."""
+    f = tempfile.NamedTemporaryFile(prefix="fingerprint_bench_", suffix=".mp4", delete=False)
+    with f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size_mb):
+            f.write(block)
+    return Path(f.name)
+
+
+def measure(name, total_bytes, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    speed = total_bytes / 1024 / 1024 / elapsed if elapsed > 0 else float("inf")
+    print(f"{name:<24}{elapsed * 1000:>12.1f}{speed:>14.1f}")
+
+
+def main(files, workers):
+    total_bytes = sum(os.path.getsize(file) for file in files)
+    print(f"{len(files)} files, {total_bytes / 1024 / 1024:.1f}MB, workers={workers}")
+    # 第一次完整读取之后文件位于系统页缓存中，NFS 上的真实冷读速度以第一行为准
+    print(f"{'mode':<24}{'ms':>12}{'MB/s':>14}")
+    measure("sha256 sequential", total_bytes, lambda: [hash_full(file) for file in files])
+    measure("sha256 thread pool", total_bytes, lambda: fingerprint_files(files, workers=workers, cache=False))
+    measure("sampled sequential", total_bytes, lambda: [hash_sampled(file) for file in files])
+    measure("sampled thread pool", total_bytes,
+            lambda: fingerprint_files(files, sampled=True, workers=workers, cache=False))
+    # 先填充缓存，再测量 stat 未变化时的查询速度
+    fingerprint_files(files, workers=workers)
+    cache = get_fingerprint_cache()
+    hits = cache.hits
+    measure("cached (stat only)", total_bytes, lambda: fingerprint_files(files, workers=workers))
+    print(f"cache hits: {cache.hits - hits}/{len(files)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="测试视频指纹计算的吞吐量(MB/s)")
+    parser.add_argument("paths", nargs="*", default=[BASE_DIR / "videos"], help="视频文件或目录，默认 videos 目录")
+    parser.add_argument("-w", "--workers", type=int, default=FINGERPRINT_WORKERS, help="线程池大小")
+    parser.add_argument("-g", "--generate", type=int, metavar="MB",
+                        help="没有视频时生成一个指定大小的临时文件用于测试")
+    args = parser.parse_args()
+    files = collect_files(args.paths)
+    generated = None
+    if args.generate:
+        generated = generate_file(args.generate)
+        files.append(generated)
+    if not files:
+        parser.error("no video files found, pass paths or --generate MB")
+    try:
+        main(files, args.workers)
+    finally:
+        if generated is not None:
+            generated.unlink()
@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from playwright.async_api import async_playwright
+
+from utils.base_social_media import STEALTH_JS_PATH, get_stealth_script
+
+
+async def create_contexts(browser, count, inject):
+    """Create `count` contexts with one page each and return per-context latencies in ms."""
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        context = await browser.new_context()
+        await inject(context)
+        page = await context.new_page()
+        await page.goto("about:blank")
+        latencies.append((time.perf_counter() - start) * 1000)
+        await context.close()
+    return latencies
+
+
+async def main(count):
+    script, digest = get_stealth_script()
+    modes = {
+        "none": lambda context: asyncio.sleep(0),
+        "path": lambda context: context.add_init_script(path=STEALTH_JS_PATH),
+        "memory": lambda context: context.add_init_script(script=script),
+    }
+    print(f"stealth.min.js sha256={digest[:16]} size={len(script) / 1024:.1f}KB contexts={count}")
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True)
+        # 预热，避免首个 context 的冷启动影响结果
+        await create_contexts(browser, 3, modes["none"])
+        print(f"{'mode':<8}{'mean(ms)':>10}{'p50(ms)':>10}{'p95(ms)':>10}")
+        for name, inject in modes.items():
+            latencies = sorted(await create_contexts(browser, count, inject))
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print(f"{name:<8}{statistics.mean(latencies):>10.2f}{statistics.median(latencies):>10.2f}{p95:>10.2f}")
+        await browser.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="对比 stealth.min.js 从磁盘注入与从内存注入时创建 context 的耗时")
+    parser.add_argument("-n", "--count", type=int, default=50, help="每种模式创建的 context 数量")
+    args = parser.parse_args()
+    asyncio.run(main(args.count))
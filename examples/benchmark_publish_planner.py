@@ -0,0 +1,95 @@
+import argparse
+import bisect
+import random
+import time
+from datetime import datetime, timedelta, date
+
+from utils.publish_planner import PublishPlanner, in_daily_window
+
+PLATFORM = "douyin"
+
+
+def make_rules(daily_cap, min_gap_hours, start):
+    return {"default": {
+        "daily_times": ["08:00", "10:00", "12:00", "14:00", "16:30", "19:00", "21:00", "23:30"],
+        "daily_cap": daily_cap,
+        "min_gap": min_gap_hours * 3600,
+        # 每天凌晨不发布，另外第 10~12 天整体停发
+        "blackouts": [("23:00", "07:30"), (start + timedelta(days=10), start + timedelta(days=12))],
+    }}
+
+
+def verify(planner, rules, planned: dict) -> list:
+    """Check the planned slots of every account against the rules, returns the violations."""
+    problems = []
+    rule = rules["default"]
+    absolute = [(begin, end) for begin, end in rule["blackouts"] if isinstance(begin, datetime)]
+    for account, timestamps in planned.items():
+        calendar = planner.calendar(PLATFORM, account)
+        taken = calendar.taken
+        new_per_day = {}
+        for timestamp in timestamps:
+            index = bisect.bisect_left(taken, timestamp)
+            neighbours = taken[max(0, index - 1):index] + taken[index + 1:index + 2]
+            if any(abs(timestamp - other) < max(rule["min_gap"], 1) for other in neighbours):
+                problems.append(f"{account}: {datetime.fromtimestamp(timestamp)} too close")
+            moment = datetime.fromtimestamp(timestamp)
+            seconds = moment.hour * 3600 + moment.minute * 60
+            if in_daily_window(seconds, rule["blackouts"][0]) or any(begin <= moment < end for begin, end in absolute):
+                problems.append(f"{account}: {moment} in blackout")
+            day = moment.date().toordinal()
+            new_per_day[day] = new_per_day.get(day, 0) + 1
+        # 预先存在的预约不受规则约束，只检查新安排的时间是否让当天超过上限
+        for day, count in new_per_day.items():
+            if calendar.per_day[day] > rule["daily_cap"] and count:
+                problems.append(f"{account}: {calendar.per_day[day]} on {date.fromordinal(day)}")
+    return problems
+
+
+def main(videos, accounts, booked, daily_cap, min_gap_hours, seed):
+    random.seed(seed)
+    start = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    rules = make_rules(daily_cap, min_gap_hours, start)
+    names = [f"account{index}" for index in range(accounts)]
+    planner = PublishPlanner(rules=rules, start=start)
+
+    # 已有的预约: 随机分布在前 60 天的整点/半点
+    begin = time.perf_counter()
+    for name in names:
+        slots = {start.timestamp() + random.randrange(60 * 48) * 1800 for _ in range(booked // accounts)}
+        planner.calendar(PLATFORM, name).book(slots)
+    load = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    result = planner.plan_accounts(PLATFORM, names, videos)
+    elapsed = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    single = planner.plan(PLATFORM, names[0], 1000)
+    single_elapsed = time.perf_counter() - begin
+
+    planned = {}
+    for account, moment in result:
+        planned.setdefault(account, []).append(moment.timestamp())
+    planned[names[0]] += [moment.timestamp() for moment in single]
+    problems = verify(planner, rules, planned)
+    print(f"{videos} videos over {accounts} accounts, {booked} pre-booked slots, "
+          f"daily cap {daily_cap}, min gap {min_gap_hours}h")
+    print(f"{'step':<28}{'seconds':>10}{'slots/s':>12}")
+    print(f"{'load bookings':<28}{load:>10.3f}{booked / load if load else 0:>12.0f}")
+    print(f"{'plan_accounts (heap)':<28}{elapsed:>10.3f}{videos / elapsed:>12.0f}")
+    print(f"{'plan one account x1000':<28}{single_elapsed:>10.3f}{1000 / single_elapsed:>12.0f}")
+    print(f"schedule {result[0][1]} -> {result[-1][1]}, last single-account slot {single[-1]}")
+    print(f"constraint violations: {len(problems)}" + (f", e.g. {problems[:3]}" if problems else ""))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="发布时间规划器的性能测试，并校验结果满足每日上限、最小间隔和禁止时段")
+    parser.add_argument("-n", "--videos", type=int, default=100000, help="要安排的视频数")
+    parser.add_argument("-a", "--accounts", type=int, default=200, help="账号数")
+    parser.add_argument("-b", "--booked", type=int, default=20000, help="已有的预约数")
+    parser.add_argument("--cap", type=int, default=3, help="每个账号每天的发布上限")
+    parser.add_argument("--gap", type=int, default=2, help="最小间隔(小时)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    main(args.videos, args.accounts, args.booked, args.cap, args.gap, args.seed)
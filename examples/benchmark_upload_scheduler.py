@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from utils.upload_scheduler import UploadScheduler
+
+PLATFORM = "douyin"
+
+
+def check_rotation(order: list, accounts: list) -> list:
+    """Every account has to start once before any account starts a second time."""
+    first = order[:len(accounts)]
+    return [account for account in accounts if account not in first]
+
+
+async def run(jobs_per_account: dict, platform_limit, account_limit, duration):
+    scheduler = UploadScheduler(platform_limits={PLATFORM: platform_limit}, account_limit=account_limit)
+    order = []
+
+    def job(account, index):
+        async def upload():
+            order.append(account)
+            # 模拟上传耗时，带一点抖动
+            await asyncio.sleep(duration * random.uniform(0.8, 1.2))
+            return True
+        return upload
+
+    for account, count in jobs_per_account.items():
+        for index in range(count):
+            scheduler.add(PLATFORM, account, job(account, index), name=f"{account}{index}")
+    start = time.perf_counter()
+    await scheduler.run()
+    return order, time.perf_counter() - start
+
+
+def main(accounts, jobs, platform_limit, account_limit, duration, seed):
+    random.seed(seed)
+    # 前两个账号有很多视频，其余账号各一个，检查后面的账号不会排在它们全部完成之后
+    jobs_per_account = {f"account{index}": jobs if index < 2 else 1 for index in range(accounts)}
+    order, elapsed = asyncio.run(run(jobs_per_account, platform_limit, account_limit, duration))
+    missing = check_rotation(order, list(jobs_per_account))
+    print(f"{len(order)} jobs over {accounts} accounts, platform limit {platform_limit}, "
+          f"account limit {account_limit}: {elapsed:.2f}s")
+    print("start order " + " ".join(order[:2 * accounts]) + (" ..." if len(order) > 2 * accounts else ""))
+    print(f"accounts missing from the first rotation: {missing or 'none'}")
+    return 1 if missing else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="检查上传调度器在账号之间轮转是否公平，并输出总耗时")
+    parser.add_argument("-a", "--accounts", type=int, default=3, help="账号数")
+    parser.add_argument("-n", "--jobs", type=int, default=6, help="前两个账号各自的视频数")
+    parser.add_argument("--platform-limit", type=int, default=2, help="平台并发上限")
+    parser.add_argument("--account-limit", type=int, default=1, help="每个账号的并发上限")
+    parser.add_argument("-d", "--duration", type=float, default=0.05, help="模拟的单次上传耗时(秒)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sys.exit(main(args.accounts, args.jobs, args.platform_limit, args.account_limit, args.duration, args.seed))
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from conf import XHS_SERVER
+from uploader.xhs_uploader.main import sign, sign_session
+from uploader.xhs_uploader.sign_server import SignServer, SignMetrics
+
+
+def start_local_server():
+    """Run the sign server in a background thread on the XHS_SERVER port."""
+    address = urlparse(XHS_SERVER)
+    server = SignServer()
+    threading.Thread(target=asyncio.run, args=(server.serve(address.hostname, address.port),), daemon=True).start()
+    for _ in range(100):
+        try:
+            sign_session().get(f"{XHS_SERVER}/stats", timeout=1)
+            return
+        except Exception:
+            time.sleep(0.1)
+    raise RuntimeError(f"sign server did not start on {XHS_SERVER}")
+
+
+def main(total, concurrency, a1, serve):
+    if serve:
+        start_local_server()
+    # 预热: 第一次签名会加载页面，不计入结果
+    sign("/api/sns/web/v1/homefeed", {"warmup": True}, a1=a1)
+
+    def one(index):
+        start = time.perf_counter()
+        sign(f"/api/sns/web/v1/feed?i={index}", {"index": index}, a1=a1)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    print(f"{total} signatures, concurrency {concurrency}: {total / elapsed:.1f} signs/s")
+    print("client latency " + "  ".join(f"p{percent}={SignMetrics.percentile(latencies, percent) * 1000:.2f}ms"
+                                        for percent in (50, 90, 99)))
+    print("server stats " + json.dumps(sign_session().get(f"{XHS_SERVER}/stats", timeout=5).json(), indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="对 XHS_SERVER 签名服务做压力测试，输出每秒签名数和延迟分位数")
+    parser.add_argument("-n", "--total", type=int, default=2000, help="签名请求总数")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="并发请求数")
+    parser.add_argument("--a1", default="", help="签名使用的 a1 cookie")
+    parser.add_argument("--serve", action="store_true", help="在本进程内启动签名服务")
+    args = parser.parse_args()
+    main(args.total, args.concurrency, args.a1, args.serve)
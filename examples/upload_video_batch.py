@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import configparser
+from pathlib import Path
+
+from conf import BASE_DIR
+from uploader.bilibili_uploader.main import read_cookie_json_file, extract_keys_from_json, BilibiliUploader
+from uploader.douyin_uploader.main import DouYinVideo
+from uploader.ks_uploader.main import KSVideo
+from uploader.tencent_uploader.main import TencentVideo
+from uploader.tk_uploader.main_chrome import TiktokVideo
+from utils.account_health import find_account_files
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, \
+    SOCIAL_MEDIA_KUAISHOU, SOCIAL_MEDIA_BILIBILI, SOCIAL_MEDIA_XHS
+from utils.browser_pool import browser_pool
+from utils.constant import TencentZoneTypes, VideoZoneTypes
+from utils.dedup import DedupIndex
+from utils.files_times import get_title_and_hashtags
+from utils.fingerprint import fingerprint_files
+from utils.job_store import JobStore
+from utils.pacing import upload_pacer
+from utils.preflight import preflight_files
+from utils.publish_planner import PublishPlanner
+from utils.upload_scheduler import UploadScheduler
+
+
+def job_row(platform, account_name, account_file, file, title, tags, publish_date, **options):
+    return {"platform": platform, "account": account_name, "account_file": account_file, "file": file,
+            "title": title, "tags": tags, "publish_date": publish_date, "options": options}
+
+
+def build_jobs(files, platforms, planner: PublishPlanner, dedup: DedupIndex):
+    """
+    Create an upload for every video and every stored account of the chosen platforms,
+    leaving out the videos already published to the account.
+    :returns: list of (job_store row, run callable)
+    """
+    jobs = []
+    videos = [(file, *get_title_and_hashtags(str(file))) for file in files]
+    # 每个视频只计算一次指纹，多个账号共用
+    fingerprints = fingerprint_files(files)
+
+    # 预检只和平台有关，每个平台解析一次
+    accepted = {platform: set(preflight_files(files, platform)) for platform in platforms}
+
+    def schedule(platform, account_name):
+        # 已发布到该账号的视频不再安排，避免占用发布时间
+        published = dedup.published(platform, account_name)
+        account_videos = []
+        for video in videos:
+            if video[0] not in accepted[platform]:
+                continue
+            if fingerprints[video[0]] in published:
+                print(f"跳过已发布的视频 {platform}/{account_name}/{video[0].name}")
+                continue
+            account_videos.append(video)
+        # 每个账号的视频排入该账号最早的空闲发布时间，已有任务占用的时间不再使用
+        return zip(account_videos, planner.plan(platform, account_name, len(account_videos)))
+
+    for platform, account_name, account_file in find_account_files(platforms=platforms):
+        for (file, title, tags), publish_date in schedule(platform, account_name):
+            options = {}
+            if platform == SOCIAL_MEDIA_DOUYIN:
+                app = DouYinVideo(title, file, tags, publish_date, account_file)
+            elif platform == SOCIAL_MEDIA_TENCENT:
+                options["category"] = TencentZoneTypes.LIFESTYLE.value
+                app = TencentVideo(title, file, tags, publish_date, account_file, options["category"])
+            elif platform == SOCIAL_MEDIA_TIKTOK:
+                app = TiktokVideo(title, file, tags, publish_date, account_file)
+            elif platform == SOCIAL_MEDIA_KUAISHOU:
+                app = KSVideo(title, file, tags, publish_date, account_file)
+            else:
+                continue
+            jobs.append((job_row(platform, account_name, account_file, file, title, tags, publish_date, **options),
+                         app.main))
+
+    # bilibili 使用 biliup 导出的 cookies/bilibili_<account>.json
+    if SOCIAL_MEDIA_BILIBILI in platforms:
+        for account_file in sorted(Path(BASE_DIR / "cookies").glob(f"{SOCIAL_MEDIA_BILIBILI}_*.json")):
+            cookie_data = extract_keys_from_json(read_cookie_json_file(account_file))
+            # 去重和风控间隔按 B 站用户 id 区分账号，和 cookie 文件名无关
+            account_name = cookie_data["DedeUserID"]
+            for (file, title, tags), publish_date in schedule(SOCIAL_MEDIA_BILIBILI, account_name):
+                app = BilibiliUploader(cookie_data, file, title, title, VideoZoneTypes.LIFE_DAILY.value, tags,
+                                       int(publish_date.timestamp()))
+                jobs.append((job_row(SOCIAL_MEDIA_BILIBILI, account_name, account_file, file, title, tags,
+                                     publish_date, tid=VideoZoneTypes.LIFE_DAILY.value), app.upload))
+
+    # 小红书使用 accounts.ini 中的每个账号
+    if SOCIAL_MEDIA_XHS in platforms:
+        from xhs import XhsClient
+        from uploader.xhs_uploader.main import sign_local
+
+        config = configparser.RawConfigParser()
+        config.read(Path(BASE_DIR / "uploader" / "xhs_uploader" / "accounts.ini"))
+        for account_name in config.sections():
+            xhs_client = XhsClient(config[account_name]['cookies'], sign=sign_local, timeout=60)
+            for (file, title, tags), publish_date in schedule(SOCIAL_MEDIA_XHS, account_name):
+                def create_note(file=file, title=title, tags=tags, publish_date=publish_date, client=xhs_client):
+                    return client.create_video_note(title=title[:20], video_path=str(file),
+                                                    desc=title + ' ' + ' '.join(['#' + tag for tag in tags]),
+                                                    is_private=False,
+                                                    post_time=publish_date.strftime("%Y-%m-%d %H:%M:%S"))
+                jobs.append((job_row(SOCIAL_MEDIA_XHS, account_name, None, file, title, tags, publish_date),
+                             create_note))
+
+    for row, _ in jobs:
+        row["fingerprint"] = fingerprints[row["file"]]
+    return jobs
+
+
+async def main(platforms):
+    files = list(Path(BASE_DIR / "videos").glob("*.mp4"))
+    # 任务先写入 db/jobs.db，进程中断后用 `python cli_main.py resume` 继续未完成的任务
+    store = JobStore()
+    dedup = DedupIndex()
+    planner = PublishPlanner()
+    planner.load_jobs(store)
+    jobs = build_jobs(files, platforms, planner, dedup)
+    store_ids = store.add_jobs([row for row, _ in jobs])
+    scheduler = UploadScheduler(store=store, dedup=dedup, pacer=upload_pacer)
+    for store_id, (row, run) in zip(store_ids, jobs):
+        name = f"{row['platform']}/{row['account']}/{row['file'].name}"
+        scheduler.add(row["platform"], row["account"], run, name=name, store_id=store_id,
+                      fingerprint=row["fingerprint"])
+    print(f"共 {len(scheduler.jobs)} 个上传任务")
+    try:
+        jobs = await scheduler.run()
+    finally:
+        store.close()
+        dedup.close()
+        await browser_pool.close()
+    for job in jobs:
+        duration = f"{job.duration:.1f}s" if job.duration is not None else "-"
+        print(f"{job.name}: {job.state} {duration}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="多平台多账号并发上传 videos 目录下的视频")
+    parser.add_argument("-p", "--platforms", nargs="+",
+                        default=[SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_KUAISHOU],
+                        choices=[SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_KUAISHOU,
+                                 SOCIAL_MEDIA_BILIBILI, SOCIAL_MEDIA_XHS])
+    args = parser.parse_args()
+    asyncio.run(main(args.platforms))
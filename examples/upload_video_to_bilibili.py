@@ -1,10 +1,14 @@
-import time
+import asyncio
 from pathlib import Path
 
 from uploader.bilibili_uploader.main import read_cookie_json_file, extract_keys_from_json, random_emoji, BilibiliUploader
 from conf import BASE_DIR
+from utils.base_social_media import SOCIAL_MEDIA_BILIBILI
 from utils.constant import VideoZoneTypes
+from utils.dedup import DedupIndex
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
+from utils.pacing import upload_pacer
+from utils.preflight import preflight_files
 
 if __name__ == '__main__':
     filepath = Path(BASE_DIR) / "videos"
@@ -15,28 +19,43 @@ if __name__ == '__main__':
         exit()
     cookie_data = read_cookie_json_file(account_file)
     cookie_data = extract_keys_from_json(cookie_data)
+    # 去重和风控间隔按 B 站用户 id 区分账号，和 cookie 文件名无关
+    account_id = cookie_data["DedeUserID"]
 
     tid = VideoZoneTypes.SPORTS_FOOTBALL.value  # 设置分区id
     # 获取视频目录
     folder_path = Path(filepath)
     # 获取文件夹中的所有文件
     files = list(folder_path.glob("*.mp4"))
+    # 跳过不符合平台限制的视频和已经发布到该账号的视频
+    files = preflight_files(files, SOCIAL_MEDIA_BILIBILI)
+    dedup = DedupIndex()
+    pending = dedup.unpublished(files, SOCIAL_MEDIA_BILIBILI, account_id)
+    files = list(pending)
     file_num = len(files)
     timestamps = generate_schedule_time_next_day(file_num, 1, daily_times=[16], timestamps=True)
 
-    for index, file in enumerate(files):
-        title, tags = get_title_and_hashtags(str(file))
-        # just avoid error, bilibili don't allow same title of video.
-        title += random_emoji()
-        tags_str = ','.join([tag for tag in tags])
-        # 打印视频文件名、标题和 hashtag
-        print(f"视频文件名：{file}")
-        print(f"标题：{title}")
-        print(f"Hashtag：{tags}")
-        # I set desc same as title, do what u like.
-        desc = title
-        bili_uploader = BilibiliUploader(cookie_data, file, title, desc, tid, tags, timestamps[index])
-        bili_uploader.upload()
+    async def main():
+        for index, file in enumerate(files):
+            title, tags = get_title_and_hashtags(str(file))
+            # just avoid error, bilibili don't allow same title of video.
+            title += random_emoji()
+            tags_str = ','.join([tag for tag in tags])
+            # 打印视频文件名、标题和 hashtag
+            print(f"视频文件名：{file}")
+            print(f"标题：{title}")
+            print(f"Hashtag：{tags}")
+            # I set desc same as title, do what u like.
+            desc = title
+            bili_uploader = BilibiliUploader(cookie_data, file, title, desc, tid, tags, timestamps[index])
+            # life is beautiful don't so rush. be kind be patience
+            # 两次上传之间的间隔由 conf.UPLOAD_PACING 控制，等待时不阻塞线程
+            await upload_pacer.acquire(SOCIAL_MEDIA_BILIBILI, account_id)
+            try:
+                uploaded = await asyncio.to_thread(bili_uploader.upload)
+            finally:
+                upload_pacer.release(SOCIAL_MEDIA_BILIBILI, account_id)
+            if uploaded:
+                dedup.record(pending[file], SOCIAL_MEDIA_BILIBILI, account_id, file)
 
-        # life is beautiful don't so rush. be kind be patience
-        time.sleep(30)
+    asyncio.run(main())
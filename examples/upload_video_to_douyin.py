@@ -4,7 +4,54 @@ from pathlib import Path
 
 from conf import BASE_DIR
 from uploader.douyin_uploader.main import douyin_setup, DouYinVideo
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN
+from utils.browser_pool import browser_pool
+from utils.dedup import DedupIndex
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
+from utils.preflight import preflight_files
+from utils.upload_scheduler import UploadScheduler
+
+
+async def main(account_name, account_file, files):
+    # 时长、编码等不符合平台限制的视频和已经发布到该账号的视频都在启动浏览器之前跳过
+    files = preflight_files(files, SOCIAL_MEDIA_DOUYIN)
+    dedup = DedupIndex()
+    pending = dedup.unpublished(files, SOCIAL_MEDIA_DOUYIN, account_name)
+    files = list(pending)
+    if not files:
+        print("没有需要上传的视频")
+        return
+    file_num = len(files)
+    publish_datetimes = generate_schedule_time_next_day(file_num, 1, daily_times=[16])
+    cookie_setup = await douyin_setup(str(account_file), handle=True)
+
+    if not cookie_setup:
+        print("Cookie验证失败，请先登录")
+        return
+
+    scheduler = UploadScheduler(dedup=dedup)
+    for index, file in enumerate(files):
+        title, tags = get_title_and_hashtags(str(file))
+        thumbnail_path = file.with_suffix('.png')
+        # 打印视频文件名、标题和 hashtag
+        print(f"正在处理第 {index+1}/{file_num} 个视频")
+        print(f"视频文件名：{file}")
+        print(f"标题：{title}")
+        print(f"Hashtag：{tags}")
+
+        if thumbnail_path.exists():
+            print(f"使用自定义封面: {thumbnail_path}")
+            app = DouYinVideo(title, file, tags, publish_datetimes[index], account_file, thumbnail_path=thumbnail_path)
+        else:
+            print("使用系统生成的封面")
+            app = DouYinVideo(title, file, tags, publish_datetimes[index], account_file)
+        # 上传出错的视频会被记录为失败，不影响后续视频
+        scheduler.add(SOCIAL_MEDIA_DOUYIN, account_name, app.main, name=file.name, fingerprint=pending[file])
+
+    try:
+        await scheduler.run()
+    finally:
+        await browser_pool.close()
 
 
 if __name__ == '__main__':
@@ -23,40 +70,10 @@ if __name__ == '__main__':
     folder_path = Path(filepath)
     # 获取文件夹中的所有文件
     files = list(folder_path.glob("*.mp4"))
-    file_num = len(files)
     
     if not files:
         print(f"错误: 在 {filepath} 目录下未找到任何视频文件")
         exit(1)
         
-    print(f"找到 {file_num} 个视频文件，准备上传")
-    publish_datetimes = generate_schedule_time_next_day(file_num, 1, daily_times=[16])
-    cookie_setup = asyncio.run(douyin_setup(str(account_file), handle=True))
-    
-    if not cookie_setup:
-        print("Cookie验证失败，请先登录")
-        exit(1)
-        
-    for index, file in enumerate(files):
-        title, tags = get_title_and_hashtags(str(file))
-        thumbnail_path = file.with_suffix('.png')
-        # 打印视频文件名、标题和 hashtag
-        print(f"正在处理第 {index+1}/{file_num} 个视频")
-        print(f"视频文件名：{file}")
-        print(f"标题：{title}")
-        print(f"Hashtag：{tags}")
-        
-        if thumbnail_path.exists():
-            print(f"使用自定义封面: {thumbnail_path}")
-            app = DouYinVideo(title, file, tags, publish_datetimes[index], account_file, thumbnail_path=thumbnail_path)
-        else:
-            print("使用系统生成的封面")
-            app = DouYinVideo(title, file, tags, publish_datetimes[index], account_file)
-            
-        try:
-            asyncio.run(app.main(), debug=False)
-            print(f"第 {index+1}/{file_num} 个视频处理完成")
-        except Exception as e:
-            print(f"处理视频时出错: {str(e)}")
-            if index < file_num - 1:
-                print("错误后继续处理下一个视频...")
+    print(f"找到 {len(files)} 个视频文件，准备上传")
+    asyncio.run(main(args.account_name, account_file, files))
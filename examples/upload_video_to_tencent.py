@@ -3,21 +3,29 @@ from pathlib import Path
 
 from conf import BASE_DIR
 from uploader.tencent_uploader.main import weixin_setup, TencentVideo
+from utils.base_social_media import SOCIAL_MEDIA_TENCENT
+from utils.browser_pool import browser_pool
 from utils.constant import TencentZoneTypes
+from utils.dedup import DedupIndex
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
+from utils.preflight import preflight_files
+from utils.upload_scheduler import UploadScheduler
 
 
-if __name__ == '__main__':
-    filepath = Path(BASE_DIR) / "videos"
-    account_file = Path(BASE_DIR / "cookies" / "tencent_uploader" / "account.json")
-    # 获取视频目录
-    folder_path = Path(filepath)
-    # 获取文件夹中的所有文件
-    files = list(folder_path.glob("*.mp4"))
+async def main(account_file, files):
+    # 时长、编码等不符合平台限制的视频和已经发布到该账号的视频都在启动浏览器之前跳过
+    files = preflight_files(files, SOCIAL_MEDIA_TENCENT)
+    dedup = DedupIndex()
+    pending = dedup.unpublished(files, SOCIAL_MEDIA_TENCENT, account_file.stem)
+    files = list(pending)
+    if not files:
+        print("没有需要上传的视频")
+        return
     file_num = len(files)
     publish_datetimes = generate_schedule_time_next_day(file_num, 1, daily_times=[16])
-    cookie_setup = asyncio.run(weixin_setup(account_file, handle=True))
+    cookie_setup = await weixin_setup(account_file, handle=True)
     category = TencentZoneTypes.LIFESTYLE.value  # 标记原创需要否则不需要传
+    scheduler = UploadScheduler(dedup=dedup)
     for index, file in enumerate(files):
         title, tags = get_title_and_hashtags(str(file))
         # 打印视频文件名、标题和 hashtag
@@ -25,4 +33,18 @@ if __name__ == '__main__':
         print(f"标题：{title}")
         print(f"Hashtag：{tags}")
         app = TencentVideo(title, file, tags, publish_datetimes[index], account_file, category)
-        asyncio.run(app.main(), debug=False)
+        scheduler.add(SOCIAL_MEDIA_TENCENT, account_file.stem, app.main, name=file.name, fingerprint=pending[file])
+    try:
+        await scheduler.run()
+    finally:
+        await browser_pool.close()
+
+
+if __name__ == '__main__':
+    filepath = Path(BASE_DIR) / "videos"
+    account_file = Path(BASE_DIR / "cookies" / "tencent_uploader" / "account.json")
+    # 获取视频目录
+    folder_path = Path(filepath)
+    # 获取文件夹中的所有文件
+    files = list(folder_path.glob("*.mp4"))
+    asyncio.run(main(account_file, files))
@@ -4,18 +4,27 @@ from pathlib import Path
 from conf import BASE_DIR
 # from tk_uploader.main import tiktok_setup, TiktokVideo
 from uploader.tk_uploader.main_chrome import tiktok_setup, TiktokVideo
+from utils.base_social_media import SOCIAL_MEDIA_TIKTOK
+from utils.browser_pool import browser_pool
+from utils.dedup import DedupIndex
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
+from utils.preflight import preflight_files
+from utils.upload_scheduler import UploadScheduler
 
 
-if __name__ == '__main__':
-    filepath = Path(BASE_DIR) / "videos"
-    account_file = Path(BASE_DIR / "cookies" / "tk_uploader" / "account.json")
-    folder_path = Path(filepath)
-    # get video files from folder
-    files = list(folder_path.glob("*.mp4"))
+async def main(account_file, files):
+    # 时长、编码等不符合平台限制的视频和已经发布到该账号的视频都在启动浏览器之前跳过
+    files = preflight_files(files, SOCIAL_MEDIA_TIKTOK)
+    dedup = DedupIndex()
+    pending = dedup.unpublished(files, SOCIAL_MEDIA_TIKTOK, account_file.stem)
+    files = list(pending)
+    if not files:
+        print("没有需要上传的视频")
+        return
     file_num = len(files)
     publish_datetimes = generate_schedule_time_next_day(file_num, 1, daily_times=[16])
-    cookie_setup = asyncio.run(tiktok_setup(account_file, handle=True))
+    cookie_setup = await tiktok_setup(account_file, handle=True)
+    scheduler = UploadScheduler(dedup=dedup)
     for index, file in enumerate(files):
         title, tags = get_title_and_hashtags(str(file))
         thumbnail_path = file.with_suffix('.png')
@@ -27,4 +36,17 @@ if __name__ == '__main__':
             app = TiktokVideo(title, file, tags, publish_datetimes[index], account_file, thumbnail_path)
         else:
             app = TiktokVideo(title, file, tags, publish_datetimes[index], account_file)
-        asyncio.run(app.main(), debug=False)
+        scheduler.add(SOCIAL_MEDIA_TIKTOK, account_file.stem, app.main, name=file.name, fingerprint=pending[file])
+    try:
+        await scheduler.run()
+    finally:
+        await browser_pool.close()
+
+
+if __name__ == '__main__':
+    filepath = Path(BASE_DIR) / "videos"
+    account_file = Path(BASE_DIR / "cookies" / "tk_uploader" / "account.json")
+    folder_path = Path(filepath)
+    # get video files from folder
+    files = list(folder_path.glob("*.mp4"))
+    asyncio.run(main(account_file, files))
@@ -1,12 +1,15 @@
+import asyncio
 import configparser
 from pathlib import Path
-from time import sleep
 
 from xhs import XhsClient
 
 from conf import BASE_DIR
+from utils.base_social_media import SOCIAL_MEDIA_XHS
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
+from utils.pacing import upload_pacer
 from uploader.xhs_uploader.main import sign_local, beauty_print
+from uploader.xhs_uploader.topic_cache import topic_cache, normalize_tag
 
 config = configparser.RawConfigParser()
 config.read(Path(BASE_DIR / "uploader" / "xhs_uploader" / "accounts.ini"))
@@ -31,38 +34,46 @@ if __name__ == '__main__':
         exit()
 
     publish_datetimes = generate_schedule_time_next_day(file_num, 1, daily_times=[16])
+    # 上传前一次性查询所有视频用到的话题，相同的标签只查询一次，已缓存的不再查询
+    titles_and_tags = [get_title_and_hashtags(str(file)) for file in files]
+    suggested_topics = topic_cache.resolve(xhs_client, [tag for _, tags in titles_and_tags for tag in tags[:3]])
 
-    for index, file in enumerate(files):
-        title, tags = get_title_and_hashtags(str(file))
-        # 加入到标题 补充标题（xhs 可以填1000字不写白不写）
-        tags_str = ' '.join(['#' + tag for tag in tags])
-        hash_tags_str = ''
-        hash_tags = []
+    async def main():
+        for index, file in enumerate(files):
+            title, tags = titles_and_tags[index]
+            # 加入到标题 补充标题（xhs 可以填1000字不写白不写）
+            tags_str = ' '.join(['#' + tag for tag in tags])
+            hash_tags_str = ''
+            hash_tags = []
 
-        # 打印视频文件名、标题和 hashtag
-        print(f"视频文件名：{file}")
-        print(f"标题：{title}")
-        print(f"Hashtag：{tags}")
+            # 打印视频文件名、标题和 hashtag
+            print(f"视频文件名：{file}")
+            print(f"标题：{title}")
+            print(f"Hashtag：{tags}")
 
-        topics = []
-        # 获取hashtag
-        for i in tags[:3]:
-            topic_official = xhs_client.get_suggest_topic(i)
-            if topic_official:
-                topic_official[0]['type'] = 'topic'
-                topic_one = topic_official[0]
-                hash_tag_name = topic_one['name']
-                hash_tags.append(hash_tag_name)
-                topics.append(topic_one)
+            topics = []
+            # 获取hashtag
+            for i in tags[:3]:
+                topic_official = suggested_topics.get(normalize_tag(i))
+                if topic_official:
+                    topic_one = dict(topic_official[0], type='topic')
+                    hash_tag_name = topic_one['name']
+                    hash_tags.append(hash_tag_name)
+                    topics.append(topic_one)
 
-        hash_tags_str = ' ' + ' '.join(['#' + tag + '[话题]#' for tag in hash_tags])
+            hash_tags_str = ' ' + ' '.join(['#' + tag + '[话题]#' for tag in hash_tags])
 
-        note = xhs_client.create_video_note(title=title[:20], video_path=str(file),
-                                            desc=title + tags_str + hash_tags_str,
-                                            topics=topics,
-                                            is_private=False,
-                                            post_time=publish_datetimes[index].strftime("%Y-%m-%d %H:%M:%S"))
+            # 两次发布之间保持间隔，避免风控（必要），间隔由 conf.UPLOAD_PACING 控制，等待时不阻塞线程
+            await upload_pacer.acquire(SOCIAL_MEDIA_XHS, 'account1')
+            try:
+                note = await asyncio.to_thread(xhs_client.create_video_note, title=title[:20], video_path=str(file),
+                                               desc=title + tags_str + hash_tags_str,
+                                               topics=topics,
+                                               is_private=False,
+                                               post_time=publish_datetimes[index].strftime("%Y-%m-%d %H:%M:%S"))
+            finally:
+                upload_pacer.release(SOCIAL_MEDIA_XHS, 'account1')
 
-        beauty_print(note)
-        # 强制休眠30s，避免风控（必要）
-        sleep(30)
+            beauty_print(note)
+
+    asyncio.run(main())
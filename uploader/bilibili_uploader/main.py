@@ -3,7 +3,11 @@ import pathlib
 import random
 from biliup.plugins.bili_webup import BiliBili, Data
 
+from conf import BILIBILI_ADAPTIVE_UPLOAD
+from uploader.bilibili_uploader.upos import UposUploader, upos_session, select_line
+from utils.base_social_media import SOCIAL_MEDIA_BILIBILI
 from utils.log import bilibili_logger
+from utils.preflight import prepare_file
 
 
 def extract_keys_from_json(data):
@@ -41,7 +45,8 @@ def random_emoji():
 
 class BilibiliUploader(object):
     def __init__(self, cookie_data, file: pathlib.Path, title, desc, tid, tags, dtime):
-        self.upload_thread_num = 3
+        # 自适应上传时为 None，使用该线路上次的最佳并发数
+        self.upload_thread_num = None if BILIBILI_ADAPTIVE_UPLOAD else 3
         self.copyright = 1
         self.lines = 'AUTO'
         self.cookie_data = cookie_data
@@ -63,11 +68,15 @@ class BilibiliUploader(object):
         self.data.dtime = self.dtime
 
     def upload(self):
+        self.file = pathlib.Path(prepare_file(self.file, SOCIAL_MEDIA_BILIBILI))
         with BiliBili(self.data) as bili:
             bili.login_by_cookies(self.cookie_data)
             bili.access_token = self.cookie_data.get('access_token')
-            video_part = bili.upload_file(str(self.file), lines=self.lines,
-                                          tasks=self.upload_thread_num)  # 上传视频，默认线路AUTO自动选择，线程数量3。
+            if BILIBILI_ADAPTIVE_UPLOAD:
+                video_part = self.upload_chunks()
+            else:
+                video_part = bili.upload_file(str(self.file), lines=self.lines,
+                                              tasks=self.upload_thread_num)  # 上传视频，默认线路AUTO自动选择，线程数量3。
             video_part['title'] = self.title
             self.data.append(video_part)
             ret = bili.submit()  # 提交视频
@@ -77,3 +86,10 @@ class BilibiliUploader(object):
             else:
                 bilibili_logger.error(f'[-] {self.file.name}上传 失败, error messge: {ret.get("message")}')
                 return False
+
+    def upload_chunks(self):
+        """Upload the file with adaptive chunk concurrency, see upos.UposUploader."""
+        session = upos_session(self.cookie_data)
+        line = select_line(session) if self.lines == 'AUTO' else self.lines
+        uploader = UposUploader(session, line, tasks=self.upload_thread_num, account=self.cookie_data.get('DedeUserID'))
+        return uploader.upload(self.file)
@@ -0,0 +1,461 @@
+import json
+import math
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from conf import BILIBILI_UPLOAD_TASKS, BILIBILI_UPLOAD_TASKS_MIN, BILIBILI_UPLOAD_TASKS_MAX, BILIBILI_LINE_STATS_FILE, \
+    BILIBILI_MANIFEST_DIR, BILIBILI_MANIFEST_TTL, BILIBILI_LINE_TTL, BILIBILI_LINE_PROBE_BYTES
+from utils.fingerprint import file_fingerprint
+from utils.log import bilibili_logger
+
+PREUPLOAD_URL = "https://member.bilibili.com/preupload"
+# 与 biliup 相同的 upos 上传线路
+UPOS_LINES = {
+    "bda2": {"query": "upcdn=bda2&probe_version=20221109", "probe_url": "//upos-cs-upcdnbda2.bilivideo.com/OK"},
+    "ws": {"query": "upcdn=ws&probe_version=20221109", "probe_url": "//upos-cs-upcdnws.bilivideo.com/OK"},
+    "qn": {"query": "upcdn=qn&probe_version=20221109", "probe_url": "//upos-cs-upcdnqn.bilivideo.com/OK"},
+    "bldsa": {"query": "upcdn=bldsa&probe_version=20221109", "probe_url": "//upos-cs-upcdnbldsa.bilivideo.com/OK"},
+    "tx": {"query": "upcdn=tx&probe_version=20221109", "probe_url": "//upos-cs-upcdntx.bilivideo.com/OK"},
+    "txa": {"query": "upcdn=txa&probe_version=20221109", "probe_url": "//upos-cs-upcdntxa.bilivideo.com/OK"},
+    "alia": {"query": "upcdn=alia&probe_version=20221109", "probe_url": "//upos-cs-upcdnalia.bilivideo.com/OK"},
+}
+DEFAULT_LINE = "bda2"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) " \
+             "Chrome/120.0.0.0 Safari/537.36"
+CHUNK_RETRIES = 3
+# 续传时这些状态码表示 upos 会话已失效(upload id 不存在或鉴权被拒)，只有这时才丢弃清单重新上传
+SESSION_INVALID_STATUS = (401, 403, 404)
+
+
+def upos_session(cookie_data: dict, pool_size: int = BILIBILI_UPLOAD_TASKS_MAX) -> requests.Session:
+    """A keep-alive session carrying the account cookies, with enough pooled connections for every chunk task."""
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    session.headers["Referer"] = "https://member.bilibili.com/"
+    for name, value in cookie_data.items():
+        if name != "access_token":
+            session.cookies.set(name, value, domain=".bilibili.com")
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class LineStats(object):
+    """
+    What was learnt about each upload line, persisted so the next upload starts from it:
+    the number of parallel chunk tasks that worked best, the total throughput reached with it,
+    and the latency and per-connection throughput used to pick a line. The last two come from
+    probes and from the chunks of real uploads and are trusted for `BILIBILI_LINE_TTL` seconds.
+    """
+
+    def __init__(self, stats_file=BILIBILI_LINE_STATS_FILE):
+        self.stats_file = Path(stats_file)
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        self.stats_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.stats_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_file, self.stats_file)
+
+    def get(self, line) -> dict:
+        with self._lock:
+            return dict(self._load().get(line) or {})
+
+    def update(self, line, **values):
+        with self._lock:
+            entry = self._load().setdefault(line, {})
+            entry.update(values, updated_at=time.time())
+            self._save()
+
+    def record(self, line, connection_throughput, latency=None, source="probe", weight: float = 0.5):
+        """Add a throughput measurement of one connection, averaged with the previous one while it is fresh."""
+        with self._lock:
+            entry = self._load().setdefault(line, {})
+            previous = entry.get("connection_throughput")
+            if previous and self._is_fresh(entry) and connection_throughput:
+                connection_throughput = weight * connection_throughput + (1 - weight) * previous
+            entry.update(connection_throughput=connection_throughput, source=source, measured_at=time.time())
+            if source == "probe":
+                # 探测失败时清掉旧的延迟，有效期内不再选择该线路
+                entry["latency"] = latency
+            self._save()
+
+    @staticmethod
+    def _is_fresh(entry: dict, ttl: float = BILIBILI_LINE_TTL) -> bool:
+        return time.time() - entry.get("measured_at", 0) < ttl
+
+    def fresh(self, line, ttl: float = BILIBILI_LINE_TTL) -> bool:
+        with self._lock:
+            return self._is_fresh(self._load().get(line) or {}, ttl)
+
+
+def probe_line(session, line, scheme="https") -> tuple:
+    """
+    Measure the latency of a line with an empty request and its throughput with a small upload.
+    :returns: (latency seconds, bytes per second), (None, 0) when the line does not answer
+    """
+    url = f"{scheme}:{UPOS_LINES[line]['probe_url']}"
+    try:
+        start = time.perf_counter()
+        session.get(url, timeout=3).raise_for_status()
+        latency = time.perf_counter() - start
+    except requests.RequestException as e:
+        bilibili_logger.debug(f"  [-] 线路 {line} 探测失败: {e}")
+        return None, 0
+    try:
+        start = time.perf_counter()
+        session.post(url, data=bytes(BILIBILI_LINE_PROBE_BYTES), timeout=10).raise_for_status()
+        elapsed = time.perf_counter() - start
+    except requests.RequestException as e:
+        # 只能测到延迟时仍可按延迟选择
+        bilibili_logger.debug(f"  [-] 线路 {line} 测速失败: {e}")
+        return latency, 0
+    return latency, BILIBILI_LINE_PROBE_BYTES / elapsed if elapsed > 0 else 0
+
+
+def probe_lines(session, lines, line_stats: LineStats, scheme="https") -> dict:
+    """Probe `lines` concurrently and store the results, returns {line: (latency, bytes per second)}."""
+    lines = list(lines)
+    if not lines:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(lines), thread_name_prefix="upos-probe") as pool:
+        results = dict(zip(lines, pool.map(lambda line: probe_line(session, line, scheme), lines)))
+    for line, (latency, throughput) in results.items():
+        line_stats.record(line, throughput, latency)
+    return results
+
+
+def select_line(session, line_stats: LineStats = None, lines=None, ttl: float = BILIBILI_LINE_TTL,
+                scheme="https") -> str:
+    """
+    Pick the line with the highest per-connection throughput.
+    Only lines without a measurement younger than `ttl` are probed, so back-to-back uploads skip probing.
+    """
+    line_stats = line_stats or LineStats()
+    lines = list(lines or UPOS_LINES)
+    stale = [line for line in lines if not line_stats.fresh(line, ttl)]
+    if stale:
+        start = time.perf_counter()
+        probe_lines(session, stale, line_stats, scheme)
+        bilibili_logger.info(f"[+] 已探测 {len(stale)} 条上传线路，用时 {time.perf_counter() - start:.2f}s")
+    entries = {line: line_stats.get(line) for line in lines}
+    reachable = [line for line in lines if entries[line].get("latency") is not None]
+    if not reachable:
+        return DEFAULT_LINE
+    # 单连接速度优先，都没有测到速度时按延迟选择
+    best = max(reachable, key=lambda line: (entries[line].get("connection_throughput") or 0,
+                                            -entries[line]["latency"]))
+    bilibili_logger.info(f"[+] 选择上传线路 {best}: {entries[best]['latency'] * 1000:.0f}ms "
+                         f"{(entries[best].get('connection_throughput') or 0) / 1024 / 1024:.2f}MB/s 每连接"
+                         f"({entries[best].get('source')})")
+    return best
+
+
+class AdaptiveConcurrency(object):
+    """
+    AIMD controller for the number of chunks uploaded in parallel.
+
+    The throughput of every window of `limit` finished chunks is compared with the best
+    seen so far: a clear gain adds one task, no gain after an increase takes it back, a clear
+    drop or a failed chunk halves the limit.
+    """
+
+    def __init__(self, initial: int, minimum: int = BILIBILI_UPLOAD_TASKS_MIN,
+                 maximum: int = BILIBILI_UPLOAD_TASKS_MAX, gain: float = 0.05, drop: float = 0.25):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(self.maximum, max(self.minimum, initial))
+        self.gain = gain
+        self.drop = drop
+        self.best = None
+        self.best_limit = self.limit
+        self.history = []
+        self._lock = threading.Lock()
+        self._increased = False
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_bytes = 0
+        self._window_chunks = 0
+        self._window_start = time.perf_counter()
+
+    def on_chunk(self, size: int):
+        with self._lock:
+            self._window_bytes += size
+            self._window_chunks += 1
+            if self._window_chunks < max(2, self.limit):
+                return
+            elapsed = time.perf_counter() - self._window_start
+            throughput = self._window_bytes / elapsed if elapsed > 0 else 0
+            self.history.append((self.limit, throughput))
+            if self.best is None or throughput > self.best * (1 + self.gain):
+                self.best = throughput
+                self.best_limit = self.limit
+                self._increased = self.limit < self.maximum
+                self.limit = min(self.maximum, self.limit + 1)
+            elif throughput < self.best * (1 - self.drop):
+                # 网络条件变差，以当前吞吐量重新作为基准
+                self._decrease(throughput)
+            elif self._increased:
+                # 增加的并发没有带来收益，退回并保持
+                self.limit = max(self.minimum, self.limit - 1)
+                self._increased = False
+            self._reset_window()
+
+    def on_error(self):
+        with self._lock:
+            self._decrease(None)
+            self._reset_window()
+
+    def _decrease(self, throughput):
+        self.limit = max(self.minimum, self.limit // 2)
+        self.best = throughput
+        self.best_limit = self.limit
+        self._increased = False
+
+
+class ManifestStore(object):
+    """
+    Chunk manifests of unfinished uploads, one json file per (account, video fingerprint).
+
+    A manifest holds the upos session (upload id, endpoint, auth, chunk size) and the crc32 of
+    every chunk the server accepted, so an interrupted upload continues with the missing chunks.
+    Manifests older than `ttl` are dropped because the upos session expires as well.
+    """
+
+    def __init__(self, directory=BILIBILI_MANIFEST_DIR, ttl: float = BILIBILI_MANIFEST_TTL):
+        self.directory = Path(directory)
+        self.ttl = ttl
+
+    def path(self, key) -> Path:
+        return self.directory / f"{key}.json"
+
+    def load(self, key):
+        self.purge()
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key, manifest: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        manifest["updated_at"] = time.time()
+        tmp_file = self.path(key).with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_file, self.path(key))
+
+    def remove(self, key):
+        try:
+            self.path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def purge(self) -> int:
+        """Delete expired manifests, returns how many."""
+        removed = 0
+        for path in self.directory.glob("*.json"):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    created_at = json.load(f).get("created_at", 0)
+            except (OSError, ValueError):
+                created_at = 0
+            if time.time() - created_at > self.ttl:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+
+class UposUploader(object):
+    """
+    Chunked upload of a video to bilibili's upos storage with adaptive chunk concurrency.
+
+    Does the same requests as `biliup`'s `BiliBili.upload_file` (preupload, upload id, chunk PUTs,
+    complete) and returns the same video part dict, so its result can be appended to `Data`
+    and submitted with biliup. The best number of parallel chunks is remembered per line, and
+    accepted chunks are recorded in a manifest so a retry only uploads the missing ones.
+    """
+
+    def __init__(self, session, line=DEFAULT_LINE, tasks: int = None, line_stats: LineStats = None,
+                 account=None, manifests: ManifestStore = None, preupload_url=PREUPLOAD_URL, scheme="https"):
+        """
+        :param tasks: initial number of parallel chunks, defaults to the last best value of the line
+        :param account: account id (DedeUserID), upos sessions are not shared between accounts
+        :param preupload_url, scheme: only changed to point the uploader at a local stand-in server
+        """
+        self.session = session
+        self.line = line
+        self.line_stats = line_stats or LineStats()
+        self.account = account or "default"
+        self.manifests = manifests or ManifestStore()
+        self.preupload_url = preupload_url
+        self.scheme = scheme
+        initial = tasks or self.line_stats.get(line).get("tasks") or BILIBILI_UPLOAD_TASKS
+        self.controller = AdaptiveConcurrency(initial)
+        self.bytes_per_second = None
+        self.uploaded_chunks = 0
+        # 已接受分片的请求耗时之和，除以总耗时即为平均并发数
+        self.chunk_seconds = 0.0
+
+    def preupload(self, file: Path, total_size: int) -> dict:
+        params = {"r": "upos", "profile": "ugcupos/bup", "ssl": 0, "version": "2.8.12", "build": 2081200,
+                  "name": file.name, "size": total_size}
+        query = UPOS_LINES.get(self.line, UPOS_LINES[DEFAULT_LINE])["query"]
+        resp = self.session.get(f"{self.preupload_url}?{query}", params=params, timeout=10)
+        resp.raise_for_status()
+        ret = resp.json()
+        if ret.get("OK") != 1:
+            raise RuntimeError(f"preupload failed: {ret}")
+        return ret
+
+    def new_manifest(self, file: Path, total_size: int) -> dict:
+        """Open a new upos session for the file."""
+        ret = self.preupload(file, total_size)
+        url = f"{self.scheme}:{ret['endpoint']}/{ret['upos_uri'].replace('upos://', '')}"
+        resp = self.session.post(f"{url}?uploads&output=json", headers={"X-Upos-Auth": ret["auth"]}, timeout=15)
+        resp.raise_for_status()
+        now = time.time()
+        return {"line": self.line, "url": url, "auth": ret["auth"], "upload_id": resp.json()["upload_id"],
+                "biz_id": ret["biz_id"], "upos_uri": ret["upos_uri"], "chunk_size": ret["chunk_size"],
+                "total_size": total_size, "chunks": math.ceil(total_size / ret["chunk_size"]),
+                "completed": {}, "created_at": now, "updated_at": now}
+
+    def manifest_key(self, file: Path) -> str:
+        return f"{self.account}-{file_fingerprint(file).replace(':', '-')}"
+
+    def upload(self, file) -> dict:
+        """
+        :returns: the video part, {"title", "filename", "desc"}
+        """
+        file = Path(file)
+        total_size = file.stat().st_size
+        key = self.manifest_key(file)
+        manifest = self.manifests.load(key)
+        if manifest is not None and manifest["total_size"] == total_size:
+            self._verify(file, manifest)
+            bilibili_logger.info(f"[+] {file.name} 继续上次未完成的上传，已完成 "
+                                 f"{len(manifest['completed'])}/{manifest['chunks']} 个分片")
+            try:
+                return self._upload(file, key, manifest)
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code not in SESSION_INVALID_STATUS:
+                    # 临时错误，保留清单，下次仍可续传
+                    raise
+                # upos 会话已过期或被服务端丢弃，重新开始
+                bilibili_logger.warning(f"  [-] 续传失败，重新上传整个文件: {e}")
+                self.manifests.remove(key)
+        manifest = self.new_manifest(file, total_size)
+        self.manifests.save(key, manifest)
+        return self._upload(file, key, manifest)
+
+    def _verify(self, file: Path, manifest: dict):
+        """Drop recorded chunks whose content changed since they were uploaded."""
+        chunk_size = manifest["chunk_size"]
+        with open(file, "rb") as f:
+            for index, checksum in list(manifest["completed"].items()):
+                f.seek(int(index) * chunk_size)
+                if zlib.crc32(f.read(chunk_size)) != checksum:
+                    del manifest["completed"][index]
+
+    def _upload(self, file: Path, key, manifest: dict) -> dict:
+        chunks = manifest["chunks"]
+        missing = [index for index in range(chunks) if str(index) not in manifest["completed"]]
+        bilibili_logger.info(f"[+] {file.name} 线路 {manifest['line']}, 上传 {len(missing)}/{chunks} 个分片, "
+                             f"初始并发 {self.controller.limit}")
+        start = time.perf_counter()
+        sent = self._upload_chunks(file, key, manifest, missing)
+        elapsed = time.perf_counter() - start
+        self.bytes_per_second = sent / elapsed if elapsed > 0 and sent else None
+
+        params = {"name": file.name, "uploadId": manifest["upload_id"], "biz_id": manifest["biz_id"],
+                  "output": "json", "profile": "ugcupos/bup"}
+        parts = [{"partNumber": index + 1, "eTag": "etag"} for index in range(chunks)]
+        resp = self.session.post(manifest["url"], params=params, json={"parts": parts},
+                                 headers={"X-Upos-Auth": manifest["auth"]}, timeout=15)
+        resp.raise_for_status()
+        result = resp.json()
+        if result.get("OK") != 1:
+            raise RuntimeError(f"complete upload failed: {result}")
+        self.manifests.remove(key)
+
+        if self.bytes_per_second:
+            self.line_stats.update(manifest["line"], tasks=self.controller.best_limit,
+                                   throughput=self.bytes_per_second)
+            bilibili_logger.info(f"[+] {file.name} 上传完成 {self.bytes_per_second / 1024 / 1024:.2f}MB/s, "
+                                 f"并发 {[limit for limit, _ in self.controller.history]} -> "
+                                 f"{self.controller.best_limit}")
+        if self.bytes_per_second and self.chunk_seconds:
+            # 总速度除以平均并发数得到单连接速度，和探测结果可比，反馈给线路选择
+            concurrency = max(1.0, self.chunk_seconds / elapsed)
+            self.line_stats.record(manifest["line"], self.bytes_per_second / concurrency, source="upload")
+        return {"title": file.stem, "filename": Path(manifest["upos_uri"]).stem, "desc": ""}
+
+    def _put_chunk(self, file: Path, manifest: dict, index) -> tuple:
+        chunk_size = manifest["chunk_size"]
+        start = index * chunk_size
+        with open(file, "rb") as f:
+            f.seek(start)
+            data = f.read(chunk_size)
+        params = {"uploadId": manifest["upload_id"], "chunks": manifest["chunks"], "total": manifest["total_size"],
+                  "partNumber": index + 1, "chunk": index, "size": len(data), "start": start,
+                  "end": start + len(data)}
+        start = time.perf_counter()
+        resp = self.session.put(manifest["url"], params=params, data=data, headers={"X-Upos-Auth": manifest["auth"]},
+                                timeout=60)
+        resp.raise_for_status()
+        return len(data), zlib.crc32(data), time.perf_counter() - start
+
+    def _upload_chunks(self, file: Path, key, manifest: dict, indices) -> int:
+        """Upload the chunks `indices`, recording each accepted one in the manifest, returns the bytes sent."""
+        pending = deque(indices)
+        attempts = {}
+        in_flight = {}
+        sent = 0
+        with ThreadPoolExecutor(max_workers=self.controller.maximum, thread_name_prefix="upos") as pool:
+            while pending or in_flight:
+                # 按控制器当前的并发上限补充分片任务
+                while pending and len(in_flight) < self.controller.limit:
+                    index = pending.popleft()
+                    in_flight[pool.submit(self._put_chunk, file, manifest, index)] = index
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = in_flight.pop(future)
+                    try:
+                        size, checksum, elapsed = future.result()
+                    except Exception as e:
+                        attempts[index] = attempts.get(index, 0) + 1
+                        if attempts[index] >= CHUNK_RETRIES:
+                            raise
+                        bilibili_logger.warning(f"  [-] 分片 {index} 上传失败，稍后重试: {e}")
+                        self.controller.on_error()
+                        pending.append(index)
+                        continue
+                    self.controller.on_chunk(size)
+                    self.chunk_seconds += elapsed
+                    sent += size
+                    self.uploaded_chunks += 1
+                    manifest["completed"][str(index)] = checksum
+                    self.manifests.save(key, manifest)
+        return sent
@@ -1,49 +1,75 @@
 # -*- coding: utf-8 -*-
+import re
 from datetime import datetime
 
-from playwright.async_api import Playwright, async_playwright, Page
+from playwright.async_api import Playwright, Page
 import os
 import asyncio
 
-from conf import LOCAL_CHROME_PATH
-from utils.base_social_media import set_init_script
+from conf import LOCAL_CHROME_PATH, UPLOAD_HEADLESS
+from utils.base_social_media import set_init_script, SOCIAL_MEDIA_DOUYIN
+from utils.browser_pool import browser_pool
+from utils.cookie_cache import cookie_cache
+from utils.display import upload_launch_options
 from utils.log import douyin_logger
+from utils.preflight import prepare_upload_file
+from utils.route_profiles import apply_route_profile
+from utils.upload_network import UploadNetworkMonitor
+from utils.upload_status import UploadStatusProbe
+from utils.waits import wait_for_state, wait_for_url, wait_for_network_idle, wait_for_dom_settled
+
+# 上传状态检测规则，在页面内一次性检测，见 utils.upload_status
+DOUYIN_UPLOAD_DONE = [
+    {"selector": '[class^="long-card"] div', "text": "重新上传"},
+    {"selector": "div", "text": "上传完成"},
+    {"selector": "div.upload-success"},
+    {"selector": "div", "text": "视频已上传"},
+    {"selector": "div.progress-div:has(div.done)"},
+    {"selector": 'div[role="progressbar"][aria-valuenow="100"]'},
+]
+DOUYIN_UPLOAD_FAILED = [
+    {"selector": "div.progress-div > div", "text": "上传失败"},
+    {"selector": "div", "text": "上传错误"},
+    {"selector": "div.error-message", "visible": True},
+    {"selector": "div", "text": "重新上传", "not_text": "已上传"},
+]
+DOUYIN_UPLOAD_PROGRESS = {"selector": 'div[role="progressbar"]', "attr": "aria-valuenow"}
+# 封面图片经 ImageX 上传: 申请上传、上传到 TOS、提交
+DOUYIN_COVER_UPLOAD = r"Action=(?:ApplyImageUpload|CommitImageUpload)|/upload/v1/"
 
 
 async def cookie_auth(account_file):
-    async with async_playwright() as playwright:
+    playwright = await browser_pool.get_playwright()
+    context = None
+    try:
+        context = await browser_pool.new_context(playwright.chromium, account_file, launch_options={'headless': True})
+        context = await set_init_script(context)
+        await apply_route_profile(context, SOCIAL_MEDIA_DOUYIN)
+        # 创建一个新的页面
+        page = await context.new_page()
+        # 访问指定的 URL
+        await page.goto("https://creator.douyin.com/creator-micro/content/upload", timeout=30000)
         try:
-            browser = await playwright.chromium.launch(headless=True)
-            context = await browser.new_context(storage_state=account_file)
-            context = await set_init_script(context)
-            # 创建一个新的页面
-            page = await context.new_page()
-            # 访问指定的 URL
-            await page.goto("https://creator.douyin.com/creator-micro/content/upload", timeout=30000)
-            try:
-                await page.wait_for_url("https://creator.douyin.com/creator-micro/content/upload", timeout=10000)
-            except:
-                douyin_logger.warning("[+] cookie 失效或加载超时")
-                await context.close()
-                await browser.close()
+            await page.wait_for_url("https://creator.douyin.com/creator-micro/content/upload", timeout=10000)
+        except:
+            douyin_logger.warning("[+] cookie 失效或加载超时")
+            return False
+
+        # 检查是否有登录按钮或登录相关文本
+        login_elements = ['手机号登录', '登录', '注册', '登入', '快速登录']
+        for login_text in login_elements:
+            if await page.get_by_text(login_text, exact=True).count():
+                douyin_logger.warning(f"[+] 检测到登录相关文本 '{login_text}'，cookie 已失效")
                 return False
 
-            # 检查是否有登录按钮或登录相关文本
-            login_elements = ['手机号登录', '登录', '注册', '登入', '快速登录']
-            for login_text in login_elements:
-                if await page.get_by_text(login_text, exact=True).count():
-                    douyin_logger.warning(f"[+] 检测到登录相关文本 '{login_text}'，cookie 已失效")
-                    await context.close()
-                    await browser.close()
-                    return False
-            
-            douyin_logger.info("[+] cookie 验证成功")
+        douyin_logger.info("[+] cookie 验证成功")
+        return True
+    except Exception as e:
+        douyin_logger.error(f"[+] cookie 验证过程出错: {str(e)}")
+        return False
+    finally:
+        if context:
             await context.close()
-            await browser.close()
-            return True
-        except Exception as e:
-            douyin_logger.error(f"[+] cookie 验证过程出错: {str(e)}")
-            return False
 
 
 async def douyin_setup(account_file, handle=False):
@@ -52,7 +78,7 @@ async def douyin_setup(account_file, handle=False):
         cookie_valid = False
         if os.path.exists(account_file):
             douyin_logger.info("[+] 验证cookie有效性...")
-            cookie_valid = await cookie_auth(account_file)
+            cookie_valid = await cookie_cache.validate(account_file, cookie_auth)
             
         if not cookie_valid:
             if not handle:
@@ -65,7 +91,7 @@ async def douyin_setup(account_file, handle=False):
             # 验证新获取的cookie
             retry_count = 0
             while retry_count < 3:
-                if await cookie_auth(account_file):
+                if await cookie_cache.validate(account_file, cookie_auth):
                     douyin_logger.success("[+] 新cookie验证成功!")
                     return True
                 douyin_logger.warning(f"[+] 新cookie验证失败，等待5秒后重试 ({retry_count+1}/3)")
@@ -81,56 +107,54 @@ async def douyin_setup(account_file, handle=False):
 
 
 async def get_douyin_cookie(account_file):
-    async with async_playwright() as playwright:
-        try:
-            options = {
-                'headless': False,
-                'args': ['--disable-blink-features=AutomationControlled']
-            }
-            
-            # 尝试使用本地Chrome
-            if LOCAL_CHROME_PATH:
-                browser = await playwright.chromium.launch(executable_path=LOCAL_CHROME_PATH, **options)
-            else:
-                browser = await playwright.chromium.launch(**options)
-                
-            context = await browser.new_context(viewport={"width": 1280, "height": 800})
-            context = await set_init_script(context)
-            
-            page = await context.new_page()
-            douyin_logger.info("[+] 正在打开抖音创作者页面，请在弹出的浏览器中登录...")
-            await page.goto("https://creator.douyin.com/")
-            
-            # 等待用户手动登录完成
-            douyin_logger.info("[+] 请在浏览器中完成登录，登录成功后系统将自动保存cookie")
-            
-            # 等待用户登录成功并跳转到主页
-            max_wait_time = 300  # 最多等待5分钟
-            successful_login = False
-            
-            for _ in range(max_wait_time):
-                # 检查是否已登录成功
-                if page.url.startswith("https://creator.douyin.com/creator-micro"):
-                    successful_login = True
-                    break
-                    
-                # 如果页面停留在登录页超过2分钟，提醒用户刷新页面
-                if _ > 120 and page.url.startswith("https://creator.douyin.com/login"):
-                    douyin_logger.warning("[+] 登录页面似乎卡住了，可能需要刷新页面...")
-                    
-                await asyncio.sleep(1)
-                
-            if successful_login:
-                douyin_logger.success("[+] 登录成功，正在保存cookie...")
-                await context.storage_state(path=account_file)
-                douyin_logger.success(f"[+] cookie已保存到 {account_file}")
-            else:
-                douyin_logger.error("[+] 等待登录超时，请手动完成登录")
-                
-            await context.close()
-            await browser.close()
-        except Exception as e:
-            douyin_logger.error(f"[+] 获取cookie过程出错: {str(e)}")
+    playwright = await browser_pool.get_playwright()
+    try:
+        options = {
+            'headless': False,
+            'args': ['--disable-blink-features=AutomationControlled']
+        }
+
+        # 尝试使用本地Chrome
+        if LOCAL_CHROME_PATH:
+            options['executable_path'] = LOCAL_CHROME_PATH
+
+        context = await browser_pool.new_context(playwright.chromium, account_file, launch_options=options,
+                                                 load_state=False, viewport={"width": 1280, "height": 800})
+        context = await set_init_script(context)
+
+        page = await context.new_page()
+        douyin_logger.info("[+] 正在打开抖音创作者页面，请在弹出的浏览器中登录...")
+        await page.goto("https://creator.douyin.com/")
+
+        # 等待用户手动登录完成
+        douyin_logger.info("[+] 请在浏览器中完成登录，登录成功后系统将自动保存cookie")
+
+        # 等待用户登录成功并跳转到主页
+        max_wait_time = 300  # 最多等待5分钟
+        successful_login = False
+
+        for _ in range(max_wait_time):
+            # 检查是否已登录成功
+            if page.url.startswith("https://creator.douyin.com/creator-micro"):
+                successful_login = True
+                break
+
+            # 如果页面停留在登录页超过2分钟，提醒用户刷新页面
+            if _ > 120 and page.url.startswith("https://creator.douyin.com/login"):
+                douyin_logger.warning("[+] 登录页面似乎卡住了，可能需要刷新页面...")
+
+            await asyncio.sleep(1)
+
+        if successful_login:
+            douyin_logger.success("[+] 登录成功，正在保存cookie...")
+            await context.storage_state(path=account_file)
+            douyin_logger.success(f"[+] cookie已保存到 {account_file}")
+        else:
+            douyin_logger.error("[+] 等待登录超时，请手动完成登录")
+
+        await context.close()
+    except Exception as e:
+        douyin_logger.error(f"[+] 获取cookie过程出错: {str(e)}")
 
 
 class DouYinVideo(object):
@@ -142,6 +166,7 @@ class DouYinVideo(object):
         self.account_file = account_file
         self.date_format = '%Y年%m月%d日 %H:%M'
         self.local_executable_path = LOCAL_CHROME_PATH
+        self.headless = UPLOAD_HEADLESS
         self.thumbnail_path = thumbnail_path
 
     async def set_schedule_time_douyin(self, page, publish_date):
@@ -149,16 +174,16 @@ class DouYinVideo(object):
         label_element = page.locator("[class^='radio']:has-text('定时发布')")
         # 在选中的 label 元素下点击 checkbox
         await label_element.click()
-        await asyncio.sleep(1)
         publish_date_hour = publish_date.strftime("%Y-%m-%d %H:%M")
 
-        await asyncio.sleep(1)
-        await page.locator('.semi-input[placeholder="日期和时间"]').click()
+        date_input = page.locator('.semi-input[placeholder="日期和时间"]')
+        await wait_for_state(date_input, 'visible', timeout=2000)
+        await date_input.click()
         await page.keyboard.press("Control+KeyA")
         await page.keyboard.type(str(publish_date_hour))
         await page.keyboard.press("Enter")
 
-        await asyncio.sleep(1)
+        await wait_for_dom_settled(page, quiet_ms=300, timeout=1000)
 
     async def handle_upload_error(self, page):
         douyin_logger.info('发现上传错误，尝试重新上传...')
@@ -222,54 +247,48 @@ class DouYinVideo(object):
             await page.screenshot(path=f"reupload_fail_{datetime.now().strftime('%Y%m%d%H%M%S')}.png")
             # 我们不抛出异常，让流程继续，也许视频仍然可以发布
 
-    async def wait_for_page_navigation(self, page, expected_urls, timeout=60, check_interval=1):
-        """等待页面导航到预期URL之一，带有重试机制"""
-        start_time = datetime.now()
-        while (datetime.now() - start_time).total_seconds() < timeout:
-            current_url = page.url
-            for expected_url in expected_urls:
-                if expected_url in current_url:
-                    return True
-            douyin_logger.info(f"  [-] 等待导航到预期页面，当前URL: {current_url}")
-            await asyncio.sleep(check_interval)
-        return False
+    async def wait_for_page_navigation(self, page, expected_urls, timeout=60):
+        """等待页面导航到预期URL之一"""
+        pattern = "|".join(re.escape(url) for url in expected_urls)
+        return await wait_for_url(page, pattern, timeout=timeout * 1000, description="douyin publish page")
 
-    async def upload(self, playwright: Playwright) -> None:
+    async def upload(self, playwright: Playwright) -> bool:
         try:
             # 使用 Chromium 浏览器启动一个浏览器实例
             browser_args = ['--disable-blink-features=AutomationControlled']
             
             if self.local_executable_path:
                 douyin_logger.info(f"  [-] 使用本地Chrome: {self.local_executable_path}")
-                browser = await playwright.chromium.launch(
-                    headless=False, 
-                    executable_path=self.local_executable_path,
-                    args=browser_args
-                )
-            else:
-                browser = await playwright.chromium.launch(
-                    headless=False,
-                    args=browser_args
-                )
-                
+            launch_options = upload_launch_options(self.headless, executable_path=self.local_executable_path,
+                                                   args=browser_args)
+
             # 创建一个浏览器上下文，使用指定的 cookie 文件
-            context = await browser.new_context(
-                storage_state=f"{self.account_file}", 
+            context = await browser_pool.new_context(
+                playwright.chromium,
+                self.account_file,
+                launch_options=launch_options,
                 viewport={"width": 1280, "height": 800}
             )
             context = await set_init_script(context)
+            await apply_route_profile(context, SOCIAL_MEDIA_DOUYIN)
 
             # 创建一个新的页面
             page = await context.new_page()
+            monitor = UploadNetworkMonitor(page, SOCIAL_MEDIA_DOUYIN, logger=douyin_logger).start()
             
             # 访问创作者中心首页，然后再导航到上传页面(提高成功率)
             douyin_logger.info(f'  [-] 正在打开抖音创作者中心...')
             await page.goto("https://creator.douyin.com/creator-micro/home", timeout=30000)
-            await asyncio.sleep(3)  # 多等待一下
+            await wait_for_dom_settled(page, quiet_ms=500, timeout=3000)
             
             douyin_logger.info(f'  [-] 正在导航到上传页面...')
             await page.goto("https://creator.douyin.com/creator-micro/content/upload", timeout=30000)
-            await asyncio.sleep(2)  # 等待页面完全加载
+            # 等待上传控件出现，被重定向到登录页时会超时
+            await wait_for_state(page.locator('input[type="file"]'), 'attached', timeout=5000)
+            if not page.url.startswith("https://creator.douyin.com/creator-micro"):
+                # 被重定向到登录页，说明 cookie 已失效
+                douyin_logger.warning(f"  [-] 页面被重定向到 {page.url}，cookie 可能已失效")
+                cookie_cache.invalidate(self.account_file)
             
             douyin_logger.info(f'[+] 正在上传视频: {self.title}.mp4')
             
@@ -284,7 +303,7 @@ class DouYinVideo(object):
                 douyin_logger.warning(f"  [-] 未找到标准上传区域: {str(e)}")
                 # 尝试刷新页面
                 await page.reload()
-                await asyncio.sleep(5)
+                await wait_for_state(page.locator('input[type="file"]'), 'attached', timeout=5000)
             
             # 优先使用直接设置文件输入的方法
             douyin_logger.info(f"  [-] 正在上传视频文件...")
@@ -389,7 +408,7 @@ class DouYinVideo(object):
                     raise Exception("导航到发布页面失败")
             
             # 填充标题和话题
-            await asyncio.sleep(2)
+            await wait_for_state(page.get_by_text('作品标题').or_(page.locator(".notranslate")), 'visible', timeout=5000)
             douyin_logger.info(f'  [-] 正在填充标题和话题...')
             
             # 尝试不同的标题输入方法
@@ -429,64 +448,29 @@ class DouYinVideo(object):
             # 等待视频上传完成
             upload_timeout = 300  # 5分钟超时
             start_time = datetime.now()
-            
+            probe = UploadStatusProbe(page, DOUYIN_UPLOAD_DONE, DOUYIN_UPLOAD_FAILED, DOUYIN_UPLOAD_PROGRESS,
+                                      logger=douyin_logger)
+            upload_done = False
+
             while (datetime.now() - start_time).total_seconds() < upload_timeout:
-                try:
-                    # 检查是否上传完成 - 使用多种方式检测
-                    upload_done_selectors = [
-                        '[class^="long-card"] div:has-text("重新上传")',
-                        'div:has-text("上传完成")',
-                        'div.upload-success',
-                        'div:has-text("视频已上传")',
-                        'div.progress-div:has(div.done)',
-                        'div[role="progressbar"][aria-valuenow="100"]'
-                    ]
-                    
-                    for selector in upload_done_selectors:
-                        if await page.locator(selector).count() > 0:
-                            douyin_logger.success(f"  [-] 视频上传完毕 (通过 {selector} 检测)")
-                            await asyncio.sleep(1)  # 等待页面稳定
-                            upload_done = True
-                            break
-                    else:  # 如果循环完成但没有break，则尝试继续等待
-                        upload_done = False
-                    
-                    if upload_done:
-                        break
-                    
-                    # 检查是否上传失败 - 使用多种方式检测
-                    upload_failed_selectors = [
-                        'div.progress-div > div:has-text("上传失败")',
-                        'div:has-text("上传错误")',
-                        'div.error-message:visible',
-                        'div:has-text("重新上传"):not(:has-text("已上传"))'
-                    ]
-                    
-                    for selector in upload_failed_selectors:
-                        if await page.locator(selector).count() > 0:
-                            douyin_logger.error(f"  [-] 检测到上传失败 (通过 {selector} 检测)，准备重试")
-                            await self.handle_upload_error(page)
-                            # 重置超时计时器，给重试更多时间
-                            start_time = datetime.now()
-                            break
-                    
-                    # 检查上传进度
-                    progress_elements = await page.locator('div[role="progressbar"]').all()
-                    if progress_elements:
-                        try:
-                            progress_value = await progress_elements[0].get_attribute("aria-valuenow")
-                            if progress_value:
-                                douyin_logger.info(f"  [-] 视频上传进度: {progress_value}%")
-                        except:
-                            pass
-                    
-                    douyin_logger.info("  [-] 正在上传视频中...")
-                    await asyncio.sleep(3)
-                except Exception as e:
-                    douyin_logger.warning(f"  [-] 检查上传状态出错: {str(e)}")
-                    await asyncio.sleep(3)
-            
-            if (datetime.now() - start_time).total_seconds() >= upload_timeout:
+                remaining = upload_timeout - (datetime.now() - start_time).total_seconds()
+                state = await probe.wait(timeout=remaining, monitor=monitor, on_progress=lambda value: douyin_logger.info(
+                    f"  [-] 视频上传进度: {value}%"))
+                if state["done"]:
+                    douyin_logger.success(f"  [-] 视频上传完毕 (通过 {state['done']} 检测)")
+                    await wait_for_dom_settled(page, quiet_ms=300, timeout=1000)  # 等待页面稳定
+                    upload_done = True
+                    break
+                if state["failed"]:
+                    douyin_logger.error(f"  [-] 检测到上传失败 (通过 {state['failed']} 检测)，准备重试")
+                    monitor.reset()
+                    await self.handle_upload_error(page)
+                    await wait_for_dom_settled(page, quiet_ms=500, timeout=3000)
+                    # 重置超时计时器，给重试更多时间
+                    start_time = datetime.now()
+
+            monitor.stop()
+            if not upload_done:
                 # 即使超时也尝试继续，可能是检测逻辑问题但文件已经上传
                 douyin_logger.warning("  [-] 视频上传检测超时，但尝试继续后续步骤")
                 
@@ -495,8 +479,7 @@ class DouYinVideo(object):
                     douyin_logger.info("  [-] 页面已处于发布状态，继续处理")
                 else:
                     # 如果不在发布页面，再给一次机会
-                    await asyncio.sleep(10)  # 多等待一会
-                    if any(url in page.url for url in ["content/publish", "content/post/video"]):
+                    if await wait_for_url(page, r"content/publish|content/post/video", timeout=10000):
                         douyin_logger.info("  [-] 页面现已处于发布状态，继续处理")
                     else:
                         douyin_logger.error("  [-] 视频上传可能失败，当前URL: " + page.url)
@@ -557,10 +540,10 @@ class DouYinVideo(object):
                 
             # 保存cookie并关闭浏览器
             await context.storage_state(path=self.account_file)
+            cookie_cache.mark_valid(self.account_file)
             douyin_logger.success('  [-] cookie更新完毕！')
-            await asyncio.sleep(2)
             await context.close()
-            await browser.close()
+            return publish_success
             
         except Exception as e:
             douyin_logger.error(f"  [-] 上传过程出现异常: {str(e)}")
@@ -571,10 +554,9 @@ class DouYinVideo(object):
             except:
                 pass
             
-            # 确保关闭浏览器
+            # 确保关闭浏览器上下文，浏览器本身由连接池复用
             try:
                 await context.close()
-                await browser.close()
             except:
                 pass
             raise
@@ -589,15 +571,16 @@ class DouYinVideo(object):
                 # 尝试设置竖封面
                 try:
                     await page.click('text="设置竖封面"')
-                    await page.wait_for_timeout(2000)
+                    await wait_for_dom_settled(page, "div.semi-modal-content", quiet_ms=300, timeout=2000)
                 except:
                     douyin_logger.warning("  [-] 无法找到'设置竖封面'按钮，继续上传...")
                 
                 # 定位到上传区域并选择文件
                 file_input = page.locator("div[class^='semi-upload upload'] >> input.semi-upload-hidden-input")
                 if await file_input.count():
-                    await file_input.set_input_files(thumbnail_path)
-                    await page.wait_for_timeout(3000)  # 等待上传
+                    # 先监听再选择文件，等待封面图片上传请求结束
+                    await wait_for_network_idle(page, DOUYIN_COVER_UPLOAD, idle_ms=500, timeout=10000,
+                                                action=lambda: file_input.set_input_files(thumbnail_path))
                     
                     # 点击完成按钮
                     complete_buttons = [
@@ -627,7 +610,7 @@ class DouYinVideo(object):
             if await page.locator(location_selector).count():
                 await page.locator(location_selector).click()
                 await page.keyboard.press("Backspace")
-                await page.wait_for_timeout(2000)
+                await wait_for_dom_settled(page, quiet_ms=300, timeout=2000)
                 await page.keyboard.type(location)
                 
                 # 等待并选择位置选项
@@ -643,7 +626,8 @@ class DouYinVideo(object):
             douyin_logger.warning(f"  [-] 设置地理位置时出错: {str(e)}")
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        self.file_path = await prepare_upload_file(self.file_path, SOCIAL_MEDIA_DOUYIN)
+        playwright = await browser_pool.get_playwright()
+        return await self.upload(playwright)
 
 
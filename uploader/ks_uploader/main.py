@@ -1,21 +1,32 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
 
-from playwright.async_api import Playwright, async_playwright
+from playwright.async_api import Playwright
 import os
-import asyncio
 
-from conf import LOCAL_CHROME_PATH
-from utils.base_social_media import set_init_script
+from conf import LOCAL_CHROME_PATH, UPLOAD_HEADLESS, PUBLISH_ATTEMPTS, PUBLISH_WAIT
+from utils.base_social_media import set_init_script, SOCIAL_MEDIA_KUAISHOU
+from utils.browser_pool import browser_pool
+from utils.cookie_cache import cookie_cache
+from utils.display import upload_launch_options
 from utils.files_times import get_absolute_path
 from utils.log import kuaishou_logger
+from utils.preflight import prepare_upload_file
+from utils.route_profiles import apply_route_profile
+from utils.upload_network import UploadNetworkMonitor
+from utils.upload_status import UploadStatusProbe
+from utils.waits import wait_for_state, wait_for_url, wait_for_dom_settled
+
+# 上传状态检测规则，见 utils.upload_status
+KS_UPLOAD_DONE = [{"selector": "div, span, p", "text": "上传中", "absent": True}]
 
 
 async def cookie_auth(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
+    playwright = await browser_pool.get_playwright()
+    context = await browser_pool.new_context(playwright.chromium, account_file, launch_options={'headless': True})
+    try:
         context = await set_init_script(context)
+        await apply_route_profile(context, SOCIAL_MEDIA_KUAISHOU)
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
@@ -28,11 +39,13 @@ async def cookie_auth(account_file):
         except:
             kuaishou_logger.success("[+] cookie 有效")
             return True
+    finally:
+        await context.close()
 
 
 async def ks_setup(account_file, handle=False):
     account_file = get_absolute_path(account_file, "ks_uploader")
-    if not os.path.exists(account_file) or not await cookie_auth(account_file):
+    if not os.path.exists(account_file) or not await cookie_cache.validate(account_file, cookie_auth):
         if not handle:
             return False
         kuaishou_logger.info('[+] cookie文件不存在或已失效，即将自动打开浏览器，请扫码登录，登陆后会自动生成cookie文件')
@@ -41,24 +54,23 @@ async def ks_setup(account_file, handle=False):
 
 
 async def get_ks_cookie(account_file):
-    async with async_playwright() as playwright:
-        options = {
-            'args': [
-                '--lang en-GB'
-            ],
-            'headless': False,  # Set headless option here
-        }
-        # Make sure to run headed.
-        browser = await playwright.chromium.launch(**options)
-        # Setup context however you like.
-        context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
-        # Pause the page, and start recording manually.
-        page = await context.new_page()
-        await page.goto("https://cp.kuaishou.com")
-        await page.pause()
-        # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+    playwright = await browser_pool.get_playwright()
+    options = {
+        'args': [
+            '--lang en-GB'
+        ],
+        'headless': False,  # Set headless option here
+    }
+    # Make sure to run headed.
+    context = await browser_pool.new_context(playwright.chromium, account_file, launch_options=options, load_state=False)
+    context = await set_init_script(context)
+    # Pause the page, and start recording manually.
+    page = await context.new_page()
+    await page.goto("https://cp.kuaishou.com")
+    await page.pause()
+    # 点击调试器的继续，保存cookie
+    await context.storage_state(path=account_file)
+    await context.close()
 
 
 class KSVideo(object):
@@ -70,145 +82,133 @@ class KSVideo(object):
         self.account_file = account_file
         self.date_format = '%Y-%m-%d %H:%M'
         self.local_executable_path = LOCAL_CHROME_PATH
+        self.headless = UPLOAD_HEADLESS
 
     async def handle_upload_error(self, page):
         kuaishou_logger.error("视频出错了，重新上传中")
         await page.locator('div.progress-div [class^="upload-btn-input"]').set_input_files(self.file_path)
 
-    async def upload(self, playwright: Playwright) -> None:
+    async def upload(self, playwright: Playwright) -> bool:
         # 使用 Chromium 浏览器启动一个浏览器实例
         print(self.local_executable_path)
-        if self.local_executable_path:
-            browser = await playwright.chromium.launch(
-                headless=False,
-                executable_path=self.local_executable_path,
-            )
-        else:
-            browser = await playwright.chromium.launch(
-                headless=False
-            )  # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}")
-        context = await set_init_script(context)
-        context.on("close", lambda: context.storage_state(path=self.account_file))
-
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://cp.kuaishou.com/article/publish/video")
-        kuaishou_logger.info('正在上传-------{}.mp4'.format(self.title))
-        # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
-        kuaishou_logger.info('正在打开主页...')
-        await page.wait_for_url("https://cp.kuaishou.com/article/publish/video")
-        # 点击 "上传视频" 按钮
-        upload_button = page.locator("button[class^='_upload-btn']")
-        await upload_button.wait_for(state='visible')  # 确保按钮可见
-
-        async with page.expect_file_chooser() as fc_info:
-            await upload_button.click()
-        file_chooser = await fc_info.value
-        await file_chooser.set_files(self.file_path)
-
-        await asyncio.sleep(2)
-
-        # if not await page.get_by_text("封面编辑").count():
-        #     raise Exception("似乎没有跳转到到编辑页面")
-
-        await asyncio.sleep(1)
-
-        # 等待按钮可交互
-        new_feature_button = page.locator('button[type="button"] span:text("我知道了")')
-        if await new_feature_button.count() > 0:
-            await new_feature_button.click()
-
-        kuaishou_logger.info("正在填充标题和话题...")
-        await page.get_by_text("描述").locator("xpath=following-sibling::div").click()
-        kuaishou_logger.info("clear existing title")
-        await page.keyboard.press("Backspace")
-        await page.keyboard.press("Control+KeyA")
-        await page.keyboard.press("Delete")
-        kuaishou_logger.info("filling new  title")
-        await page.keyboard.type(self.title)
-        await page.keyboard.press("Enter")
-
-        # 快手只能添加3个话题
-        for index, tag in enumerate(self.tags[:3], start=1):
-            kuaishou_logger.info("正在添加第%s个话题" % index)
-            await page.keyboard.type(f"#{tag} ")
-            await asyncio.sleep(2)
-
-        max_retries = 60  # 设置最大重试次数,最大等待时间为 2 分钟
-        retry_count = 0
-
-        while retry_count < max_retries:
+        launch_options = upload_launch_options(self.headless, executable_path=self.local_executable_path)
+        # 创建一个浏览器上下文，使用指定的 cookie 文件
+        context = await browser_pool.new_context(playwright.chromium, self.account_file, launch_options=launch_options)
+        try:
+            context = await set_init_script(context)
+            await apply_route_profile(context, SOCIAL_MEDIA_KUAISHOU)
+            context.on("close", lambda: context.storage_state(path=self.account_file))
+
+            # 创建一个新的页面
+            page = await context.new_page()
+            # 访问指定的 URL
+            await page.goto("https://cp.kuaishou.com/article/publish/video")
+            kuaishou_logger.info('正在上传-------{}.mp4'.format(self.title))
+            # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
+            kuaishou_logger.info('正在打开主页...')
             try:
-                # 获取包含 '上传中' 文本的元素数量
-                number = await page.locator("text=上传中").count()
-
-                if number == 0:
-                    kuaishou_logger.success("视频上传完毕")
+                await page.wait_for_url("https://cp.kuaishou.com/article/publish/video")
+            except Exception:
+                # 被重定向到登录页，说明 cookie 已失效
+                cookie_cache.invalidate(self.account_file)
+                raise
+            # 点击 "上传视频" 按钮
+            upload_button = page.locator("button[class^='_upload-btn']")
+            await upload_button.wait_for(state='visible')  # 确保按钮可见
+
+            monitor = UploadNetworkMonitor(page, SOCIAL_MEDIA_KUAISHOU, logger=kuaishou_logger).start()
+            async with page.expect_file_chooser() as fc_info:
+                await upload_button.click()
+            file_chooser = await fc_info.value
+            await file_chooser.set_files(self.file_path)
+
+            # 等待跳转到编辑页面，描述输入框出现即可继续
+            description = page.get_by_text("描述").locator("xpath=following-sibling::div")
+            await wait_for_state(description, 'visible', timeout=3000)
+
+            # 等待按钮可交互
+            new_feature_button = page.locator('button[type="button"] span:text("我知道了")')
+            if await new_feature_button.count() > 0:
+                await new_feature_button.click()
+
+            kuaishou_logger.info("正在填充标题和话题...")
+            await description.click()
+            kuaishou_logger.info("clear existing title")
+            await page.keyboard.press("Backspace")
+            await page.keyboard.press("Control+KeyA")
+            await page.keyboard.press("Delete")
+            kuaishou_logger.info("filling new  title")
+            await page.keyboard.type(self.title)
+            await page.keyboard.press("Enter")
+
+            # 快手只能添加3个话题
+            for index, tag in enumerate(self.tags[:3], start=1):
+                kuaishou_logger.info("正在添加第%s个话题" % index)
+                await page.keyboard.type(f"#{tag} ")
+                # 等待话题联想下拉框渲染完成
+                await wait_for_dom_settled(page, quiet_ms=300, timeout=2000)
+
+            # 页面上不再出现"上传中"代表视频上传完毕，最长等待 2 分钟
+            probe = UploadStatusProbe(page, KS_UPLOAD_DONE, logger=kuaishou_logger)
+            state = await probe.wait(timeout=120, poll_interval=10, monitor=monitor)
+            monitor.stop()
+            if state["done"]:
+                kuaishou_logger.success("视频上传完毕")
+            else:
+                kuaishou_logger.warning("超过最大等待时间，视频上传可能未完成。")
+
+            # 定时任务
+            if self.publish_date != 0:
+                await self.set_schedule_time(page, self.publish_date)
+
+            # 判断视频是否发布成功
+            published = False
+            for attempt in range(1, PUBLISH_ATTEMPTS + 1):
+                try:
+                    publish_button = page.get_by_text("发布", exact=True)
+                    if await publish_button.count() > 0:
+                        await publish_button.click()
+
+                    confirm_button = page.get_by_text("确认发布")
+                    if await wait_for_state(confirm_button, 'visible', timeout=1000):
+                        await confirm_button.click()
+                except Exception as e:
+                    kuaishou_logger.warning(f"点击发布失败: {e}")
+
+                # 等待页面跳转到作品管理页，确认发布成功
+                if await wait_for_url(page, r"cp\.kuaishou\.com/article/manage/video", timeout=PUBLISH_WAIT * 1000):
+                    kuaishou_logger.success("视频发布成功")
+                    published = True
                     break
-                else:
-                    if retry_count % 5 == 0:
-                        kuaishou_logger.info("正在上传视频中...")
-                    await asyncio.sleep(2)
-            except Exception as e:
-                kuaishou_logger.error(f"检查上传状态时发生错误: {e}")
-                await asyncio.sleep(2)  # 等待 2 秒后重试
-            retry_count += 1
-
-        if retry_count == max_retries:
-            kuaishou_logger.warning("超过最大重试次数，视频上传可能未完成。")
-
-        # 定时任务
-        if self.publish_date != 0:
-            await self.set_schedule_time(page, self.publish_date)
-
-        # 判断视频是否发布成功
-        while True:
-            try:
-                publish_button = page.get_by_text("发布", exact=True)
-                if await publish_button.count() > 0:
-                    await publish_button.click()
-
-                await asyncio.sleep(1)
-                confirm_button = page.get_by_text("确认发布")
-                if await confirm_button.count() > 0:
-                    await confirm_button.click()
-
-                # 等待页面跳转，确认发布成功
-                await page.wait_for_url(
-                    "https://cp.kuaishou.com/article/manage/video?status=2&from=publish",
-                    timeout=5000,
-                )
-                kuaishou_logger.success("视频发布成功")
-                break
-            except Exception as e:
-                kuaishou_logger.info(f"视频正在发布中... 错误: {e}")
-                await page.screenshot(full_page=True)
-                await asyncio.sleep(1)
-
-        await context.storage_state(path=self.account_file)  # 保存cookie
-        kuaishou_logger.info('cookie更新完毕！')
-        await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+                kuaishou_logger.info(f"视频正在发布中... ({attempt}/{PUBLISH_ATTEMPTS})")
+            if not published:
+                kuaishou_logger.error("多次尝试后发布失败")
+
+            await context.storage_state(path=self.account_file)  # 保存cookie
+            cookie_cache.mark_valid(self.account_file)
+            kuaishou_logger.info('cookie更新完毕！')
+            return published
+        finally:
+            # 关闭浏览器上下文，浏览器实例由连接池复用
+            await context.close()
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        self.file_path = await prepare_upload_file(self.file_path, SOCIAL_MEDIA_KUAISHOU)
+        playwright = await browser_pool.get_playwright()
+        return await self.upload(playwright)
 
     async def set_schedule_time(self, page, publish_date):
         kuaishou_logger.info("click schedule")
         publish_date_hour = publish_date.strftime("%Y-%m-%d %H:%M:%S")
         await page.locator("label:text('发布时间')").locator('xpath=following-sibling::div').locator(
             '.ant-radio-input').nth(1).click()
-        await asyncio.sleep(1)
 
-        await page.locator('div.ant-picker-input input[placeholder="选择日期时间"]').click()
-        await asyncio.sleep(1)
+        date_input = page.locator('div.ant-picker-input input[placeholder="选择日期时间"]')
+        await wait_for_state(date_input, 'visible', timeout=1000)
+        await date_input.click()
+        await wait_for_state(page.locator('div.ant-picker-dropdown'), 'visible', timeout=1000)
 
         await page.keyboard.press("Control+KeyA")
         await page.keyboard.type(str(publish_date_hour))
         await page.keyboard.press("Enter")
-        await asyncio.sleep(1)
+        await wait_for_dom_settled(page, quiet_ms=300, timeout=1000)
@@ -1,14 +1,28 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
 
-from playwright.async_api import Playwright, async_playwright
+from playwright.async_api import Playwright
 import os
-import asyncio
 
-from conf import LOCAL_CHROME_PATH
-from utils.base_social_media import set_init_script
+from conf import LOCAL_CHROME_PATH, UPLOAD_HEADLESS, PUBLISH_ATTEMPTS, PUBLISH_WAIT
+from utils.base_social_media import set_init_script, SOCIAL_MEDIA_TENCENT
+from utils.browser_pool import browser_pool
+from utils.cookie_cache import cookie_cache
+from utils.display import upload_launch_options
 from utils.files_times import get_absolute_path
 from utils.log import tencent_logger
+from utils.preflight import prepare_upload_file
+from utils.route_profiles import apply_route_profile
+from utils.upload_network import UploadNetworkMonitor
+from utils.upload_status import UploadStatusProbe
+from utils.waits import wait_for_url, wait_for_dom_settled
+
+# 上传状态检测规则，见 utils.upload_status
+TENCENT_UPLOAD_DONE = [{"selector": "div.form-btns button", "text": "发表", "enabled": True}]
+TENCENT_UPLOAD_FAILED = [[
+    {"selector": "div.status-msg.error"},
+    {"selector": "div.media-status-content div.tag-inner", "text": "删除"},
+]]
 
 
 def format_str_for_short_title(origin_title: str) -> str:
@@ -32,10 +46,11 @@ def format_str_for_short_title(origin_title: str) -> str:
 
 
 async def cookie_auth(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
+    playwright = await browser_pool.get_playwright()
+    context = await browser_pool.new_context(playwright.chromium, account_file, launch_options={'headless': True})
+    try:
         context = await set_init_script(context)
+        await apply_route_profile(context, SOCIAL_MEDIA_TENCENT)
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
@@ -47,32 +62,33 @@ async def cookie_auth(account_file):
         except:
             tencent_logger.success("[+] cookie 有效")
             return True
+    finally:
+        await context.close()
 
 
 async def get_tencent_cookie(account_file):
-    async with async_playwright() as playwright:
-        options = {
-            'args': [
-                '--lang en-GB'
-            ],
-            'headless': False,  # Set headless option here
-        }
-        # Make sure to run headed.
-        browser = await playwright.chromium.launch(**options)
-        # Setup context however you like.
-        context = await browser.new_context()  # Pass any options
-        # Pause the page, and start recording manually.
-        context = await set_init_script(context)
-        page = await context.new_page()
-        await page.goto("https://channels.weixin.qq.com")
-        await page.pause()
-        # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+    playwright = await browser_pool.get_playwright()
+    options = {
+        'args': [
+            '--lang en-GB'
+        ],
+        'headless': False,  # Set headless option here
+    }
+    # Make sure to run headed.
+    context = await browser_pool.new_context(playwright.chromium, account_file, launch_options=options, load_state=False)
+    # Pause the page, and start recording manually.
+    context = await set_init_script(context)
+    page = await context.new_page()
+    await page.goto("https://channels.weixin.qq.com")
+    await page.pause()
+    # 点击调试器的继续，保存cookie
+    await context.storage_state(path=account_file)
+    await context.close()
 
 
 async def weixin_setup(account_file, handle=False):
     account_file = get_absolute_path(account_file, "tencent_uploader")
-    if not os.path.exists(account_file) or not await cookie_auth(account_file):
+    if not os.path.exists(account_file) or not await cookie_cache.validate(account_file, cookie_auth):
         if not handle:
             # Todo alert message
             return False
@@ -90,6 +106,7 @@ class TencentVideo(object):
         self.account_file = account_file
         self.category = category
         self.local_executable_path = LOCAL_CHROME_PATH
+        self.headless = UPLOAD_HEADLESS
 
     async def set_schedule_time_tencent(self, page, publish_date):
         label_element = page.locator("label").filter(has_text="定时").nth(1)
@@ -133,46 +150,56 @@ class TencentVideo(object):
         file_input = page.locator('input[type="file"]')
         await file_input.set_input_files(self.file_path)
 
-    async def upload(self, playwright: Playwright) -> None:
+    async def upload(self, playwright: Playwright) -> bool:
         # 使用 Chromium (这里使用系统内浏览器，用chromium 会造成h264错误
-        browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path)
         # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}")
-        context = await set_init_script(context)
-
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://channels.weixin.qq.com/platform/post/create")
-        tencent_logger.info(f'[+]正在上传-------{self.title}.mp4')
-        # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
-        await page.wait_for_url("https://channels.weixin.qq.com/platform/post/create")
-        # await page.wait_for_selector('input[type="file"]', timeout=10000)
-        file_input = page.locator('input[type="file"]')
-        await file_input.set_input_files(self.file_path)
-        # 填充标题和话题
-        await self.add_title_tags(page)
-        # 添加商品
-        # await self.add_product(page)
-        # 合集功能
-        await self.add_collection(page)
-        # 原创选择
-        await self.add_original(page)
-        # 检测上传状态
-        await self.detect_upload_status(page)
-        if self.publish_date != 0:
-            await self.set_schedule_time_tencent(page, self.publish_date)
-        # 添加短标题
-        await self.add_short_title(page)
-
-        await self.click_publish(page)
-
-        await context.storage_state(path=f"{self.account_file}")  # 保存cookie
-        tencent_logger.success('  [-]cookie更新完毕！')
-        await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+        launch_options = upload_launch_options(self.headless, executable_path=self.local_executable_path)
+        context = await browser_pool.new_context(playwright.chromium, self.account_file, launch_options=launch_options)
+        try:
+            context = await set_init_script(context)
+            await apply_route_profile(context, SOCIAL_MEDIA_TENCENT)
+
+            # 创建一个新的页面
+            page = await context.new_page()
+            # 访问指定的 URL
+            await page.goto("https://channels.weixin.qq.com/platform/post/create")
+            tencent_logger.info(f'[+]正在上传-------{self.title}.mp4')
+            # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
+            try:
+                await page.wait_for_url("https://channels.weixin.qq.com/platform/post/create")
+            except Exception:
+                # 被重定向到登录页，说明 cookie 已失效
+                cookie_cache.invalidate(self.account_file)
+                raise
+            # await page.wait_for_selector('input[type="file"]', timeout=10000)
+            monitor = UploadNetworkMonitor(page, SOCIAL_MEDIA_TENCENT, logger=tencent_logger).start()
+            file_input = page.locator('input[type="file"]')
+            await file_input.set_input_files(self.file_path)
+            # 填充标题和话题
+            await self.add_title_tags(page)
+            # 添加商品
+            # await self.add_product(page)
+            # 合集功能
+            await self.add_collection(page)
+            # 原创选择
+            await self.add_original(page)
+            # 检测上传状态
+            await self.detect_upload_status(page, monitor)
+            monitor.stop()
+            if self.publish_date != 0:
+                await self.set_schedule_time_tencent(page, self.publish_date)
+            # 添加短标题
+            await self.add_short_title(page)
+
+            published = await self.click_publish(page)
+
+            await context.storage_state(path=f"{self.account_file}")  # 保存cookie
+            cookie_cache.mark_valid(self.account_file)
+            tencent_logger.success('  [-]cookie更新完毕！')
+            return published
+        finally:
+            # 关闭浏览器上下文，浏览器实例由连接池复用
+            await context.close()
 
     async def add_short_title(self, page):
         short_title_element = page.get_by_text("短标题", exact=True).locator("..").locator(
@@ -182,45 +209,36 @@ class TencentVideo(object):
             short_title = format_str_for_short_title(self.title)
             await short_title_element.fill(short_title)
 
-    async def click_publish(self, page):
-        while True:
+    async def click_publish(self, page) -> bool:
+        publish_buttion = page.locator('div.form-btns button:has-text("发表")')
+        for attempt in range(1, PUBLISH_ATTEMPTS + 1):
             try:
-                publish_buttion = page.locator('div.form-btns button:has-text("发表")')
-                if await publish_buttion.count():
+                # "发表"按钮不可用时不点击，直接等待页面跳转
+                if await publish_buttion.count() and await publish_buttion.is_enabled():
                     await publish_buttion.click()
-                await page.wait_for_url("https://channels.weixin.qq.com/platform/post/list", timeout=1500)
-                tencent_logger.success("  [-]视频发布成功")
-                break
             except Exception as e:
-                current_url = page.url
-                if "https://channels.weixin.qq.com/platform/post/list" in current_url:
-                    tencent_logger.success("  [-]视频发布成功")
-                    break
-                else:
-                    tencent_logger.exception(f"  [-] Exception: {e}")
-                    tencent_logger.info("  [-] 视频正在发布中...")
-                    await asyncio.sleep(0.5)
-
-    async def detect_upload_status(self, page):
+                tencent_logger.warning(f"  [-] 点击发表失败: {e}")
+            if await wait_for_url(page, r"channels\.weixin\.qq\.com/platform/post/list", timeout=PUBLISH_WAIT * 1000):
+                tencent_logger.success("  [-]视频发布成功")
+                return True
+            tencent_logger.info(f"  [-] 视频正在发布中... ({attempt}/{PUBLISH_ATTEMPTS})")
+        tencent_logger.error("  [-] 多次尝试后发布失败")
+        return False
+
+    async def detect_upload_status(self, page, monitor=None):
+        probe = UploadStatusProbe(page, TENCENT_UPLOAD_DONE, TENCENT_UPLOAD_FAILED, logger=tencent_logger)
         while True:
-            # 匹配删除按钮，代表视频上传完毕，如果不存在，代表视频正在上传，则等待
-            try:
-                # 匹配删除按钮，代表视频上传完毕
-                if "weui-desktop-btn_disabled" not in await page.get_by_role("button", name="发表").get_attribute(
-                        'class'):
-                    tencent_logger.info("  [-]视频上传完毕")
-                    break
-                else:
-                    tencent_logger.info("  [-] 正在上传视频中...")
-                    await asyncio.sleep(2)
-                    # 出错了视频出错
-                    if await page.locator('div.status-msg.error').count() and await page.locator(
-                            'div.media-status-content div.tag-inner:has-text("删除")').count():
-                        tencent_logger.error("  [-] 发现上传出错了...准备重试")
-                        await self.handle_upload_error(page)
-            except:
-                tencent_logger.info("  [-] 正在上传视频中...")
-                await asyncio.sleep(2)
+            # "发表"按钮可点击代表视频上传完毕，出现错误提示和删除按钮代表上传出错
+            state = await probe.wait(poll_interval=5, monitor=monitor)
+            if state["done"]:
+                tencent_logger.info("  [-]视频上传完毕")
+                break
+            if state["failed"]:
+                tencent_logger.error("  [-] 发现上传出错了...准备重试")
+                if monitor is not None:
+                    monitor.reset()
+                await self.handle_upload_error(page)
+                await wait_for_dom_settled(page, quiet_ms=500, timeout=2000)
 
     async def add_title_tags(self, page):
         await page.locator("div.input-editor").click()
@@ -258,10 +276,11 @@ class TencentVideo(object):
                 await page.locator('div.form-content:visible').click()  # 下拉菜单
                 await page.locator(
                     f'div.form-content:visible ul.weui-desktop-dropdown__list li.weui-desktop-dropdown__list-ele:has-text("{self.category}")').first.click()
-                await page.wait_for_timeout(1000)
+                await wait_for_dom_settled(page, "div.declare-original-dialog", quiet_ms=300, timeout=1000)
             if await page.locator('button:has-text("声明原创"):visible').count():
                 await page.locator('button:has-text("声明原创"):visible').click()
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        self.file_path = await prepare_upload_file(self.file_path, SOCIAL_MEDIA_TENCENT)
+        playwright = await browser_pool.get_playwright()
+        return await self.upload(playwright)
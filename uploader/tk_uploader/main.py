@@ -2,20 +2,34 @@
 import re
 from datetime import datetime
 
-from playwright.async_api import Playwright, async_playwright
+from playwright.async_api import Playwright
 import os
-import asyncio
+
+from conf import UPLOAD_HEADLESS, PUBLISH_ATTEMPTS, PUBLISH_WAIT
 from uploader.tk_uploader.tk_config import Tk_Locator
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, SOCIAL_MEDIA_TIKTOK
+from utils.browser_pool import browser_pool
+from utils.cookie_cache import cookie_cache
+from utils.display import upload_launch_options
 from utils.files_times import get_absolute_path
 from utils.log import tiktok_logger
+from utils.preflight import prepare_upload_file
+from utils.route_profiles import apply_route_profile
+from utils.upload_network import UploadNetworkMonitor
+from utils.upload_status import UploadStatusProbe, get_upload_frame
+from utils.waits import wait_for_state, wait_for_element_settled
+
+# upload status rules, see utils.upload_status
+TK_UPLOAD_DONE = [{"selector": "div.btn-post > button", "enabled": True}]
+TK_UPLOAD_FAILED = [{"selector": 'button[aria-label="Select file"]'}]
 
 
 async def cookie_auth(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.firefox.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
+    playwright = await browser_pool.get_playwright()
+    context = await browser_pool.new_context(playwright.firefox, account_file, launch_options={'headless': True})
+    try:
         context = await set_init_script(context)
+        await apply_route_profile(context, SOCIAL_MEDIA_TIKTOK)
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
@@ -35,11 +49,13 @@ async def cookie_auth(account_file):
         except:
             tiktok_logger.success("[+] cookie valid")
             return True
+    finally:
+        await context.close()
 
 
 async def tiktok_setup(account_file, handle=False):
     account_file = get_absolute_path(account_file, "tk_uploader")
-    if not os.path.exists(account_file) or not await cookie_auth(account_file):
+    if not os.path.exists(account_file) or not await cookie_cache.validate(account_file, cookie_auth):
         if not handle:
             return False
         tiktok_logger.info('[+] cookie file is not existed or expired. Now open the browser auto. Please login with your way(gmail phone, whatever, the cookie file will generated after login')
@@ -48,24 +64,23 @@ async def tiktok_setup(account_file, handle=False):
 
 
 async def get_tiktok_cookie(account_file):
-    async with async_playwright() as playwright:
-        options = {
-            'args': [
-                '--lang en-GB',
-            ],
-            'headless': False,  # Set headless option here
-        }
-        # Make sure to run headed.
-        browser = await playwright.firefox.launch(**options)
-        # Setup context however you like.
-        context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
-        # Pause the page, and start recording manually.
-        page = await context.new_page()
-        await page.goto("https://www.tiktok.com/login?lang=en")
-        await page.pause()
-        # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+    playwright = await browser_pool.get_playwright()
+    options = {
+        'args': [
+            '--lang en-GB',
+        ],
+        'headless': False,  # Set headless option here
+    }
+    # Make sure to run headed.
+    context = await browser_pool.new_context(playwright.firefox, account_file, launch_options=options, load_state=False)
+    context = await set_init_script(context)
+    # Pause the page, and start recording manually.
+    page = await context.new_page()
+    await page.goto("https://www.tiktok.com/login?lang=en")
+    await page.pause()
+    # 点击调试器的继续，保存cookie
+    await context.storage_state(path=account_file)
+    await context.close()
 
 
 class TiktokVideo(object):
@@ -75,6 +90,7 @@ class TiktokVideo(object):
         self.tags = tags
         self.publish_date = publish_date
         self.account_file = account_file
+        self.headless = UPLOAD_HEADLESS
         self.locator_base = None
 
 
@@ -122,10 +138,11 @@ class TiktokVideo(object):
         # pick hour first
         await self.locator_base.locator(hour_selector).click()
         # click time button again
-        # 等待某个特定的元素出现或状态变化，表明UI已更新
-        await page.wait_for_timeout(1000)  # 等待500毫秒
+        # 等待时间选择器收起后再重新打开
+        await wait_for_state(self.locator_base.locator(hour_selector), 'hidden', timeout=1000)
         await scheduled_picker.locator('div.TUXInputBox').nth(0).click()
         # pick minutes after
+        await wait_for_state(self.locator_base.locator(minute_selector), 'visible', timeout=1000)
         await self.locator_base.locator(minute_selector).click()
 
         # click title to remove the focus.
@@ -139,48 +156,58 @@ class TiktokVideo(object):
         file_chooser = await fc_info.value
         await file_chooser.set_files(self.file_path)
 
-    async def upload(self, playwright: Playwright) -> None:
-        browser = await playwright.firefox.launch(headless=False)
-        context = await browser.new_context(storage_state=f"{self.account_file}")
-        context = await set_init_script(context)
-        page = await context.new_page()
+    async def upload(self, playwright: Playwright) -> bool:
+        context = await browser_pool.new_context(playwright.firefox, self.account_file,
+                                                  launch_options=upload_launch_options(self.headless, engine="firefox"))
+        try:
+            context = await set_init_script(context)
+            await apply_route_profile(context, SOCIAL_MEDIA_TIKTOK)
+            page = await context.new_page()
 
-        await page.goto("https://www.tiktok.com/creator-center/upload")
-        tiktok_logger.info(f'[+]Uploading-------{self.title}.mp4')
+            await page.goto("https://www.tiktok.com/creator-center/upload")
+            tiktok_logger.info(f'[+]Uploading-------{self.title}.mp4')
 
-        await page.wait_for_url("https://www.tiktok.com/tiktokstudio/upload", timeout=10000)
+            try:
+                await page.wait_for_url("https://www.tiktok.com/tiktokstudio/upload", timeout=10000)
+            except Exception:
+                # redirected to the login page, the cookie is expired
+                cookie_cache.invalidate(self.account_file)
+                raise
 
-        try:
-            await page.wait_for_selector('iframe[data-tt="Upload_index_iframe"], div.upload-container', timeout=10000)
-            tiktok_logger.info("Either iframe or div appeared.")
-        except Exception as e:
-            tiktok_logger.error("Neither iframe nor div appeared within the timeout.")
+            try:
+                await page.wait_for_selector('iframe[data-tt="Upload_index_iframe"], div.upload-container', timeout=10000)
+                tiktok_logger.info("Either iframe or div appeared.")
+            except Exception as e:
+                tiktok_logger.error("Neither iframe nor div appeared within the timeout.")
 
-        await self.choose_base_locator(page)
+            await self.choose_base_locator(page)
 
-        upload_button = self.locator_base.locator(
-            'button:has-text("Select video"):visible')
-        await upload_button.wait_for(state='visible')  # 确保按钮可见
+            upload_button = self.locator_base.locator(
+                'button:has-text("Select video"):visible')
+            await upload_button.wait_for(state='visible')  # 确保按钮可见
 
-        async with page.expect_file_chooser() as fc_info:
-            await upload_button.click()
-        file_chooser = await fc_info.value
-        await file_chooser.set_files(self.file_path)
+            monitor = UploadNetworkMonitor(page, SOCIAL_MEDIA_TIKTOK, logger=tiktok_logger).start()
+            async with page.expect_file_chooser() as fc_info:
+                await upload_button.click()
+            file_chooser = await fc_info.value
+            await file_chooser.set_files(self.file_path)
 
-        await self.add_title_tags(page)
-        # detact upload status
-        await self.detect_upload_status(page)
-        if self.publish_date != 0:
-            await self.set_schedule_time(page, self.publish_date)
+            await self.add_title_tags(page)
+            # detact upload status
+            await self.detect_upload_status(page, monitor)
+            monitor.stop()
+            if self.publish_date != 0:
+                await self.set_schedule_time(page, self.publish_date)
 
-        await self.click_publish(page)
+            published = await self.click_publish(page)
 
-        await context.storage_state(path=f"{self.account_file}")  # save cookie
-        tiktok_logger.info('  [-] update cookie！')
-        await asyncio.sleep(2)  # close delay for look the video status
-        # close all
-        await context.close()
-        await browser.close()
+            await context.storage_state(path=f"{self.account_file}")  # save cookie
+            cookie_cache.mark_valid(self.account_file)
+            tiktok_logger.info('  [-] update cookie！')
+            return published
+        finally:
+            # close context, the browser is kept warm by the pool
+            await context.close()
 
     async def add_title_tags(self, page):
 
@@ -195,10 +222,10 @@ class TiktokVideo(object):
 
         await page.keyboard.press("End")
 
-        await page.wait_for_timeout(1000)  # 等待1秒
+        await wait_for_element_settled(editor_locator, quiet_ms=300, timeout=1000)
 
         await page.keyboard.insert_text(self.title)
-        await page.wait_for_timeout(1000)  # 等待1秒
+        await wait_for_element_settled(editor_locator, quiet_ms=300, timeout=1000)
         await page.keyboard.press("End")
 
         await page.keyboard.press("Enter")
@@ -207,50 +234,49 @@ class TiktokVideo(object):
         for index, tag in enumerate(self.tags, start=1):
             tiktok_logger.info("Setting the %s tag" % index)
             await page.keyboard.press("End")
-            await page.wait_for_timeout(1000)  # 等待1秒
             await page.keyboard.insert_text("#" + tag + " ")
             await page.keyboard.press("Space")
-            await page.wait_for_timeout(1000)  # 等待1秒
+            # wait for the hashtag suggestion list to finish rendering
+            await wait_for_element_settled(editor_locator, quiet_ms=300, timeout=1000)
 
             await page.keyboard.press("Backspace")
             await page.keyboard.press("End")
 
-    async def click_publish(self, page):
+    async def click_publish(self, page) -> bool:
         success_flag_div = '#\\:r9\\:'
-        while True:
+        for attempt in range(1, PUBLISH_ATTEMPTS + 1):
             try:
                 publish_button = self.locator_base.locator('div.btn-post')
                 if await publish_button.count():
                     await publish_button.click()
-
-                await self.locator_base.locator(success_flag_div).wait_for(state="visible", timeout=3000)
-                tiktok_logger.success("  [-] video published success")
-                break
             except Exception as e:
-                if await self.locator_base.locator(success_flag_div).count():
-                    tiktok_logger.success("  [-]video published success")
-                    break
-                else:
-                    tiktok_logger.exception(f"  [-] Exception: {e}")
-                    tiktok_logger.info("  [-] video publishing")
-                    await page.screenshot(full_page=True)
-                    await asyncio.sleep(0.5)
-
-    async def detect_upload_status(self, page):
+                tiktok_logger.warning(f"  [-] click publish failed: {e}")
+            # wait for the success flag instead of polling
+            if await wait_for_state(self.locator_base.locator(success_flag_div), 'visible',
+                                    timeout=PUBLISH_WAIT * 1000):
+                tiktok_logger.success("  [-] video published success")
+                return True
+            tiktok_logger.info(f"  [-] video publishing ({attempt}/{PUBLISH_ATTEMPTS})")
+        tiktok_logger.error("  [-] video not published after all attempts")
+        await page.screenshot(full_page=True)
+        return False
+
+    async def detect_upload_status(self, page, monitor=None):
+        # the upload form may live in an iframe, evaluate the probe inside it
+        frame = await get_upload_frame(page, Tk_Locator.tk_iframe)
+        probe = UploadStatusProbe(page, TK_UPLOAD_DONE, TK_UPLOAD_FAILED, frame=frame, logger=tiktok_logger)
         while True:
-            try:
-                if await self.locator_base.locator('div.btn-post > button').get_attribute("disabled") is None:
-                    tiktok_logger.info("  [-]video uploaded.")
-                    break
-                else:
-                    tiktok_logger.info("  [-] video uploading...")
-                    await asyncio.sleep(2)
-                    if await self.locator_base.locator('button[aria-label="Select file"]').count():
-                        tiktok_logger.info("  [-] found some error while uploading now retry...")
-                        await self.handle_upload_error(page)
-            except:
-                tiktok_logger.info("  [-] video uploading...")
-                await asyncio.sleep(2)
+            state = await probe.wait(poll_interval=5, monitor=monitor)
+            if state["done"]:
+                tiktok_logger.info("  [-]video uploaded.")
+                break
+            if state["failed"]:
+                tiktok_logger.info("  [-] found some error while uploading now retry...")
+                if monitor is not None:
+                    monitor.reset()
+                await self.handle_upload_error(page)
+                await wait_for_state(self.locator_base.locator('button[aria-label="Select file"]'), 'hidden',
+                                     timeout=3000)
 
     async def choose_base_locator(self, page):
         # await page.wait_for_selector('div.upload-container')
@@ -260,6 +286,7 @@ class TiktokVideo(object):
             self.locator_base = page.locator(Tk_Locator.default) 
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        self.file_path = await prepare_upload_file(self.file_path, SOCIAL_MEDIA_TIKTOK)
+        playwright = await browser_pool.get_playwright()
+        return await self.upload(playwright)
 
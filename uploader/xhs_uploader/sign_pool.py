@@ -0,0 +1,241 @@
+import asyncio
+import atexit
+import threading
+import time
+from collections import OrderedDict
+
+from playwright.async_api import async_playwright
+
+from conf import XHS_SIGN_PAGES, XHS_SIGN_MAX_ACCOUNTS, XHS_SIGN_PAGE_MAX_USES, XHS_SIGN_PAGE_MAX_AGE, \
+    XHS_SIGN_RETRIES, XHS_SIGN_HEADLESS
+from utils.base_social_media import get_stealth_script
+from utils.log import xhs_logger
+
+XHS_HOME = "https://www.xiaohongshu.com"
+SIGN_FUNCTION_READY = "() => typeof window._webmsxyw === 'function'"
+# 一次 evaluate 签名多个请求，签名服务合并同时到达的请求时使用
+SIGN_EXPRESSION = "(items) => items.map(([url, data]) => window._webmsxyw(url, data))"
+
+
+class SignError(Exception):
+    pass
+
+
+class SignPage(object):
+    """A page with xiaohongshu.com loaded and `window._webmsxyw` available."""
+
+    def __init__(self, page):
+        self.page = page
+        self.created_at = time.monotonic()
+        self.uses = 0
+
+    def expired(self, max_uses: int, max_age: float) -> bool:
+        return self.page.is_closed() or self.uses >= max_uses or time.monotonic() - self.created_at >= max_age
+
+
+class AccountPages(object):
+    """The browser context of one a1 cookie and its idle warm pages."""
+
+    def __init__(self, context, size: int):
+        self.context = context
+        self.idle = asyncio.Queue()
+        self.slots = asyncio.Semaphore(size)
+
+
+class SignPagePool(object):
+    """
+    Warm signing pages for the XHS web API, replacing a browser launch per signature.
+
+    Each a1 cookie gets its own browser context holding up to `pages` pages with the home page
+    loaded, so a signature is a single `evaluate` call. Pages are recycled after `max_uses`
+    signatures or `max_age` seconds and replaced when they crash or lose the sign function.
+    Contexts of the least recently used a1 are closed beyond `max_accounts`.
+
+    Playwright runs on a private event loop thread, so `sign` can be passed to
+    `XhsClient(sign=...)` from any thread and `sign_async` awaited from any event loop.
+    """
+
+    def __init__(self, pages: int = XHS_SIGN_PAGES, max_accounts: int = XHS_SIGN_MAX_ACCOUNTS,
+                 max_uses: int = XHS_SIGN_PAGE_MAX_USES, max_age: float = XHS_SIGN_PAGE_MAX_AGE,
+                 retries: int = XHS_SIGN_RETRIES, headless: bool = XHS_SIGN_HEADLESS):
+        self.pages = max(1, pages)
+        self.max_accounts = max(1, max_accounts)
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.retries = max(1, retries)
+        self.headless = headless
+        self._thread_lock = threading.Lock()
+        self._loop = None
+        self._playwright = None
+        self._browser = None
+        self._lock = None
+        self._accounts = OrderedDict()
+        self.signs = 0
+        self.warmups = 0
+        self.recycles = 0
+        self.failures = 0
+        self.evaluations = 0
+        self.sign_seconds = 0.0
+        atexit.register(self.close)
+
+    def _ensure_loop(self):
+        with self._thread_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="xhs-sign", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def sign(self, uri, data=None, a1="", web_session=""):
+        """Synchronous signature, the signature of `XhsClient(sign=...)`."""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._sign([(uri, data)], a1), loop).result()[0]
+
+    async def sign_async(self, uri, data=None, a1="", web_session=""):
+        return (await self.sign_batch_async([(uri, data)], a1))[0]
+
+    async def sign_batch_async(self, items, a1="") -> list:
+        """
+        Sign several requests of the same a1 with a single `evaluate` call.
+        :param items: list of (uri, data)
+        :returns: the headers of each item, in order
+        """
+        loop = self._ensure_loop()
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._sign(list(items), a1), loop))
+
+    async def _get_browser(self):
+        if self._browser is None or not self._browser.is_connected():
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            # 如果一直失败可尝试设置 XHS_SIGN_HEADLESS = False 查看浏览器状态
+            self._browser = await self._playwright.chromium.launch(headless=self.headless)
+            self._accounts.clear()
+            xhs_logger.info("[+] 已启动签名浏览器")
+        return self._browser
+
+    async def _account(self, a1) -> AccountPages:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            browser = await self._get_browser()
+            account = self._accounts.get(a1)
+            if account is not None:
+                self._accounts.move_to_end(a1)
+                return account
+            context = await browser.new_context()
+            await context.add_init_script(script=get_stealth_script()[0])
+            # 先写入 a1 再打开页面，签名使用该账号的 a1，不需要再刷新
+            await context.add_cookies([{'name': 'a1', 'value': a1, 'domain': ".xiaohongshu.com", 'path': "/"}])
+            account = self._accounts[a1] = AccountPages(context, self.pages)
+            while len(self._accounts) > self.max_accounts:
+                _, evicted = self._accounts.popitem(last=False)
+                await evicted.context.close()
+            return account
+
+    async def _warm_page(self, account: AccountPages) -> SignPage:
+        page = await account.context.new_page()
+        try:
+            await page.goto(XHS_HOME)
+            await page.wait_for_function(SIGN_FUNCTION_READY, timeout=15000)
+        except Exception:
+            await page.close()
+            raise
+        self.warmups += 1
+        return SignPage(page)
+
+    async def _acquire(self, account: AccountPages) -> SignPage:
+        await account.slots.acquire()
+        try:
+            while not account.idle.empty():
+                sign_page = account.idle.get_nowait()
+                if not sign_page.expired(self.max_uses, self.max_age):
+                    return sign_page
+                self.recycles += 1
+                await self._discard(sign_page)
+            return await self._warm_page(account)
+        except BaseException:
+            account.slots.release()
+            raise
+
+    @staticmethod
+    async def _discard(sign_page: SignPage):
+        try:
+            await sign_page.page.close()
+        except Exception:
+            pass
+
+    async def _sign(self, items: list, a1) -> list:
+        error = None
+        for _ in range(self.retries):
+            try:
+                account = await self._account(a1)
+                sign_page = await self._acquire(account)
+            except Exception as e:
+                error = e
+                self.failures += 1
+                continue
+            start = time.perf_counter()
+            try:
+                results = await sign_page.page.evaluate(SIGN_EXPRESSION, items)
+            except Exception as e:
+                # 页面崩溃、跳转或 window._webmsxyw 丢失，换一个新页面重试
+                error = e
+                self.failures += 1
+                await self._discard(sign_page)
+            else:
+                sign_page.uses += 1
+                account.idle.put_nowait(sign_page)
+                self.signs += len(items)
+                self.evaluations += 1
+                self.sign_seconds += time.perf_counter() - start
+                return [{
+                    "x-s": encrypt_params["X-s"],
+                    "x-t": str(encrypt_params["X-t"])
+                } for encrypt_params in results]
+            finally:
+                account.slots.release()
+        xhs_logger.error(f"[+] 签名失败，已重试 {self.retries} 次: {error}")
+        raise SignError(f"sign failed after {self.retries} attempts: {error}")
+
+    def stats(self) -> dict:
+        return {
+            "signs": self.signs,
+            "evaluations": self.evaluations,
+            "warmups": self.warmups,
+            "recycles": self.recycles,
+            "failures": self.failures,
+            "avg_evaluate_ms": round(self.sign_seconds / self.evaluations * 1000, 3) if self.evaluations else None,
+        }
+
+    async def _close(self):
+        for account in self._accounts.values():
+            try:
+                await account.context.close()
+            except Exception:
+                pass
+        self._accounts.clear()
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        self._lock = None
+
+    def close(self, timeout: float = 10):
+        with self._thread_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close(), loop).result(timeout)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        xhs_logger.info(f"[+] 签名页面池已关闭: {self.stats()}")
+
+
+sign_pool = SignPagePool()
@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from conf import XHS_SERVER, XHS_SIGN_BATCH_SIZE, XHS_SIGN_BATCH_WINDOW
+from uploader.xhs_uploader.sign_pool import sign_pool
+from utils.log import xhs_logger
+
+MAX_BODY_SIZE = 1024 * 1024
+# 最近多少个请求参与延迟分位数统计
+LATENCY_WINDOW = 10000
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class SignBatcher(object):
+    """
+    Collect the sign requests of one a1 that arrive within `window` seconds, up to `size`,
+    and sign them with a single evaluate on a warm page.
+    """
+
+    def __init__(self, pool=sign_pool, size: int = XHS_SIGN_BATCH_SIZE, window: float = XHS_SIGN_BATCH_WINDOW):
+        self.pool = pool
+        self.size = max(1, size)
+        self.window = window
+        self._pending = {}
+        self._timers = {}
+        self.batches = 0
+        self.batched = 0
+
+    async def sign(self, uri, data=None, a1=""):
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(a1, [])
+        pending.append((uri, data, future))
+        if len(pending) >= self.size:
+            self._flush(a1)
+        elif len(pending) == 1:
+            self._timers[a1] = asyncio.get_running_loop().call_later(self.window, self._flush, a1)
+        return await future
+
+    def _flush(self, a1):
+        timer = self._timers.pop(a1, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(a1, None)
+        if batch:
+            asyncio.ensure_future(self._run(a1, batch))
+
+    async def _run(self, a1, batch):
+        self.batches += 1
+        self.batched += len(batch)
+        try:
+            results = await self.pool.sign_batch_async([(uri, data) for uri, data, _ in batch], a1)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class SignMetrics(object):
+    """Request counters and latency percentiles of the sign server."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.started_at = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self._latencies = deque(maxlen=window)
+        self._finished = deque(maxlen=window)
+
+    def record(self, seconds: float, ok: bool = True):
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+        self._latencies.append(seconds)
+        self._finished.append(time.monotonic())
+
+    @staticmethod
+    def percentile(values: list, percent: float):
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self._latencies)
+        uptime = time.monotonic() - self.started_at
+        recent = (len(self._finished) - 1) / (self._finished[-1] - self._finished[0]) \
+            if len(self._finished) > 1 and self._finished[-1] > self._finished[0] else None
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "uptime": round(uptime, 1),
+            "signs_per_second": round(self.requests / uptime, 1) if uptime else None,
+            "recent_signs_per_second": round(recent, 1) if recent else None,
+            **{f"p{percent}_ms": round(self.percentile(latencies, percent) * 1000, 3) if latencies else None
+               for percent in (50, 90, 99)},
+        }
+
+
+class SignServer(object):
+    """
+    Minimal HTTP/1.1 keep-alive server for `main.sign`, backed by the warm page pool.
+    POST /sign {"uri", "data", "a1", "web_session"} returns {"x-s", "x-t"}, GET /stats returns the metrics.
+    """
+
+    def __init__(self, batcher: SignBatcher = None):
+        self.batcher = batcher or SignBatcher()
+        self.metrics = SignMetrics()
+
+    def stats(self) -> dict:
+        average_batch = self.batcher.batched / self.batcher.batches if self.batcher.batches else None
+        return {**self.metrics.snapshot(), "batches": self.batcher.batches,
+                "avg_batch_size": round(average_batch, 2) if average_batch else None,
+                "pool": self.batcher.pool.stats()}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, {"error": "body too large"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await self._dispatch(method, urlparse(target).path, body)
+                close = headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, payload, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, body: bytes):
+        if method == "GET" and path == "/stats":
+            return 200, self.stats()
+        if method != "POST" or path != "/sign":
+            return 404, {"error": f"{method} {path} not found"}
+        start = time.perf_counter()
+        try:
+            request = json.loads(body)
+            result = await self.batcher.sign(request["uri"], request.get("data"), request.get("a1") or "")
+        except (ValueError, KeyError, TypeError) as e:
+            self.metrics.record(time.perf_counter() - start, ok=False)
+            return 400, {"error": f"bad request: {e}"}
+        except Exception as e:
+            self.metrics.record(time.perf_counter() - start, ok=False)
+            xhs_logger.error(f"[+] 签名服务出错: {e}")
+            return 500, {"error": str(e)}
+        self.metrics.record(time.perf_counter() - start)
+        return 200, result
+
+    @staticmethod
+    async def _respond(writer, status: int, payload: dict, close: bool = False):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        xhs_logger.info(f"[+] 签名服务已启动 http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    default = urlparse(XHS_SERVER)
+    parser = argparse.ArgumentParser(description="小红书本地签名服务，供 main.sign 使用")
+    parser.add_argument("--host", default=default.hostname or "127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=default.port or 11901, help="监听端口，默认取自 XHS_SERVER")
+    parser.add_argument("--batch-size", type=int, default=XHS_SIGN_BATCH_SIZE, help="每批最多合并的签名请求数")
+    parser.add_argument("--batch-window", type=float, default=XHS_SIGN_BATCH_WINDOW, help="合并请求的等待时间(秒)")
+    args = parser.parse_args()
+    server = SignServer(SignBatcher(size=args.batch_size, window=args.batch_window))
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        xhs_logger.info(f"[+] 签名服务已停止: {server.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from conf import XHS_TOPIC_CACHE_FILE, XHS_TOPIC_CACHE_TTL, XHS_TOPIC_CACHE_EMPTY_TTL, XHS_TOPIC_CACHE_MAX, \
+    XHS_TOPIC_WORKERS
+from utils.log import xhs_logger
+
+# 每个标签只保存前几个建议话题
+TOPICS_PER_TAG = 5
+
+
+def normalize_tag(tag: str) -> str:
+    """Full-width / half-width, case and surrounding '#' or whitespace do not make a different tag."""
+    return unicodedata.normalize("NFKC", tag).strip().strip("#").strip().lower()
+
+
+class TopicCache(object):
+    """
+    Persistent cache of `XhsClient.get_suggest_topic` results, keyed by normalized tag.
+
+    Entries expire after `ttl` seconds, tags without any suggestion after `empty_ttl`.
+    At most `max_entries` tags are kept, the least recently used are dropped on save.
+    """
+
+    def __init__(self, cache_file=XHS_TOPIC_CACHE_FILE, ttl: float = XHS_TOPIC_CACHE_TTL,
+                 empty_ttl: float = XHS_TOPIC_CACHE_EMPTY_TTL, max_entries: int = XHS_TOPIC_CACHE_MAX):
+        self.cache_file = Path(cache_file)
+        self.ttl = ttl
+        self.empty_ttl = empty_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        if len(self._entries) > self.max_entries:
+            recent = sorted(self._entries.items(), key=lambda item: item[1]["used_at"], reverse=True)
+            self._entries = dict(recent[:self.max_entries])
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_file, self.cache_file)
+
+    def get(self, tag):
+        """:returns: the cached suggestions of `tag`, None when it has to be fetched"""
+        key = normalize_tag(tag)
+        with self._lock:
+            entry = self._load().get(key)
+            now = time.time()
+            if entry is None or now - entry["fetched_at"] >= (self.ttl if entry["topics"] else self.empty_ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["used_at"] = now
+            return entry["topics"]
+
+    def put_many(self, results: dict):
+        """Store {tag: suggestions} and write the cache file once."""
+        now = time.time()
+        with self._lock:
+            entries = self._load()
+            for tag, topics in results.items():
+                entries[normalize_tag(tag)] = {"topics": (topics or [])[:TOPICS_PER_TAG], "fetched_at": now,
+                                               "used_at": now}
+            self._save()
+
+    def resolve(self, client, tags, workers: int = XHS_TOPIC_WORKERS) -> dict:
+        """
+        Look up the suggested topics of all `tags` at once, fetching each missing tag only once.
+        :param client: XhsClient, its cookie and sign function are reused by the worker threads
+        :returns: {normalized tag: suggestions}
+        """
+        resolved, missing = {}, {}
+        for tag in tags:
+            key = normalize_tag(tag)
+            if not key or key in resolved or key in missing:
+                continue
+            topics = self.get(key)
+            if topics is None:
+                missing[key] = tag
+            else:
+                resolved[key] = topics
+        fetched = {}
+        if missing:
+            start = time.perf_counter()
+            fetched = dict(zip(missing, self._fetch(client, list(missing.values()), workers)))
+            xhs_logger.info(f"[+] 已查询 {len(missing)} 个话题，用时 {time.perf_counter() - start:.1f}s")
+        # 查询失败的标签不写入缓存，下次重新查询；同时保存命中项的使用时间
+        self.put_many({key: topics for key, topics in fetched.items() if topics is not None})
+        resolved.update((key, topics or []) for key, topics in fetched.items())
+        xhs_logger.info(f"[+] 话题缓存 {self.stats()}")
+        return resolved
+
+    @staticmethod
+    def _fetch(client, tags: list, workers: int) -> list:
+        if workers <= 1 or len(tags) == 1:
+            return [TopicCache._suggest(client, tag) for tag in tags]
+        # XhsClient 在共享的 session 上设置签名请求头，不能跨线程共用，每个线程使用自己的实例
+        local = threading.local()
+
+        def suggest(tag):
+            if not hasattr(local, "client"):
+                local.client = type(client)(client.cookie, sign=client.external_sign, timeout=client.timeout)
+            return TopicCache._suggest(local.client, tag)
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(tags)), thread_name_prefix="xhs-topic") as pool:
+            return list(pool.map(suggest, tags))
+
+    @staticmethod
+    def _suggest(client, tag):
+        try:
+            return client.get_suggest_topic(tag)
+        except Exception as e:
+            xhs_logger.warning(f"[+] 查询话题失败 {tag}: {e}")
+            return None
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+topic_cache = TopicCache()
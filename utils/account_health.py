@@ -0,0 +1,81 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from conf import BASE_DIR, ACCOUNT_CHECK_WORKERS
+from utils.base_social_media import get_supported_social_media
+from utils.cookie_cache import cookie_cache
+
+
+def find_account_files(cookie_dir=None, platforms=None) -> list:
+    """
+    Find stored accounts named `cookies/<platform>_<account>.json`.
+    :returns: list of (platform, account_name, account_file)
+    """
+    cookie_dir = Path(cookie_dir or BASE_DIR / "cookies")
+    platforms = platforms or get_supported_social_media()
+    accounts = []
+    for account_file in sorted(cookie_dir.glob("*_*.json")):
+        platform, account_name = account_file.stem.split("_", 1)
+        if platform in platforms:
+            accounts.append((platform, account_name, account_file))
+    return accounts
+
+
+async def _check_one(platform, account_name, account_file, auth_func, semaphore) -> dict:
+    async with semaphore:
+        start = time.perf_counter()
+        error = None
+        try:
+            valid = bool(await auth_func(str(account_file)))
+        except Exception as e:
+            valid = False
+            error = str(e)
+        latency = time.perf_counter() - start
+    # 体检结果顺便刷新 cookie 校验缓存
+    if valid:
+        cookie_cache.mark_valid(account_file)
+    else:
+        cookie_cache.invalidate(account_file)
+    return {
+        "platform": platform,
+        "account": account_name,
+        "account_file": str(account_file),
+        "valid": valid,
+        "latency": round(latency, 3),
+        "error": error,
+    }
+
+
+async def check_accounts(auth_funcs: dict, platforms=None, workers: int = ACCOUNT_CHECK_WORKERS, cookie_dir=None) -> list:
+    """
+    Validate every stored account concurrently, at most `workers` checks per platform at a time.
+    :param auth_funcs: platform name -> `cookie_auth` coroutine function
+    :returns: one result dict per account, in the order of `find_account_files`
+    """
+    accounts = find_account_files(cookie_dir, platforms or list(auth_funcs))
+    semaphores = {platform: asyncio.Semaphore(max(1, workers)) for platform in auth_funcs}
+    tasks = [
+        _check_one(platform, account_name, account_file, auth_funcs[platform], semaphores[platform])
+        for platform, account_name, account_file in accounts
+        if platform in auth_funcs
+    ]
+    return list(await asyncio.gather(*tasks))
+
+
+def format_results_table(results: list) -> str:
+    headers = ["platform", "account", "valid", "latency(s)", "error"]
+    rows = [[r["platform"], r["account"], "yes" if r["valid"] else "no", f'{r["latency"]:.2f}', r["error"] or ""]
+            for r in results]
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    lines = ["  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)).rstrip()
+             for row in [headers, ["-" * width for width in widths]] + rows]
+    return "\n".join(lines)
+
+
+def write_results(results: list, output_file):
+    output_file = Path(output_file)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump({"checked_at": int(time.time()), "results": results}, f, ensure_ascii=False, indent=2)
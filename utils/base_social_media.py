@@ -1,5 +1,7 @@
+import hashlib
+import re
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 
 from conf import BASE_DIR
 
@@ -8,6 +10,7 @@ SOCIAL_MEDIA_TENCENT = "tencent"
 SOCIAL_MEDIA_TIKTOK = "tiktok"
 SOCIAL_MEDIA_BILIBILI = "bilibili"
 SOCIAL_MEDIA_KUAISHOU = "kuaishou"
+SOCIAL_MEDIA_XHS = "xhs"
 
 
 def get_supported_social_media() -> List[str]:
@@ -18,7 +21,26 @@ def get_cli_action() -> List[str]:
     return ["upload", "login", "watch"]
 
 
+STEALTH_JS_PATH = Path(BASE_DIR / "utils/stealth.min.js")
+_stealth_script = None
+
+
+def get_stealth_script(minify: bool = True) -> Tuple[str, str]:
+    """
+    Load stealth.min.js once per process and keep it in memory.
+    :param minify: strip the leading license banner and surrounding whitespace
+    :returns: script source and its sha256 hex digest
+    """
+    global _stealth_script
+    if _stealth_script is None or _stealth_script[0] != minify:
+        source = STEALTH_JS_PATH.read_text(encoding="utf-8")
+        if minify:
+            source = re.sub(r"^\s*/\*!.*?\*/", "", source, count=1, flags=re.S).strip()
+        _stealth_script = (minify, source, hashlib.sha256(source.encode("utf-8")).hexdigest())
+    return _stealth_script[1], _stealth_script[2]
+
+
 async def set_init_script(context):
-    stealth_js_path = Path(BASE_DIR / "utils/stealth.min.js")
-    await context.add_init_script(path=stealth_js_path)
+    script, _ = get_stealth_script()
+    await context.add_init_script(script=script)
     return context
@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from playwright.async_api import async_playwright
+
+from conf import BROWSER_POOL_SIZE, PERSISTENT_PROFILE, PROFILE_DIR
+from utils.log import browser_logger
+
+
+class BrowserPool(object):
+    """
+    Process-wide Playwright driver and warm browser pool.
+
+    The driver is started once per event loop and up to `size` browsers are kept
+    per launch configuration (engine, executable_path, headless, args...).
+    Callers only ever close their own contexts, never the pooled browsers.
+
+    With `persistent=True` an account gets its own user-data directory instead, so
+    the HTTP cache, service workers and IndexedDB of the creator sites survive
+    between runs. The storage_state json stays the import/export format.
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE):
+        self.size = max(1, size)
+        self._playwright = None
+        self._loop = None
+        self._browsers = {}
+        self._locks = {}
+        self._profile_locks = {}
+        self.driver_starts = 0
+        self.launches = 0
+        self.reuses = 0
+
+    def _reset_if_loop_changed(self):
+        # asyncio.run() 每次都会创建新的事件循环，旧循环上的 driver 已不可用
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._loop is not None:
+                browser_logger.info("[+] 事件循环已变更，重新启动 playwright driver")
+            self._loop = loop
+            self._playwright = None
+            self._browsers = {}
+            self._locks = {}
+            self._profile_locks = {}
+
+    async def get_playwright(self):
+        self._reset_if_loop_changed()
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+            self.driver_starts += 1
+        return self._playwright
+
+    @staticmethod
+    def _key(browser_type, launch_options: dict) -> str:
+        return browser_type.name + json.dumps(launch_options, sort_keys=True, default=str)
+
+    async def launch(self, browser_type, **launch_options):
+        """
+        Return a warm browser for the given engine and launch options, launching one if needed.
+        :param browser_type: playwright.chromium / playwright.firefox / playwright.webkit
+        :param launch_options: keyword arguments accepted by `browser_type.launch`
+        :returns: Browser shared with other callers, do not close it
+        """
+        playwright = await self.get_playwright()
+        if browser_type not in (playwright.chromium, playwright.firefox, playwright.webkit):
+            # 外部传入的 playwright 实例不归连接池管理
+            self.launches += 1
+            return await browser_type.launch(**launch_options)
+
+        key = self._key(browser_type, launch_options)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            browsers = [browser for browser in self._browsers.get(key, []) if browser.is_connected()]
+            idle = [browser for browser in browsers if not browser.contexts]
+            if idle or len(browsers) >= self.size:
+                browser = (idle or sorted(browsers, key=lambda b: len(b.contexts)))[0]
+                self.reuses += 1
+            else:
+                browser = await browser_type.launch(**launch_options)
+                self.launches += 1
+                browsers.append(browser)
+                browser_logger.info(f"[+] 启动浏览器 {browser_type.name} ({len(browsers)}/{self.size})")
+            self._browsers[key] = browsers
+            return browser
+
+    async def new_context(self, browser_type, account_file=None, launch_options: dict = None,
+                          load_state: bool = True, persistent: bool = PERSISTENT_PROFILE, **context_options):
+        """
+        Create a browser context for an account, the caller closes it when done.
+        :param browser_type: playwright.chromium / playwright.firefox / playwright.webkit
+        :param account_file: storage_state json of the account, None for a blank context
+        :param launch_options: keyword arguments accepted by `browser_type.launch`
+        :param load_state: load the cookies of `account_file`, False for a fresh login
+        :param persistent: use the account's persistent profile directory
+        :param context_options: keyword arguments accepted by `browser.new_context`
+        """
+        launch_options = launch_options or {}
+        if persistent and account_file:
+            return await self._new_persistent_context(browser_type, account_file, launch_options,
+                                                      context_options, load_state)
+        browser = await self.launch(browser_type, **launch_options)
+        if account_file and load_state:
+            context_options["storage_state"] = str(account_file)
+        return await browser.new_context(**context_options)
+
+    @staticmethod
+    def profile_dir(browser_type, account_file) -> Path:
+        account_file = os.path.abspath(str(account_file))
+        digest = hashlib.sha1(account_file.encode("utf-8")).hexdigest()[:8]
+        return Path(PROFILE_DIR) / f"{browser_type.name}_{Path(account_file).stem}_{digest}"
+
+    async def _new_persistent_context(self, browser_type, account_file, launch_options, context_options, load_state):
+        await self.get_playwright()
+        user_data_dir = self.profile_dir(browser_type, account_file)
+        # 同一个 user-data 目录同时只能被一个浏览器进程打开
+        lock = self._profile_locks.setdefault(str(user_data_dir), asyncio.Lock())
+        await lock.acquire()
+        try:
+            user_data_dir.mkdir(parents=True, exist_ok=True)
+            context = await browser_type.launch_persistent_context(str(user_data_dir), **launch_options,
+                                                                   **context_options)
+            self.launches += 1
+        except Exception:
+            lock.release()
+            raise
+        context.on("close", lambda _: lock.release())
+        if load_state:
+            await self._import_storage_state(context, account_file, user_data_dir)
+        return context
+
+    @staticmethod
+    async def _import_storage_state(context, account_file, user_data_dir: Path):
+        # cookie json 比 profile 新(例如重新登录过)时，把其中的 cookie 导入 profile
+        marker = user_data_dir / ".storage_state_imported"
+        if not os.path.exists(account_file):
+            return
+        if marker.exists() and marker.stat().st_mtime_ns >= os.stat(account_file).st_mtime_ns:
+            return
+        with open(account_file, "r", encoding="utf-8") as f:
+            cookies = json.load(f).get("cookies", [])
+        if cookies:
+            await context.add_cookies(cookies)
+        marker.touch()
+        browser_logger.info(f"[+] 已导入 {len(cookies)} 个 cookie 到 {user_data_dir.name}")
+
+    def stats(self) -> dict:
+        return {
+            "driver_starts": self.driver_starts,
+            "launches": self.launches,
+            "launches_saved": self.reuses,
+        }
+
+    async def close(self):
+        if self._loop is not asyncio.get_running_loop():
+            self._playwright = None
+            self._browsers = {}
+            return
+        for browsers in self._browsers.values():
+            for browser in browsers:
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+        self._browsers = {}
+        self._locks = {}
+        self._profile_locks = {}
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        browser_logger.info(f"[+] 浏览器池已关闭: {self.stats()}")
+
+
+browser_pool = BrowserPool()
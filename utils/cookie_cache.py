@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from conf import COOKIE_CACHE_FILE, COOKIE_CACHE_TTL
+from utils.log import cookie_logger
+
+
+class CookieValidityCache(object):
+    """
+    Remember which cookie files were recently verified as valid.
+
+    Entries are keyed by the absolute account file path and only match while the
+    file's mtime and content hash are unchanged and the entry is younger than `ttl`.
+    Only positive results are cached, an invalid cookie is always re-checked.
+    The cache is persisted so that back-to-back `cli_main.py` runs share it.
+    """
+
+    def __init__(self, cache_file=COOKIE_CACHE_FILE, ttl: float = COOKIE_CACHE_TTL):
+        self.cache_file = Path(cache_file)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_file, self.cache_file)
+
+    @staticmethod
+    def _fingerprint(account_file):
+        path = os.path.abspath(str(account_file))
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            with open(path, 'rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+        except OSError:
+            return path, None
+        return path, {"mtime_ns": mtime_ns, "sha1": digest}
+
+    def get(self, account_file) -> bool:
+        path, fingerprint = self._fingerprint(account_file)
+        entry = self._load().get(path)
+        if fingerprint and entry \
+                and entry["mtime_ns"] == fingerprint["mtime_ns"] and entry["sha1"] == fingerprint["sha1"] \
+                and time.time() - entry["checked_at"] < self.ttl:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def mark_valid(self, account_file):
+        path, fingerprint = self._fingerprint(account_file)
+        if not fingerprint:
+            return
+        fingerprint["checked_at"] = time.time()
+        self._load()[path] = fingerprint
+        self._save()
+
+    def invalidate(self, account_file):
+        path = os.path.abspath(str(account_file))
+        if self._load().pop(path, None) is not None:
+            self._save()
+            cookie_logger.info(f"[+] cookie 校验缓存已失效: {path}")
+
+    async def validate(self, account_file, auth_func) -> bool:
+        """
+        Return True if the cookie is valid, only calling `auth_func` on a cache miss.
+        :param account_file: storage_state json file of the account
+        :param auth_func: platform `cookie_auth` coroutine function
+        """
+        if self.get(account_file):
+            cookie_logger.info(f"[+] cookie 校验缓存命中，跳过浏览器校验 (hits={self.hits}, misses={self.misses})")
+            return True
+        valid = await auth_func(account_file)
+        if valid:
+            self.mark_valid(account_file)
+        else:
+            self.invalidate(account_file)
+        return valid
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+cookie_cache = CookieValidityCache()
@@ -0,0 +1,87 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from conf import JOB_DB_FILE
+from utils.fingerprint import fingerprint_files
+from utils.log import scheduler_logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS published_videos (
+    fingerprint TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    account TEXT NOT NULL,
+    file TEXT,
+    published_at REAL NOT NULL,
+    PRIMARY KEY (platform, account, fingerprint)
+) WITHOUT ROWID;
+"""
+
+
+class DedupIndex(object):
+    """
+    Which video content has already been published to which account.
+
+    Keyed by (platform, account, content fingerprint), so a renamed or copied file is
+    still recognised. Lives next to the job store in db/jobs.db. Check it before
+    creating an uploader and record a video only after the platform accepted it.
+    """
+
+    def __init__(self, db_file=JOB_DB_FILE):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def is_published(self, fingerprint, platform, account) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM published_videos WHERE platform = ? AND account = ? AND fingerprint = ?",
+                (platform, str(account), fingerprint)).fetchone()
+        return row is not None
+
+    def published(self, platform, account) -> set:
+        """:returns: all fingerprints published to the account, for bulk filtering"""
+        with self._lock:
+            rows = self._conn.execute("SELECT fingerprint FROM published_videos WHERE platform = ? AND account = ?",
+                                      (platform, str(account))).fetchall()
+        return {row[0] for row in rows}
+
+    def record(self, fingerprint, platform, account, file=None):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO published_videos (fingerprint, platform, account, file,"
+                               " published_at) VALUES (?, ?, ?, ?, ?)",
+                               (fingerprint, platform, str(account), None if file is None else str(file), time.time()))
+
+    def forget(self, platform, account, fingerprint=None) -> int:
+        """Remove records so the videos can be uploaded again, all of the account without a fingerprint."""
+        sql = "DELETE FROM published_videos WHERE platform = ? AND account = ?"
+        params = [platform, str(account)]
+        if fingerprint is not None:
+            sql += " AND fingerprint = ?"
+            params.append(fingerprint)
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).rowcount
+
+    def unpublished(self, files, platform, account) -> dict:
+        """
+        Fingerprint `files` and drop those already published to the account.
+        :returns: {file: fingerprint} of the files still to upload, in the given order
+        """
+        published = self.published(platform, account)
+        result = {}
+        for file, fingerprint in fingerprint_files(files).items():
+            if fingerprint in published:
+                scheduler_logger.info(f"[+] 跳过已发布的视频 {platform}/{account}: {Path(file).name}")
+                continue
+            result[file] = fingerprint
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
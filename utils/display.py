@@ -0,0 +1,136 @@
+import atexit
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from conf import XVFB_FALLBACK, XVFB_SCREEN
+from utils.log import browser_logger
+
+# 无头 Chrome 播放上传预览时需要的参数：自动播放、静音、软件渲染
+# 注意 playwright 自带的 Chromium 不含 H.264 解码器，预览需要本地安装的 Chrome (LOCAL_CHROME_PATH)
+HEADLESS_CHROMIUM_ARGS = [
+    "--autoplay-policy=no-user-gesture-required",
+    "--mute-audio",
+    "--use-gl=angle",
+    "--use-angle=swiftshader",
+    "--enable-unsafe-swiftshader",
+    "--window-size=1920,1080",
+]
+
+
+class VirtualDisplay(object):
+    """An Xvfb server on a free display number, DISPLAY is pointed at it while it runs."""
+
+    def __init__(self, screen: str = XVFB_SCREEN):
+        self.screen = screen
+        self.display = None
+        self.process = None
+        self._previous_display = None
+
+    @staticmethod
+    def _free_display(start: int = 99) -> int:
+        display = start
+        while Path(f"/tmp/.X{display}-lock").exists() or Path(f"/tmp/.X11-unix/X{display}").exists():
+            display += 1
+        return display
+
+    def start(self, timeout: float = 5.0):
+        xvfb = shutil.which("Xvfb")
+        if not xvfb:
+            raise RuntimeError("Xvfb not found, install it with `apt install xvfb`")
+        display = self._free_display()
+        self.process = subprocess.Popen([xvfb, f":{display}", "-screen", "0", self.screen, "-nolisten", "tcp"],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        socket = Path(f"/tmp/.X11-unix/X{display}")
+        deadline = time.monotonic() + timeout
+        while not socket.exists():
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError(f"Xvfb failed to start on :{display}")
+            time.sleep(0.05)
+        self.display = f":{display}"
+        self._previous_display = os.environ.get("DISPLAY")
+        os.environ["DISPLAY"] = self.display
+        atexit.register(self.stop)
+        browser_logger.info(f"[+] 已启动 Xvfb 虚拟显示 {self.display} ({self.screen})")
+        return self
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+        if self.display and os.environ.get("DISPLAY") == self.display:
+            if self._previous_display is None:
+                os.environ.pop("DISPLAY", None)
+            else:
+                os.environ["DISPLAY"] = self._previous_display
+        self.display = None
+
+
+_virtual_display = None
+_warned_no_codecs = False
+
+
+def has_display() -> bool:
+    if not sys.platform.startswith("linux"):
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def ensure_display(fallback: bool = XVFB_FALLBACK, force_xvfb: bool = False) -> bool:
+    """
+    Make sure a headed browser has somewhere to draw, starting Xvfb once per process if needed.
+    :returns: False when there is no display and Xvfb could not be started
+    """
+    global _virtual_display
+    if has_display() and not force_xvfb:
+        return True
+    if _virtual_display is not None and _virtual_display.process is not None:
+        return True
+    if not fallback and not force_xvfb:
+        return False
+    try:
+        _virtual_display = VirtualDisplay().start()
+        return True
+    except Exception as e:
+        browser_logger.warning(f"[+] 无法启动 Xvfb: {e}")
+        return False
+
+
+def upload_launch_options(headless: bool, engine: str = "chromium", executable_path=None, args=None) -> dict:
+    """
+    Launch options for an upload browser in headed or headless mode.
+    A headed browser without a display falls back to Xvfb, then to headless.
+    :param engine: browser_type.name, the chromium args are only added for chromium
+    :param executable_path: local chrome, needed for H.264 previews
+    :param args: extra command line arguments
+    :returns: keyword arguments for `browser_type.launch` / `browser_pool.new_context(launch_options=...)`
+    """
+    global _warned_no_codecs
+    args = list(args or [])
+    if not headless and not ensure_display():
+        browser_logger.warning("[+] 没有可用的图形界面，改用无头模式上传")
+        headless = True
+    if headless and engine == "chromium":
+        args += [arg for arg in HEADLESS_CHROMIUM_ARGS if arg not in args]
+        if not executable_path and not _warned_no_codecs:
+            _warned_no_codecs = True
+            browser_logger.warning("[+] 无头模式未配置 LOCAL_CHROME_PATH，自带的 Chromium 无法预览 H.264 视频")
+    options = {"headless": headless}
+    if args:
+        options["args"] = args
+    if executable_path:
+        options["executable_path"] = executable_path
+    if not headless and _virtual_display is not None and _virtual_display.display:
+        # 浏览器继承的是 playwright driver 进程的环境，driver 可能早于 Xvfb 启动，需要显式传入 DISPLAY
+        options["env"] = {**os.environ, "DISPLAY": _virtual_display.display}
+    return options
@@ -0,0 +1,148 @@
+import os
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+
+from conf import FASTSTART_CACHE_DIR
+from utils.fingerprint import file_fingerprint
+from utils.log import scheduler_logger
+from utils.mp4 import parse_mp4, MP4ParseError
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class FaststartError(Exception):
+    pass
+
+
+def _patch_offsets(moov: bytearray, info, delta: int):
+    """Shift every stco / co64 entry of the moov copy by `delta` bytes."""
+    for track in info.tracks:
+        box = track.chunk_offsets
+        if box is None:
+            continue
+        body = box.offset - info.moov.offset + box.header
+        count = int.from_bytes(moov[body + 4:body + 8], "big")
+        start = body + 8
+        if box.type == "stco":
+            offsets = array("I", moov[start:start + count * 4])
+        else:
+            offsets = array("Q", moov[start:start + count * 8])
+        if sys.byteorder == "little":
+            offsets.byteswap()
+        # 只有 mdat 到原 moov 之间的数据会后移，ftyp 等开头部分和原 moov 之后的部分位置不变
+        low, high = info.mdat.offset, info.moov.offset
+        shifted = array(offsets.typecode, (offset + delta if low <= offset < high else offset for offset in offsets))
+        if sys.byteorder == "little":
+            shifted.byteswap()
+        moov[start:start + len(shifted) * shifted.itemsize] = shifted.tobytes()
+
+
+def _write_all(dst, data):
+    view = memoryview(data)
+    while view:
+        view = view[dst.write(view):]
+
+
+def _copy_range(src, dst, offset: int, length: int):
+    """Copy `length` bytes from `offset` of `src` to the current position of `dst`, inside the kernel when possible."""
+    end = offset + length
+    if hasattr(os, "copy_file_range"):
+        try:
+            while offset < end:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), end - offset, offset_src=offset)
+                if not copied:
+                    break
+                offset += copied
+        except OSError:
+            # 旧内核或部分文件系统(跨设备、NFS)不支持 copy_file_range
+            pass
+    if offset < end and hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+        try:
+            while offset < end:
+                copied = os.sendfile(dst.fileno(), src.fileno(), offset, end - offset)
+                if not copied:
+                    break
+                offset += copied
+        except OSError:
+            pass
+    if offset < end:
+        buffer = memoryview(bytearray(COPY_BUFFER_SIZE))
+        src.seek(offset)
+        while offset < end:
+            read = src.readinto(buffer[:min(COPY_BUFFER_SIZE, end - offset)])
+            if not read:
+                raise FaststartError(f"unexpected end of file at {offset}")
+            _write_all(dst, buffer[:read])
+            offset += read
+    if offset < end:
+        raise FaststartError(f"unexpected end of file at {offset}")
+
+
+def remux_faststart(src, dst, info=None):
+    """
+    Write `src` to `dst` with moov placed right before the first mdat, patching the chunk offsets.
+    The media data is copied unchanged with a bounded buffer.
+    :raises FaststartError: when the file cannot be rewritten, e.g. fragmented files or 32 bit offset overflow
+    """
+    info = info or parse_mp4(src)
+    if info.faststart:
+        raise FaststartError("moov already precedes mdat")
+    if any(box.type == "moof" for box in info.boxes):
+        raise FaststartError("fragmented mp4 is not supported")
+    delta = info.moov.size
+    with open(src, "rb", buffering=0) as source:
+        source.seek(info.moov.offset)
+        moov = bytearray(source.read(info.moov.size))
+        if any(track.chunk_offsets is not None and track.chunk_offsets.type == "stco" for track in info.tracks) \
+                and info.moov.offset + delta > 0xFFFFFFFF:
+            raise FaststartError("stco offsets would overflow 32 bit, co64 conversion is not supported")
+        _patch_offsets(moov, info, delta)
+        with open(dst, "wb", buffering=0) as target:
+            for box in info.boxes:
+                if box is info.mdat:
+                    _write_all(target, moov)
+                if box is not info.moov:
+                    _copy_range(source, target, box.offset, box.size)
+            if target.tell() != info.size:
+                raise FaststartError(f"wrote {target.tell()} bytes, expected {info.size}")
+
+
+def faststart_path(file) -> Path:
+    """Where the faststart copy of `file` is cached, keyed by its content fingerprint, keeping the file name."""
+    fingerprint = file_fingerprint(file).replace(":", "-")
+    return Path(FASTSTART_CACHE_DIR) / fingerprint / Path(file).name
+
+
+def ensure_faststart(file):
+    """
+    :returns: `file` itself when it is already faststart or cannot be rewritten, else the cached faststart copy
+    """
+    try:
+        info = parse_mp4(file)
+    except (MP4ParseError, OSError):
+        return file
+    if info.faststart:
+        return file
+    target = faststart_path(file)
+    if target.exists() and target.stat().st_size == info.size:
+        scheduler_logger.info(f"[+] 使用已缓存的 faststart 视频 {target}")
+        return target
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # 同一视频可能被多个线程同时转换，每次转换写入自己的临时文件，完成后原子替换
+    fd, tmp = tempfile.mkstemp(prefix=target.name + ".", suffix=".part", dir=target.parent)
+    os.close(fd)
+    tmp = Path(tmp)
+    try:
+        remux_faststart(file, tmp, info)
+        os.replace(tmp, target)
+    except (FaststartError, MP4ParseError, OSError) as e:
+        tmp.unlink(missing_ok=True)
+        # 转换失败时，其他线程可能已经生成了缓存
+        if target.exists() and target.stat().st_size == info.size:
+            return target
+        scheduler_logger.warning(f"[+] faststart 转换失败，使用原视频 {Path(file).name}: {e}")
+        return file
+    scheduler_logger.info(f"[+] 已将 moov 移到文件开头 {Path(file).name} -> {target}")
+    return target
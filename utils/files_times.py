@@ -38,7 +38,8 @@ def get_title_and_hashtags(filename):
     return title, hashtags
 
 
-def generate_schedule_time_next_day(total_videos, videos_per_day, daily_times=None, timestamps=False, start_days=0):
+def generate_schedule_time_next_day(total_videos, videos_per_day, daily_times=None, timestamps=False, start_days=0,
+                                    planner=None, platform=None, account=None):
     """
     Generate a schedule for video uploads, starting from the next day.
 
@@ -48,6 +49,8 @@ def generate_schedule_time_next_day(total_videos, videos_per_day, daily_times=No
     - daily_times: Optional list of specific times of the day to publish the videos.
     - timestamps: Boolean to decide whether to return timestamps or datetime objects.
     - start_days: Start from after start_days.
+    - planner: Optional utils.publish_planner.PublishPlanner, the videos then take the earliest slots of
+      (platform, account) that are not booked yet, honouring its daily caps, gaps and blackout windows.
 
     Returns:
     - A list of scheduling times for the videos, either as timestamps or datetime objects.
@@ -55,6 +58,13 @@ def generate_schedule_time_next_day(total_videos, videos_per_day, daily_times=No
     if videos_per_day <= 0:
         raise ValueError("videos_per_day should be a positive integer")
 
+    if planner is not None:
+        # daily_times 为 None 时使用 PUBLISH_RULES 中的发布时间点
+        schedule = planner.plan(platform, account, total_videos, daily_times=daily_times, daily_cap=videos_per_day)
+        if timestamps:
+            schedule = [int(time.timestamp()) for time in schedule]
+        return schedule
+
     if daily_times is None:
         # Default times to publish videos if not provided
         daily_times = [6, 11, 14, 16, 22]
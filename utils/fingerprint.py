@@ -0,0 +1,185 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from conf import JOB_DB_FILE, FINGERPRINT_SAMPLED, FINGERPRINT_SAMPLE_BLOCKS, FINGERPRINT_WORKERS
+
+CHUNK_SIZE = 1024 * 1024
+SAMPLE_BLOCK_SIZE = 1024 * 1024
+# 抽样指纹带前缀，和完整 sha256 不会相互混淆
+SAMPLED_PREFIX = "sampled:"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_fingerprints (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    mode TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    path TEXT,
+    hashed_at REAL NOT NULL,
+    PRIMARY KEY (device, inode, size, mtime_ns, mode)
+) WITHOUT ROWID;
+"""
+
+_buffers = threading.local()
+
+
+def _buffer(size: int) -> memoryview:
+    """A read buffer reused by every hash computed on the current thread."""
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None or len(buffer) != size:
+        buffer = _buffers.buffer = memoryview(bytearray(size))
+    return buffer
+
+
+def _advise_sequential(f):
+    # 提示内核顺序预读，对 NFS 上的大文件效果明显
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+def hash_full(path, chunk_size: int = CHUNK_SIZE) -> str:
+    """sha256 of the whole file, streamed through a reusable buffer with readinto."""
+    digest = hashlib.sha256()
+    buffer = _buffer(chunk_size)
+    with open(path, "rb", buffering=0) as f:
+        _advise_sequential(f)
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            # hashlib 在数据较大时会释放 GIL，多个文件可以在线程池中并行计算
+            digest.update(buffer[:read])
+    return digest.hexdigest()
+
+
+def hash_sampled(path, blocks: int = FINGERPRINT_SAMPLE_BLOCKS, block_size: int = SAMPLE_BLOCK_SIZE) -> str:
+    """
+    sha256 over the file size, the head, the tail and `blocks` evenly strided blocks.
+    Reads at most (blocks + 2) * block_size bytes whatever the file size, smaller files are hashed fully.
+    """
+    size = os.path.getsize(path)
+    if size <= (blocks + 2) * block_size:
+        return SAMPLED_PREFIX + hash_full(path)
+    digest = hashlib.sha256(str(size).encode())
+    buffer = _buffer(block_size)
+    stride = (size - block_size) // (blocks + 1)
+    offsets = [0] + [stride * index for index in range(1, blocks + 1)] + [size - block_size]
+    with open(path, "rb", buffering=0) as f:
+        for offset in offsets:
+            f.seek(offset)
+            read = f.readinto(buffer)
+            digest.update(buffer[:read])
+    return SAMPLED_PREFIX + digest.hexdigest()
+
+
+class FingerprintCache(object):
+    """
+    Fingerprints keyed by (device, inode, size, mtime_ns, mode), kept in memory and in db/jobs.db.
+
+    A file whose stat is unchanged is never read again, a rewritten or touched file
+    gets a new key and is hashed once more.
+    """
+
+    def __init__(self, db_file=JOB_DB_FILE):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._memory = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(stat, mode: str) -> tuple:
+        return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, mode
+
+    def get(self, key: tuple):
+        with self._lock:
+            fingerprint = self._memory.get(key)
+            if fingerprint is None:
+                row = self._conn.execute(
+                    "SELECT fingerprint FROM file_fingerprints WHERE device = ? AND inode = ? AND size = ?"
+                    " AND mtime_ns = ? AND mode = ?", key).fetchone()
+                if row is not None:
+                    fingerprint = self._memory[key] = row[0]
+            if fingerprint is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return fingerprint
+
+    def put(self, key: tuple, fingerprint: str, path=None):
+        with self._lock, self._conn:
+            self._memory[key] = fingerprint
+            self._conn.execute("INSERT OR REPLACE INTO file_fingerprints (device, inode, size, mtime_ns, mode,"
+                               " fingerprint, path, hashed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               key + (fingerprint, None if path is None else str(path), time.time()))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM file_fingerprints")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_fingerprint_cache() -> FingerprintCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FingerprintCache()
+        return _cache
+
+
+def file_fingerprint(path, sampled: bool = FINGERPRINT_SAMPLED, cache: bool = True) -> str:
+    """
+    Content fingerprint of a video file.
+    :param sampled: hash only the head, tail and strided blocks instead of the whole file
+    :param cache: reuse the fingerprint of a file whose (device, inode, size, mtime) is unchanged
+    """
+    mode = f"sampled{FINGERPRINT_SAMPLE_BLOCKS}" if sampled else "sha256"
+    if not cache:
+        return hash_sampled(path) if sampled else hash_full(path)
+    fingerprint_cache = get_fingerprint_cache()
+    key = fingerprint_cache.key(os.stat(path), mode)
+    fingerprint = fingerprint_cache.get(key)
+    if fingerprint is None:
+        fingerprint = hash_sampled(path) if sampled else hash_full(path)
+        # 计算期间文件被修改时不写入缓存
+        if fingerprint_cache.key(os.stat(path), mode) == key:
+            fingerprint_cache.put(key, fingerprint, path)
+    return fingerprint
+
+
+def fingerprint_files(files, sampled: bool = FINGERPRINT_SAMPLED, workers: int = FINGERPRINT_WORKERS,
+                      cache: bool = True) -> dict:
+    """
+    Fingerprint several files in a thread pool.
+    :returns: {file: fingerprint} in the order of `files`
+    """
+    files = list(files)
+    if len(files) <= 1 or workers <= 1:
+        return {file: file_fingerprint(file, sampled, cache) for file in files}
+    with ThreadPoolExecutor(max_workers=min(workers, len(files)), thread_name_prefix="fingerprint") as executor:
+        fingerprints = executor.map(lambda file: file_fingerprint(file, sampled, cache), files)
+        return dict(zip(files, fingerprints))
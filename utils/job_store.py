@@ -0,0 +1,237 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from conf import JOB_DB_FILE, JOB_STORE_FLUSH_INTERVAL, JOB_MAX_ATTEMPTS
+from utils.log import scheduler_logger
+
+STATE_PENDING = "pending"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+STATE_CANCELLED = "cancelled"
+STATE_SKIPPED = "skipped"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    platform TEXT NOT NULL,
+    account TEXT NOT NULL,
+    account_file TEXT,
+    file TEXT NOT NULL,
+    fingerprint TEXT,
+    title TEXT,
+    tags TEXT NOT NULL DEFAULT '[]',
+    publish_date TEXT,
+    options TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    timings TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_state ON upload_jobs (state, platform);
+"""
+
+
+class StoredJob(object):
+    """One row of the upload_jobs table."""
+
+    def __init__(self, row: sqlite3.Row):
+        self.id = row["id"]
+        self.platform = row["platform"]
+        self.account = row["account"]
+        self.account_file = row["account_file"]
+        self.file = row["file"]
+        self.fingerprint = row["fingerprint"]
+        self.title = row["title"]
+        self.tags = json.loads(row["tags"])
+        # 0 / None 表示立即发布，和各上传器的 publish_date 约定一致
+        self.publish_date = datetime.fromisoformat(row["publish_date"]) if row["publish_date"] else 0
+        self.options = json.loads(row["options"])
+        self.state = row["state"]
+        self.attempts = row["attempts"]
+        self.error = row["error"]
+        self.timings = json.loads(row["timings"])
+
+    @property
+    def name(self):
+        return f"{self.platform}/{self.account}/{Path(self.file).name}"
+
+    def __repr__(self):
+        return f"<StoredJob #{self.id} {self.name} {self.state}>"
+
+
+class JobStore(object):
+    """
+    Durable record of upload jobs in SQLite (WAL mode).
+
+    Every state change is a guarded `UPDATE ... WHERE state IN (...)`, so a job can
+    only move along valid transitions. Non-terminal updates (running, stage timings)
+    are buffered and written in one transaction at most every `flush_interval`
+    seconds; done/failed/cancelled are written immediately so a finished upload is
+    never published twice after a crash.
+    """
+
+    def __init__(self, db_file=JOB_DB_FILE, flush_interval: float = JOB_STORE_FLUSH_INTERVAL):
+        self.db_file = Path(db_file)
+        self.flush_interval = flush_interval
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 NORMAL 只在 checkpoint 时 fsync，断电最多丢失最后几个事务，不会损坏数据库
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self.flushes = 0
+
+    def _migrate(self):
+        # 旧版本创建的数据库没有 fingerprint 列
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(upload_jobs)")}
+        if "fingerprint" not in columns:
+            self._conn.execute("ALTER TABLE upload_jobs ADD COLUMN fingerprint TEXT")
+
+    def _write(self, statements):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                results = [self._conn.execute(sql, params).rowcount for sql, params in statements]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.flushes += 1
+            return results
+
+    def _queue(self, sql, params, durable: bool):
+        self._pending.append((sql, params))
+        if durable or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered updates in a single transaction."""
+        pending, self._pending = self._pending, []
+        self._last_flush = time.monotonic()
+        if pending:
+            self._write(pending)
+
+    def add_jobs(self, jobs) -> list:
+        """
+        Insert jobs in one transaction.
+        :param jobs: dicts with platform, account, file and optionally account_file, fingerprint,
+                     title, tags, publish_date (datetime or 0 for immediately) and options
+        :returns: the new job ids
+        """
+        now = time.time()
+        ids = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for job in jobs:
+                    publish_date = job.get("publish_date")
+                    cursor = self._conn.execute(
+                        "INSERT INTO upload_jobs (platform, account, account_file, file, fingerprint, title, tags,"
+                        " publish_date, options, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job["platform"], job["account"], str(job.get("account_file") or ""), str(job["file"]),
+                         job.get("fingerprint"), job.get("title"), json.dumps(list(job.get("tags") or []), ensure_ascii=False),
+                         publish_date.isoformat() if publish_date else None,
+                         json.dumps(job.get("options") or {}, ensure_ascii=False, default=str), now, now))
+                    ids.append(cursor.lastrowid)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        scheduler_logger.info(f"[+] 已写入 {len(ids)} 个上传任务到 {self.db_file.name}")
+        return ids
+
+    def add_job(self, platform, account, file, **fields) -> int:
+        return self.add_jobs([dict(fields, platform=platform, account=account, file=file)])[0]
+
+    def mark_running(self, job_id: int):
+        """pending/failed/cancelled -> running, counts one attempt."""
+        now = time.time()
+        self._queue("UPDATE upload_jobs SET state = ?, attempts = attempts + 1, started_at = ?, updated_at = ?,"
+                    " error = NULL WHERE id = ? AND state IN (?, ?, ?)",
+                    (STATE_RUNNING, now, now, job_id, STATE_PENDING, STATE_FAILED, STATE_CANCELLED), durable=False)
+
+    def mark_finished(self, job_id: int, state: str, error=None, timings: dict = None):
+        """running -> done / failed / cancelled / skipped, written immediately with any buffered update."""
+        now = time.time()
+        if timings is not None:
+            self._pending.append(("UPDATE upload_jobs SET timings = ? WHERE id = ?",
+                                  (json.dumps(timings), job_id)))
+        # 中断前还没来得及写入 running 时，任务可能仍是 pending
+        self._queue("UPDATE upload_jobs SET state = ?, error = ?, finished_at = ?, updated_at = ?"
+                    " WHERE id = ? AND state IN (?, ?)",
+                    (state, None if error is None else str(error)[:2000], now, now, job_id,
+                     STATE_RUNNING, STATE_PENDING), durable=True)
+
+    def record_timings(self, job_id: int, timings: dict):
+        self._queue("UPDATE upload_jobs SET timings = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(timings), time.time(), job_id), durable=False)
+
+    def requeue_interrupted(self) -> int:
+        """Jobs left `running` by a crashed process go back to pending, returns their number."""
+        self.flush()
+        count = self._write([("UPDATE upload_jobs SET state = ?, updated_at = ? WHERE state = ?",
+                              (STATE_PENDING, time.time(), STATE_RUNNING))])[0]
+        if count:
+            scheduler_logger.warning(f"[+] {count} 个任务在上次运行中被中断，已重新加入队列")
+        return count
+
+    def unfinished(self, platforms=None, max_attempts: int = JOB_MAX_ATTEMPTS) -> list:
+        """Pending, failed and cancelled jobs that still have attempts left, oldest first."""
+        self.flush()
+        sql = "SELECT * FROM upload_jobs WHERE state IN (?, ?, ?) AND attempts < ?"
+        params = [STATE_PENDING, STATE_FAILED, STATE_CANCELLED, max_attempts]
+        if platforms:
+            sql += f" AND platform IN ({', '.join('?' * len(platforms))})"
+            params += list(platforms)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY id", params).fetchall()
+        return [StoredJob(row) for row in rows]
+
+    def booked_slots(self, platforms=None) -> list:
+        """
+        Publish dates already taken by jobs that will be or have been published.
+        :returns: list of (platform, account, datetime)
+        """
+        self.flush()
+        # 失败的任务 resume 时仍按原定时间发布，取消和跳过的任务不占用时间
+        sql = "SELECT platform, account, publish_date FROM upload_jobs WHERE publish_date IS NOT NULL" \
+              " AND state IN (?, ?, ?, ?)"
+        params = [STATE_PENDING, STATE_RUNNING, STATE_DONE, STATE_FAILED]
+        if platforms:
+            sql += f" AND platform IN ({', '.join('?' * len(platforms))})"
+            params += list(platforms)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [(platform, account, datetime.fromisoformat(publish_date)) for platform, account, publish_date in rows]
+
+    def get(self, job_id: int):
+        self.flush()
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM upload_jobs WHERE id = ?", (job_id,)).fetchone()
+        return StoredJob(row) if row else None
+
+    def stats(self) -> dict:
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM upload_jobs GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
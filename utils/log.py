@@ -49,3 +49,6 @@ xhs_logger = create_logger('xhs', 'logs/xhs.log')
 tiktok_logger = create_logger('tiktok', 'logs/tiktok.log')
 bilibili_logger = create_logger('bilibili', 'logs/bilibili.log')
 kuaishou_logger = create_logger('kuaishou', 'logs/kuaishou.log')
+browser_logger = create_logger('browser', 'logs/browser.log')
+cookie_logger = create_logger('cookie', 'logs/cookie.log')
+scheduler_logger = create_logger('scheduler', 'logs/scheduler.log')
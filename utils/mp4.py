@@ -0,0 +1,204 @@
+import mmap
+import os
+from collections import namedtuple
+from struct import error as StructError, unpack_from
+
+# 一个 box 在文件中的位置: offset 为 box 起始位置，header 为头部长度(8 或 16)
+Box = namedtuple("Box", "type offset size header")
+
+
+class MP4ParseError(ValueError):
+    pass
+
+
+class MP4Track(object):
+    def __init__(self):
+        self.track_id = None
+        self.handler = None
+        self.codec = None
+        self.width = None
+        self.height = None
+        self.timescale = None
+        self.duration = None
+        self.chunk_offsets = None
+
+    def __repr__(self):
+        return f"<MP4Track {self.handler} {self.codec} {self.width}x{self.height} {self.duration}s>"
+
+
+class MP4Info(object):
+    """What the preflight needs to know about an MP4 / MOV file."""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.major_brand = None
+        self.brands = []
+        self.duration = None
+        self.boxes = []
+        self.tracks = []
+        self.moov = None
+        self.mdat = None
+
+    @property
+    def video(self):
+        return next((track for track in self.tracks if track.handler == "vide"), None)
+
+    @property
+    def audio(self):
+        return next((track for track in self.tracks if track.handler == "soun"), None)
+
+    @property
+    def width(self):
+        return self.video.width if self.video else None
+
+    @property
+    def height(self):
+        return self.video.height if self.video else None
+
+    @property
+    def video_codec(self):
+        return self.video.codec if self.video else None
+
+    @property
+    def audio_codec(self):
+        return self.audio.codec if self.audio else None
+
+    @property
+    def bitrate(self):
+        """Average bitrate of the whole file in bits per second."""
+        return int(self.size * 8 / self.duration) if self.duration else None
+
+    @property
+    def faststart(self) -> bool:
+        """True when moov comes before mdat, so playback can start before the whole file is read."""
+        return self.mdat is None or self.moov.offset < self.mdat.offset
+
+    def summary(self) -> str:
+        bitrate = f"{self.bitrate / 1000:.0f}kbps" if self.bitrate else "-"
+        return (f"{self.duration or 0:.1f}s {self.width}x{self.height} {self.video_codec}/{self.audio_codec} "
+                f"{bitrate} {self.size / 1024 / 1024:.1f}MB{' faststart' if self.faststart else ''}")
+
+    def __repr__(self):
+        return f"<MP4Info {os.path.basename(str(self.path))} {self.summary()}>"
+
+
+def iter_boxes(buf, start: int, end: int):
+    """Yield the boxes laid out between `start` and `end`, reading only their headers."""
+    offset = start
+    while offset + 8 <= end:
+        size, = unpack_from(">I", buf, offset)
+        box_type = bytes(buf[offset + 4:offset + 8]).decode("latin-1")
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                raise MP4ParseError(f"truncated {box_type} header at {offset}")
+            size, = unpack_from(">Q", buf, offset + 8)
+            header = 16
+        elif size == 0:
+            # size 为 0 表示一直延续到文件末尾，只允许出现在最后一个 box
+            size = end - offset
+        if size < header or offset + size > end:
+            raise MP4ParseError(f"{box_type} box at {offset} claims {size} bytes, only {end - offset} left")
+        yield Box(box_type, offset, size, header)
+        offset += size
+
+
+def _children(buf, box: Box) -> dict:
+    return {child.type: child for child in iter_boxes(buf, box.offset + box.header, box.offset + box.size)}
+
+
+def _timescale_duration(buf, box: Box) -> tuple:
+    """timescale and duration of an mvhd / mdhd box, both versions."""
+    body = box.offset + box.header
+    if buf[body] == 1:
+        timescale, duration = unpack_from(">IQ", buf, body + 20)
+    else:
+        timescale, duration = unpack_from(">II", buf, body + 12)
+    # 时长未知时为全 1
+    if duration in (0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+        duration = 0
+    return timescale, duration
+
+
+def _parse_trak(buf, trak: Box) -> MP4Track:
+    track = MP4Track()
+    boxes = _children(buf, trak)
+    tkhd = boxes.get("tkhd")
+    if tkhd is not None:
+        body = tkhd.offset + tkhd.header
+        track.track_id, = unpack_from(">I", buf, body + (20 if buf[body] == 1 else 12))
+        # tkhd 末尾是 16.16 定点数的显示宽高
+        width, height = unpack_from(">II", buf, tkhd.offset + tkhd.size - 8)
+        track.width, track.height = width >> 16, height >> 16
+    mdia = boxes.get("mdia")
+    if mdia is None:
+        return track
+    mdia_boxes = _children(buf, mdia)
+    if "mdhd" in mdia_boxes:
+        track.timescale, duration = _timescale_duration(buf, mdia_boxes["mdhd"])
+        track.duration = duration / track.timescale if track.timescale else None
+    if "hdlr" in mdia_boxes:
+        hdlr = mdia_boxes["hdlr"]
+        track.handler = bytes(buf[hdlr.offset + hdlr.header + 8:hdlr.offset + hdlr.header + 12]).decode("latin-1")
+    minf = mdia_boxes.get("minf")
+    stbl = _children(buf, minf).get("stbl") if minf is not None else None
+    if stbl is None:
+        return track
+    stbl_boxes = _children(buf, stbl)
+    track.chunk_offsets = stbl_boxes.get("stco") or stbl_boxes.get("co64")
+    stsd = stbl_boxes.get("stsd")
+    if stsd is not None:
+        body = stsd.offset + stsd.header
+        count, = unpack_from(">I", buf, body + 4)
+        if count:
+            entry = body + 8
+            track.codec = bytes(buf[entry + 4:entry + 8]).decode("latin-1")
+            if track.handler == "vide":
+                # VisualSampleEntry: 8 字节头 + 6 保留 + 2 data_reference_index + 16 预定义，之后是宽高
+                width, height = unpack_from(">HH", buf, entry + 32)
+                if width and height:
+                    track.width, track.height = width, height
+    return track
+
+
+def parse_mp4(path) -> MP4Info:
+    """
+    Parse the box layout of an MP4 / MOV file through mmap.
+    Only the headers of ftyp, moov and its descendants are touched, mdat is skipped, so even
+    multi-GB files take milliseconds.
+    :raises MP4ParseError: when the file is empty, truncated or has no moov box
+    """
+    size = os.path.getsize(path)
+    if size < 8:
+        raise MP4ParseError("empty file")
+    info = MP4Info(path, size)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        try:
+            info.boxes = list(iter_boxes(buf, 0, size))
+        except MP4ParseError as e:
+            raise MP4ParseError(f"corrupt or truncated file: {e}")
+        for box in info.boxes:
+            if box.type == "ftyp":
+                body = box.offset + box.header
+                info.major_brand = bytes(buf[body:body + 4]).decode("latin-1")
+                info.brands = [bytes(buf[offset:offset + 4]).decode("latin-1")
+                               for offset in range(body + 8, box.offset + box.size - 3, 4)]
+            elif box.type == "moov" and info.moov is None:
+                info.moov = box
+            elif box.type == "mdat" and info.mdat is None:
+                info.mdat = box
+        if info.moov is None:
+            raise MP4ParseError("no moov box, the file is not an MP4 or was not finalized")
+        try:
+            for box in iter_boxes(buf, info.moov.offset + info.moov.header, info.moov.offset + info.moov.size):
+                if box.type == "mvhd":
+                    timescale, duration = _timescale_duration(buf, box)
+                    info.duration = duration / timescale if timescale else None
+                elif box.type == "trak":
+                    info.tracks.append(_parse_trak(buf, box))
+        except (MP4ParseError, StructError, IndexError) as e:
+            raise MP4ParseError(f"corrupt moov: {e}")
+    if not info.duration:
+        info.duration = max((track.duration or 0 for track in info.tracks), default=0) or None
+    return info
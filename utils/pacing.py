@@ -0,0 +1,123 @@
+import asyncio
+import time
+from collections import deque
+
+from conf import UPLOAD_PACING
+from utils.log import scheduler_logger
+
+
+class TokenBucket(object):
+    """
+    `burst` tokens, refilled at one token every `interval` seconds.
+    Time comes from `time.monotonic`, nothing sleeps here.
+    """
+
+    def __init__(self, interval: float, burst: int = 1, now: float = None):
+        self.interval = interval
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        if self.interval > 0:
+            # 调用方传入的时间可能早于上次更新，不让令牌倒扣
+            self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated_at) / self.interval)
+        else:
+            self.tokens = self.burst
+        self.updated_at = max(self.updated_at, now)
+
+    def delay(self, now: float = None) -> float:
+        """:returns: seconds until a token is available, 0 when one is available now"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) * self.interval
+
+    def consume(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+
+    def rewind(self, seconds: float, now: float = None):
+        """Take back the refill of the last `seconds`, the next token is then counted from `now`."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.interval > 0:
+            self.tokens = max(0.0, self.tokens - seconds / self.interval)
+
+
+class UploadPacer(object):
+    """
+    Spacing between uploads, replacing a fixed sleep after each upload.
+
+    Every (platform, account) has a token bucket and every platform has one shared by
+    its accounts, configured by `UPLOAD_PACING`. An upload may start once both buckets
+    have a token, so different accounts overlap while each keeps its own spacing.
+    The account bucket does not refill while its upload runs: call `release` when the
+    upload has finished and the account interval counts from then, like the old sleep
+    after each publish. Platforms without configuration are not paced.
+    """
+
+    def __init__(self, config: dict = None):
+        self.config = UPLOAD_PACING if config is None else config
+        self._account_buckets = {}
+        self._platform_buckets = {}
+        self._started = {}
+        self.waited = 0.0
+
+    def _buckets(self, platform, account, now: float) -> list:
+        config = self.config.get(platform)
+        if not config:
+            return []
+        buckets = []
+        if config.get("account_interval"):
+            bucket = self._account_buckets.get((platform, account))
+            if bucket is None:
+                bucket = self._account_buckets[(platform, account)] = TokenBucket(
+                    config["account_interval"], config.get("account_burst", 1), now)
+            buckets.append(bucket)
+        if config.get("platform_interval"):
+            bucket = self._platform_buckets.get(platform)
+            if bucket is None:
+                bucket = self._platform_buckets[platform] = TokenBucket(
+                    config["platform_interval"], config.get("platform_burst", 1), now)
+            buckets.append(bucket)
+        return buckets
+
+    def try_acquire(self, platform, account) -> float:
+        """Take the tokens when both are available. :returns: 0 on success, else the seconds to wait"""
+        now = time.monotonic()
+        buckets = self._buckets(platform, account, now)
+        wait = max((bucket.delay(now) for bucket in buckets), default=0.0)
+        if wait == 0 and buckets:
+            for bucket in buckets:
+                bucket.consume(now)
+            self._started.setdefault((platform, account), deque()).append(now)
+        return wait
+
+    def release(self, platform, account):
+        """Mark the end of an upload started by `try_acquire` / `acquire`, whether it succeeded or not."""
+        started = self._started.get((platform, account))
+        if not started:
+            return
+        now = time.monotonic()
+        started_at = started.popleft()
+        bucket = self._account_buckets.get((platform, account))
+        if bucket is not None:
+            bucket.rewind(now - started_at, now)
+
+    async def acquire(self, platform, account):
+        """Wait without blocking the event loop until an upload of `account` on `platform` may start."""
+        start = time.monotonic()
+        while True:
+            wait = self.try_acquire(platform, account)
+            if wait == 0:
+                break
+            # 等待期间其他账号可能先拿到平台令牌，醒来后重新检查
+            await asyncio.sleep(wait)
+        waited = time.monotonic() - start
+        if waited > 0.5:
+            self.waited += waited
+            scheduler_logger.info(f"[+] {platform}/{account} 等待 {waited:.0f}s 后开始上传(风控间隔)")
+
+
+upload_pacer = UploadPacer()
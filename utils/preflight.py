@@ -0,0 +1,140 @@
+import asyncio
+from pathlib import Path
+
+from conf import UPLOAD_PREFLIGHT, PREFLIGHT_LIMITS, UPLOAD_FASTSTART, UPLOAD_TRANSCODE
+from utils.faststart import ensure_faststart
+from utils.log import scheduler_logger
+from utils.mp4 import parse_mp4, MP4ParseError
+from utils.transcode import transcoder, resolve_profile, needs_transcode, ENCODER_CODECS
+
+# ISO BMFF 格式的视频才做解析，其他格式(如 bilibili 支持的 flv)直接交给平台处理
+MP4_SUFFIXES = {".mp4", ".m4v", ".mov"}
+
+
+class PreflightError(Exception):
+    pass
+
+
+def transcoded_limits(info, limits: dict, profile: dict) -> tuple:
+    """
+    The limits still to check on the source when it is transcoded with `profile` before upload.
+    Resolution, codec and bitrate limits the profile output already meets are dropped.
+    :returns: (limits, expected upload size in bytes)
+    """
+    limits = dict(limits)
+    max_long_side = limits.get("max_long_side")
+    if max_long_side and profile.get("max_long_side") and profile["max_long_side"] <= max_long_side:
+        del limits["max_long_side"]
+    codecs = limits.get("codecs")
+    if codecs and ENCODER_CODECS.get(profile.get("codec"), set()) & set(codecs):
+        del limits["codecs"]
+    video_bitrate_kbps = profile.get("video_bitrate_kbps")
+    bitrate_kbps = (video_bitrate_kbps or 0) + (profile.get("audio_bitrate_kbps") or 0)
+    max_bitrate_kbps = limits.get("max_bitrate_kbps")
+    if max_bitrate_kbps and video_bitrate_kbps and bitrate_kbps <= max_bitrate_kbps:
+        del limits["max_bitrate_kbps"]
+    size = info.size
+    if video_bitrate_kbps and info.duration and needs_transcode(info, profile):
+        # 转码后的大小按目标码率估算
+        size = min(size, info.duration * bitrate_kbps * 1000 / 8)
+    return limits, size
+
+
+def check_limits(info, limits: dict, profile: dict = None) -> list:
+    """
+    :param profile: transcoding profile applied before upload, see `transcoded_limits`
+    :returns: the reasons why `info` breaks the platform `limits`, empty when it is fine
+    """
+    size = info.size
+    if profile:
+        limits, size = transcoded_limits(info, limits, profile)
+    problems = []
+    if info.video is None:
+        problems.append("no video track")
+    if not info.duration:
+        problems.append("zero duration")
+    max_size_mb = limits.get("max_size_mb")
+    if max_size_mb and size > max_size_mb * 1024 * 1024:
+        problems.append(f"size {size / 1024 / 1024:.0f}MB > {max_size_mb}MB")
+    max_duration = limits.get("max_duration")
+    if max_duration and info.duration and info.duration > max_duration:
+        problems.append(f"duration {info.duration:.1f}s > {max_duration}s")
+    min_duration = limits.get("min_duration")
+    if min_duration and info.duration and info.duration < min_duration:
+        problems.append(f"duration {info.duration:.1f}s < {min_duration}s")
+    max_long_side = limits.get("max_long_side")
+    if max_long_side and info.width and info.height and max(info.width, info.height) > max_long_side:
+        problems.append(f"resolution {info.width}x{info.height} > {max_long_side}px")
+    codecs = limits.get("codecs")
+    if codecs and info.video_codec and info.video_codec not in codecs:
+        problems.append(f"codec {info.video_codec} not in {'/'.join(codecs)}")
+    max_bitrate_kbps = limits.get("max_bitrate_kbps")
+    if max_bitrate_kbps and info.bitrate and info.bitrate > max_bitrate_kbps * 1000:
+        problems.append(f"bitrate {info.bitrate / 1000:.0f}kbps > {max_bitrate_kbps}kbps")
+    return problems
+
+
+def preflight_check(file, platform, transcode: bool = None) -> tuple:
+    """
+    Validate a video against the limits of `platform` without launching a browser.
+    :param transcode: check the transcoded result instead of the source, by default when
+                      UPLOAD_TRANSCODE is on and ffmpeg is available
+    :returns: (MP4Info or None, list of problems), files that are not MP4 are not checked
+    """
+    if Path(file).suffix.lower() not in MP4_SUFFIXES:
+        return None, []
+    try:
+        info = parse_mp4(file)
+    except (MP4ParseError, OSError) as e:
+        return None, [str(e)]
+    if transcode is None:
+        transcode = UPLOAD_TRANSCODE and transcoder.available()
+    resolved = resolve_profile(platform) if transcode else None
+    return info, check_limits(info, PREFLIGHT_LIMITS.get(platform, {}), resolved[1] if resolved else None)
+
+
+def preflight_files(files, platform, enabled: bool = UPLOAD_PREFLIGHT) -> list:
+    """
+    Drop the files that would be rejected by `platform`, logging why.
+    :returns: the accepted files in the given order
+    """
+    if not enabled:
+        return list(files)
+    accepted = []
+    for file in files:
+        info, problems = preflight_check(file, platform)
+        if problems:
+            scheduler_logger.warning(f"[+] 预检未通过，跳过 {platform}: {Path(file).name}: {'; '.join(problems)}")
+            continue
+        if info is not None:
+            scheduler_logger.debug(f"[+] 预检通过 {platform}: {Path(file).name}: {info.summary()}")
+        accepted.append(file)
+    return accepted
+
+
+def prepare_file(file, platform=None):
+    """
+    Run the optional rewriting stages on a video right before it is uploaded, every uploader calls
+    this first: transcoding to the platform profile (UPLOAD_TRANSCODE), otherwise moving the moov box
+    to the front (UPLOAD_FASTSTART). With both off the original file is uploaded unchanged.
+    Raises PreflightError when the source has to be uploaded untranscoded but breaks the platform limits.
+    :returns: the path to upload, `file` itself when nothing had to change
+    """
+    if UPLOAD_TRANSCODE and platform:
+        transcoded = transcoder.transcode(file, platform)
+        # 转码结果已经是 faststart 布局
+        if transcoded != file:
+            return transcoded
+        # 没有使用转码结果(ffmpeg 不可用、转码失败或结果更大)时上传原文件，预检按转码放宽过的限制要重新检查
+        problems = preflight_check(file, platform, transcode=False)[1] if UPLOAD_PREFLIGHT else []
+        if problems:
+            raise PreflightError(f"{Path(file).name} was not transcoded and cannot be uploaded to {platform}: "
+                                 f"{'; '.join(problems)}")
+    if UPLOAD_FASTSTART:
+        file = ensure_faststart(file)
+    return file
+
+
+async def prepare_upload_file(file, platform=None):
+    """`prepare_file` for the playwright uploaders, run in a worker thread so the event loop is not blocked."""
+    return await asyncio.get_running_loop().run_in_executor(None, prepare_file, file, platform)
@@ -0,0 +1,223 @@
+import bisect
+import heapq
+import json
+import os
+import time
+from datetime import datetime, timedelta, date
+from datetime import time as dt_time
+from pathlib import Path
+
+from conf import PUBLISH_RULES, PUBLISH_LEDGER_FILE
+from utils.log import scheduler_logger
+
+# 台账中只保留最近一天之前的记录，更早的已不影响每日上限和最小间隔
+LEDGER_KEEP_SECONDS = 24 * 60 * 60
+
+
+def parse_time_of_day(value) -> int:
+    """16 / "16:30" / datetime.time -> seconds after midnight"""
+    if isinstance(value, dt_time):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    if isinstance(value, (int, float)):
+        return int(value * 3600)
+    hour, _, minute = str(value).partition(":")
+    return int(hour) * 3600 + int(minute or 0) * 60
+
+
+def in_daily_window(seconds: int, window) -> bool:
+    start, end = parse_time_of_day(window[0]), parse_time_of_day(window[1])
+    if start <= end:
+        return start <= seconds < end
+    # 跨零点的时间段，例如 ("23:00", "07:00")
+    return seconds >= start or seconds < end
+
+
+class SlotCalendar(object):
+    """Taken publish times of one (platform, account): sorted timestamps and the count per day."""
+
+    def __init__(self):
+        self.taken = []
+        self.per_day = {}
+
+    def book(self, timestamps):
+        timestamps = sorted(timestamps)
+        # 两个有序序列合并，timsort 为线性时间
+        self.taken = sorted(self.taken + timestamps) if self.taken else timestamps
+        for timestamp in timestamps:
+            day = date.fromtimestamp(timestamp).toordinal()
+            self.per_day[day] = self.per_day.get(day, 0) + 1
+
+
+class SlotLedger(object):
+    """
+    JSON record of planned publish times, for uploads that are not kept in the job store.
+    Layout: {platform: {account: [timestamp, ...]}}
+    """
+
+    def __init__(self, ledger_file=PUBLISH_LEDGER_FILE):
+        self.ledger_file = Path(ledger_file)
+        self._entries = None
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.ledger_file, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        oldest = time.time() - LEDGER_KEEP_SECONDS
+        for accounts in self._entries.values():
+            for account, timestamps in accounts.items():
+                accounts[account] = [timestamp for timestamp in timestamps if timestamp >= oldest]
+        self.ledger_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.ledger_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, separators=(",", ":"))
+        os.replace(tmp_file, self.ledger_file)
+
+    def slots(self):
+        for platform, accounts in self._load().items():
+            for account, timestamps in accounts.items():
+                yield platform, account, timestamps
+
+    def book(self, platform, account, timestamps):
+        self._load().setdefault(platform, {}).setdefault(account, []).extend(timestamps)
+        self._save()
+
+
+class PublishPlanner(object):
+    """
+    Pack videos into the earliest free publish slots of each (platform, account).
+
+    Candidate slots are the `daily_times` of every day from the start day on, minus the daily and
+    absolute `blackouts`. A slot is free when the day has fewer than `daily_cap` bookings and no
+    booking of the account is closer than `min_gap` seconds. Rules come from `PUBLISH_RULES`
+    ("default" merged with the platform entry). Bookings are read from the job store and/or a
+    `SlotLedger`, and every plan is booked so later plans do not reuse the slots.
+
+    Free slots of an account are found in one forward sweep over its sorted bookings, and
+    `plan_accounts` spreads videos over several accounts with a heap of their next free slot.
+    """
+
+    def __init__(self, rules: dict = None, ledger: SlotLedger = None, start: datetime = None, start_days: int = 0):
+        self.rules = PUBLISH_RULES if rules is None else rules
+        self.ledger = ledger
+        if start is None:
+            # 和 generate_schedule_time_next_day 一样从第二天开始
+            start = datetime.combine(date.today() + timedelta(days=start_days + 1), dt_time())
+        self.start = start
+        self._calendars = {}
+        if ledger is not None:
+            for platform, account, timestamps in ledger.slots():
+                self.calendar(platform, account).book(timestamps)
+
+    def calendar(self, platform, account) -> SlotCalendar:
+        calendar = self._calendars.get((platform, account))
+        if calendar is None:
+            calendar = self._calendars[(platform, account)] = SlotCalendar()
+        return calendar
+
+    def load_jobs(self, store, platforms=None) -> int:
+        """Book the publish dates of the jobs in `store` (a JobStore). :returns: number of booked slots"""
+        booked = {}
+        for platform, account, publish_date in store.booked_slots(platforms):
+            booked.setdefault((platform, account), []).append(publish_date.timestamp())
+        for (platform, account), timestamps in booked.items():
+            self.calendar(platform, account).book(timestamps)
+        return sum(len(timestamps) for timestamps in booked.values())
+
+    def rules_for(self, platform, **overrides) -> dict:
+        rules = dict(self.rules.get("default", {}), **self.rules.get(platform, {}))
+        rules.update((key, value) for key, value in overrides.items() if value is not None)
+        return rules
+
+    def free_slots(self, platform, account, **overrides):
+        """Yield the free slots of an account as timestamps, earliest first, without booking them."""
+        rules = self.rules_for(platform, **overrides)
+        daily_blackouts = [window for window in rules.get("blackouts", []) if not isinstance(window[0], datetime)]
+        times = sorted({seconds for seconds in map(parse_time_of_day, rules.get("daily_times", [16]))
+                        if not any(in_daily_window(seconds, window) for window in daily_blackouts)})
+        daily_cap = min(rules.get("daily_cap") or len(times), len(times))
+        if not times or daily_cap <= 0:
+            raise ValueError(f"no publish slot left for {platform}: check daily_times, daily_cap and blackouts")
+        min_gap = rules.get("min_gap", 0)
+        absolute_blackouts = sorted((start.timestamp(), end.timestamp()) for start, end in rules.get("blackouts", [])
+                                    if isinstance(start, datetime))
+
+        calendar = self.calendar(platform, account)
+        taken, per_day = calendar.taken, calendar.per_day
+        start_timestamp = self.start.timestamp()
+        index = bisect.bisect_left(taken, start_timestamp)
+        blackout_index = 0
+        last_assigned = None
+        day = self.start.date()
+        while True:
+            count = per_day.get(day.toordinal(), 0)
+            midnight = datetime.combine(day, dt_time())
+            for seconds in times:
+                if count >= daily_cap:
+                    break
+                timestamp = (midnight + timedelta(seconds=seconds)).timestamp()
+                if timestamp < start_timestamp:
+                    continue
+                while blackout_index < len(absolute_blackouts) and absolute_blackouts[blackout_index][1] <= timestamp:
+                    blackout_index += 1
+                if blackout_index < len(absolute_blackouts) and absolute_blackouts[blackout_index][0] <= timestamp:
+                    continue
+                while index < len(taken) and taken[index] < timestamp:
+                    index += 1
+                previous = taken[index - 1] if index else None
+                if last_assigned is not None and (previous is None or last_assigned > previous):
+                    previous = last_assigned
+                if previous is not None and timestamp - previous < min_gap:
+                    continue
+                if index < len(taken) and (taken[index] == timestamp or taken[index] - timestamp < min_gap):
+                    continue
+                count += 1
+                last_assigned = timestamp
+                yield timestamp
+            day += timedelta(days=1)
+
+    def plan(self, platform, account, count: int, **overrides) -> list:
+        """
+        Book the `count` earliest free slots of an account.
+        :param overrides: rule values replacing `PUBLISH_RULES` for this plan, e.g. daily_times, daily_cap
+        :returns: list of datetime
+        """
+        slots = self.free_slots(platform, account, **overrides)
+        timestamps = [next(slots) for _ in range(count)]
+        self._book(platform, account, timestamps)
+        return [datetime.fromtimestamp(timestamp) for timestamp in timestamps]
+
+    def plan_accounts(self, platform, accounts, count: int, **overrides) -> list:
+        """
+        Spread `count` videos over `accounts`, each video taking the earliest free slot of any account.
+        :returns: list of (account, datetime) in publish order
+        """
+        heap = []
+        for order, account in enumerate(accounts):
+            slots = self.free_slots(platform, account, **overrides)
+            heap.append((next(slots), order, account, slots))
+        heapq.heapify(heap)
+        planned = {}
+        result = []
+        for _ in range(count):
+            timestamp, order, account, slots = heap[0]
+            planned.setdefault(account, []).append(timestamp)
+            result.append((account, datetime.fromtimestamp(timestamp)))
+            heapq.heapreplace(heap, (next(slots), order, account, slots))
+        for account, timestamps in planned.items():
+            self._book(platform, account, timestamps)
+        return result
+
+    def _book(self, platform, account, timestamps):
+        if not timestamps:
+            return
+        self.calendar(platform, account).book(timestamps)
+        if self.ledger is not None:
+            self.ledger.book(platform, account, timestamps)
+        scheduler_logger.debug(f"[+] {platform}/{account} 已安排 {len(timestamps)} 个发布时间: "
+                               f"{datetime.fromtimestamp(timestamps[0])} ~ {datetime.fromtimestamp(timestamps[-1])}")
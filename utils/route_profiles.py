@@ -0,0 +1,81 @@
+import re
+
+from conf import BLOCK_RESOURCES
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_KUAISHOU, \
+    SOCIAL_MEDIA_TIKTOK
+
+# 只有 url 匹配这些规则的请求才会被转发到 python 处理，其余请求由浏览器直接放行
+STATIC_ASSET_PATTERN = r"\.(png|jpe?g|gif|webp|avif|svg|ico|bmp|woff2?|ttf|otf|eot|mp4|webm|m3u8|mp3|m4a)(\?|#|$)"
+
+# 登录、验证码相关的资源必须放行，否则风控弹窗无法显示
+COMMON_ALLOW_URLS = r"captcha|verify|passport|sso|login"
+
+COMMON_TRACKER_HOSTS = [
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "hm.baidu.com",
+    "sentry.io",
+]
+
+ROUTE_PROFILES = {
+    SOCIAL_MEDIA_DOUYIN: {
+        "tracker_hosts": ["mcs.zijieapi.com", "mon.zijieapi.com", "lf3-short.ibytedapm.com", "mcs.snssdk.com"],
+        # 上传、封面和视频处理接口
+        "allow_urls": r"vod\.bytedanceapi\.com|tos-|imagex|\.bytedance\.com/upload",
+    },
+    SOCIAL_MEDIA_TENCENT: {
+        "tracker_hosts": ["aegis.qq.com", "badjs.weixinbridge.com", "h.trace.qq.com", "otheve.beacon.qq.com",
+                          "pingfore.qq.com", "report.url.cn"],
+        "allow_urls": r"finder-assistant|finderassistance|snsupload|wxapp\.tc\.qq\.com",
+    },
+    SOCIAL_MEDIA_KUAISHOU: {
+        "tracker_hosts": ["log-sdk.ksapisrv.com", "wlog.kuaishou.com", "apm-log.kuaishou.com", "weblog.kuaishou.com"],
+        "allow_urls": r"upload\.kuaishouzt\.com|/upload/",
+    },
+    SOCIAL_MEDIA_TIKTOK: {
+        "tracker_hosts": ["mcs.tiktokw.us", "mon.tiktokv.com", "mon-va.tiktokv.com", "analytics.tiktok.com",
+                          "mcs-va.tiktokv.com", "libraweb-va.tiktok.com"],
+        "allow_urls": r"vod-|tos-|/upload/|imagex",
+    },
+}
+
+
+def _tracker_pattern(hosts) -> re.Pattern:
+    hosts = "|".join(re.escape(host) for host in hosts)
+    return re.compile(rf"^https?://([^/]*\.)?({hosts})(:\d+)?/")
+
+
+async def apply_route_profile(context, platform, enabled: bool = BLOCK_RESOURCES):
+    """
+    Abort images, fonts and media and stub third-party trackers on the creator pages.
+    Upload, captcha and login traffic is always let through. Note that playwright disables
+    the HTTP cache of a context once routing is enabled.
+    :param context: playwright BrowserContext
+    :param platform: one of the SOCIAL_MEDIA_* names with a profile in ROUTE_PROFILES
+    :returns: the context
+    """
+    profile = ROUTE_PROFILES.get(platform)
+    if not enabled or not profile:
+        return context
+    allow = re.compile(f"{COMMON_ALLOW_URLS}|{profile['allow_urls']}", re.I)
+    tracker_pattern = _tracker_pattern(COMMON_TRACKER_HOSTS + profile["tracker_hosts"])
+
+    async def stub_tracker(route):
+        # 埋点脚本返回空脚本，上报请求返回 204，避免页面因请求失败而重试或报错
+        if route.request.resource_type == "script":
+            await route.fulfill(status=200, content_type="application/javascript", body="")
+        else:
+            await route.fulfill(status=204, body="")
+
+    async def block_static(route):
+        url = route.request.url
+        if allow.search(url) or route.request.resource_type not in ("image", "font", "media", "other"):
+            await route.continue_()
+        else:
+            await route.abort("blockedbyclient")
+
+    # 后注册的路由优先匹配，埋点规则放在最后以便优先处理 .gif 之类的上报请求
+    await context.route(re.compile(STATIC_ASSET_PATTERN, re.I), block_static)
+    await context.route(tracker_pattern, stub_tracker)
+    return context
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from conf import FFMPEG_PATH, TRANSCODE_WORKERS, TRANSCODE_CACHE_DIR, TRANSCODE_CACHE_MAX_MB, TRANSCODE_PROFILES
+from utils.fingerprint import file_fingerprint
+from utils.log import scheduler_logger
+from utils.mp4 import parse_mp4, MP4ParseError
+
+# 编码器输出对应的 mp4 sample entry，用于判断源文件是否已满足要求
+ENCODER_CODECS = {
+    "libx264": {"avc1", "avc3"},
+    "libx265": {"hvc1", "hev1"},
+}
+# 源文件码率略高于上限时不值得重新编码
+BITRATE_TOLERANCE = 1.1
+
+
+def resolve_profile(platform):
+    """
+    :returns: (profile key, profile) of `platform`, None when it has no profile.
+              Platforms with identical parameters get the same key and so share one output.
+    """
+    profile = TRANSCODE_PROFILES.get(platform)
+    if not profile:
+        return None
+    key = hashlib.sha1(json.dumps(profile, sort_keys=True).encode()).hexdigest()[:12]
+    return key, profile
+
+
+def needs_transcode(info, profile: dict) -> bool:
+    max_long_side = profile.get("max_long_side")
+    if max_long_side and info.width and info.height and max(info.width, info.height) > max_long_side:
+        return True
+    video_bitrate_kbps = profile.get("video_bitrate_kbps")
+    audio_bitrate_kbps = profile.get("audio_bitrate_kbps") or 0
+    if video_bitrate_kbps and info.bitrate \
+            and info.bitrate > (video_bitrate_kbps + audio_bitrate_kbps) * 1000 * BITRATE_TOLERANCE:
+        return True
+    codecs = ENCODER_CODECS.get(profile.get("codec"))
+    return bool(codecs and info.video_codec not in codecs)
+
+
+def ffmpeg_command(src, dst, profile: dict) -> list:
+    command = [FFMPEG_PATH, "-hide_banner", "-loglevel", "error", "-nostdin", "-y", "-i", str(src),
+               "-map", "0:v:0", "-map", "0:a:0?", "-c:v", profile.get("codec", "libx264"), "-preset", "veryfast"]
+    if profile.get("codec") == "libx265":
+        command += ["-tag:v", "hvc1"]
+    max_long_side = profile.get("max_long_side")
+    if max_long_side:
+        # 按长边缩放，横竖屏都适用，不放大小视频
+        command += ["-vf", f"scale='min(iw,{max_long_side})':'min(ih,{max_long_side})'"
+                           f":force_original_aspect_ratio=decrease:force_divisible_by=2"]
+    video_bitrate_kbps = profile.get("video_bitrate_kbps")
+    if video_bitrate_kbps:
+        command += ["-crf", "21", "-maxrate", f"{video_bitrate_kbps}k", "-bufsize", f"{video_bitrate_kbps * 2}k"]
+    command += ["-c:a", "aac", "-b:a", f"{profile.get('audio_bitrate_kbps', 128)}k",
+                "-movflags", "+faststart", "-f", "mp4", str(dst)]
+    return command
+
+
+class Transcoder(object):
+    """
+    Per-platform transcoding with a local ffmpeg, cached by (source fingerprint, profile key).
+
+    ffmpeg already runs in its own process, so at most `workers` ffmpeg processes (CPU count by
+    default) are started at once and callers wait in their own thread, run it through
+    `run_in_executor` from asyncio. Concurrent requests for the same output wait for a single
+    ffmpeg run. The cache directory is trimmed to `max_bytes`, least recently used first.
+    """
+
+    def __init__(self, cache_dir=TRANSCODE_CACHE_DIR, max_bytes: int = TRANSCODE_CACHE_MAX_MB * 1024 * 1024,
+                 workers: int = TRANSCODE_WORKERS):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.workers = workers or os.cpu_count() or 1
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._ffmpeg_checked = None
+
+    def available(self) -> bool:
+        if self._ffmpeg_checked is None:
+            self._ffmpeg_checked = shutil.which(FFMPEG_PATH) is not None
+            if not self._ffmpeg_checked:
+                scheduler_logger.warning(f"[+] 找不到 ffmpeg({FFMPEG_PATH})，跳过转码，请安装或配置 FFMPEG_PATH")
+        return self._ffmpeg_checked
+
+    def output_path(self, file, profile_key) -> Path:
+        fingerprint = file_fingerprint(file).replace(":", "-")
+        return self.cache_dir / f"{fingerprint}-{profile_key}" / Path(file).with_suffix(".mp4").name
+
+    def transcode(self, file, platform):
+        """
+        :returns: the transcoded copy of `file` for `platform`, or `file` itself when it already fits the
+                  profile, the platform has no profile or ffmpeg fails
+        """
+        resolved = resolve_profile(platform)
+        if resolved is None or not self.available():
+            return file
+        profile_key, profile = resolved
+        try:
+            info = parse_mp4(file)
+        except (MP4ParseError, OSError):
+            info = None
+        if info is not None and not needs_transcode(info, profile):
+            return file
+        target = self.output_path(file, profile_key)
+        with self._lock:
+            done = self._inflight.get(target)
+            owner = done is None
+            if owner:
+                done = self._inflight[target] = threading.Event()
+        if not owner:
+            # 另一个平台正在生成同一个结果
+            done.wait()
+            return self._smaller(file, self._cached(target))
+        try:
+            cached = self._cached(target)
+            if cached:
+                scheduler_logger.info(f"[+] 使用已缓存的转码视频 {platform}: {target}")
+                return self._smaller(file, cached)
+            return self._run(file, target, profile, platform)
+        finally:
+            with self._lock:
+                del self._inflight[target]
+            done.set()
+
+    @staticmethod
+    def _smaller(file, output):
+        # 重新编码反而更大时直接上传原文件，结果仍然缓存，下次不再转码
+        if output is None or output.stat().st_size >= os.path.getsize(file):
+            return file
+        return output
+
+    def _cached(self, target: Path):
+        if target.exists():
+            # 更新 mtime 作为最近使用时间，供 LRU 淘汰使用
+            os.utime(target)
+            return target
+        return None
+
+    def _run(self, file, target: Path, profile: dict, platform):
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # 其他进程可能在转码同一个视频，每次转码写入自己的临时文件，完成后原子替换
+        fd, tmp = tempfile.mkstemp(prefix=target.stem + ".", suffix=".part.mp4", dir=target.parent)
+        os.close(fd)
+        tmp = Path(tmp)
+        command = ffmpeg_command(file, tmp, profile)
+        with self._slots:
+            start = time.perf_counter()
+            try:
+                result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            except OSError as e:
+                result = None
+                error = str(e)
+            else:
+                error = result.stderr.decode(errors="replace").strip()[-500:]
+        if result is None or result.returncode != 0 or not tmp.stat().st_size:
+            scheduler_logger.warning(f"[+] 转码失败，使用原视频 {platform}: {Path(file).name}: {error}")
+            tmp.unlink(missing_ok=True)
+            return file
+        try:
+            os.replace(tmp, target)
+        except OSError as e:
+            tmp.unlink(missing_ok=True)
+            scheduler_logger.warning(f"[+] 保存转码结果失败，使用原视频 {platform}: {Path(file).name}: {e}")
+            return file
+        source_size, output_size = os.path.getsize(file), target.stat().st_size
+        scheduler_logger.info(f"[+] 转码完成 {platform}: {Path(file).name} {source_size / 1024 / 1024:.1f}MB -> "
+                              f"{output_size / 1024 / 1024:.1f}MB 用时 {time.perf_counter() - start:.1f}s")
+        self.evict(keep=target)
+        return self._smaller(file, target)
+
+    def evict(self, keep=None) -> int:
+        """Delete least recently used outputs until the cache fits `max_bytes`, returns the bytes freed."""
+        entries = []
+        for path in self.cache_dir.glob("*/*.mp4"):
+            if path.name.endswith(".part.mp4"):
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            try:
+                path.parent.rmdir()
+            except OSError:
+                pass
+            total -= size
+            freed += size
+        if freed:
+            scheduler_logger.info(f"[+] 转码缓存超过上限，已删除 {freed / 1024 / 1024:.1f}MB")
+        return freed
+
+
+transcoder = Transcoder()
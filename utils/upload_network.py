@@ -0,0 +1,132 @@
+import asyncio
+import re
+import time
+
+from conf import UPLOAD_NETWORK_DETECT
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_KUAISHOU, \
+    SOCIAL_MEDIA_TIKTOK
+from utils.log import browser_logger
+
+# 各平台视频分片上传请求和最终提交(合并分片)请求的 url 特征
+UPLOAD_NETWORK_PROFILES = {
+    SOCIAL_MEDIA_DOUYIN: {
+        "chunk": r"tos-[^/]*/|/upload/v1/",
+        "commit": r"Action=CommitUpload",
+    },
+    SOCIAL_MEDIA_TENCENT: {
+        "chunk": r"uploadpartdfs",
+        "commit": r"completepartuploaddfs",
+    },
+    SOCIAL_MEDIA_KUAISHOU: {
+        "chunk": r"/api/upload/fragment",
+        "commit": r"/api/upload/complete|/video/pc/upload/finish",
+    },
+    SOCIAL_MEDIA_TIKTOK: {
+        "chunk": r"tos-[^/]*/|/upload/v1/",
+        "commit": r"Action=CommitUpload",
+    },
+}
+
+
+class UploadNetworkMonitor(object):
+    """
+    Watch the upload traffic of a creator page and resolve as soon as the platform
+    accepts the file, i.e. the commit request of the chunked upload succeeds.
+
+    Chunk requests are counted to report the real upload throughput. Start the monitor
+    before the file is handed to the page. The commit only makes the DOM checks run at
+    once and more often, they stay the source of truth, see `UploadStatusProbe.wait(monitor=...)`.
+    """
+
+    def __init__(self, page, platform, enabled: bool = UPLOAD_NETWORK_DETECT, logger=browser_logger):
+        self.page = page
+        self.logger = logger
+        profile = UPLOAD_NETWORK_PROFILES.get(platform)
+        self.enabled = bool(enabled and profile)
+        self.chunk_pattern = re.compile(profile["chunk"]) if profile else None
+        self.commit_pattern = re.compile(profile["commit"]) if profile else None
+        self.completed = asyncio.Event()
+        self.bytes_sent = 0
+        self.chunks = 0
+        self.failed_chunks = 0
+        self.first_chunk_at = None
+        self.completed_at = None
+        self.commit_url = None
+        self._started = False
+
+    def start(self):
+        if self.enabled and not self._started:
+            self.page.on("requestfinished", self._on_request_finished)
+            self.page.on("requestfailed", self._on_request_failed)
+            self.page.on("response", self._on_response)
+            self._started = True
+        return self
+
+    def stop(self):
+        if self._started:
+            self.page.remove_listener("requestfinished", self._on_request_finished)
+            self.page.remove_listener("requestfailed", self._on_request_failed)
+            self.page.remove_listener("response", self._on_response)
+            self._started = False
+
+    def reset(self):
+        """Forget the previous attempt, used when the video is uploaded again after an error."""
+        self.completed.clear()
+        self.bytes_sent = self.chunks = self.failed_chunks = 0
+        self.first_chunk_at = self.completed_at = self.commit_url = None
+
+    def _is_chunk(self, request) -> bool:
+        return request.method in ("PUT", "POST") and bool(self.chunk_pattern.search(request.url))
+
+    @staticmethod
+    def _body_size(request) -> int:
+        length = request.headers.get("content-length")
+        if length and length.isdigit():
+            return int(length)
+        try:
+            return len(request.post_data_buffer or b"")
+        except Exception:
+            return 0
+
+    def _on_request_finished(self, request):
+        if not self._is_chunk(request):
+            return
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+        self.chunks += 1
+        self.bytes_sent += self._body_size(request)
+
+    def _on_request_failed(self, request):
+        if self._is_chunk(request):
+            self.failed_chunks += 1
+
+    def _on_response(self, response):
+        if self.completed.is_set() or not self.commit_pattern.search(response.url):
+            return
+        if response.request.method in ("PUT", "POST") and response.status < 400:
+            self.completed_at = time.perf_counter()
+            self.commit_url = response.url
+            self.completed.set()
+            self.logger.info(f"  [-] 平台已接收视频文件: {self.summary()}")
+
+    @property
+    def bytes_per_second(self):
+        if self.first_chunk_at is None:
+            return None
+        elapsed = (self.completed_at or time.perf_counter()) - self.first_chunk_at
+        return self.bytes_sent / elapsed if elapsed > 0 else None
+
+    def summary(self) -> str:
+        speed = self.bytes_per_second
+        speed = f"{speed / 1024 / 1024:.2f}MB/s" if speed else "-"
+        return f"{self.chunks} chunks, {self.bytes_sent / 1024 / 1024:.1f}MB, {speed}, {self.failed_chunks} failed"
+
+    async def wait(self, timeout: float = None) -> bool:
+        """:returns: True once the commit request succeeded, False on timeout or when disabled"""
+        if not self.enabled:
+            return False
+        try:
+            await asyncio.wait_for(self.completed.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
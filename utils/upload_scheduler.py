@@ -0,0 +1,258 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+
+from conf import PLATFORM_CONCURRENCY, ACCOUNT_CONCURRENCY
+from utils.log import scheduler_logger
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_SKIPPED = "skipped"
+
+_job_ids = itertools.count(1)
+
+
+class UploadJob(object):
+    """
+    One upload to run on the scheduler.
+    :param run: coroutine function such as `DouYinVideo(...).main`, or a plain callable such as
+                `BilibiliUploader(...).upload` which is then run in a worker thread
+    :param store_id: id of the job in the JobStore, if it is persisted
+    :param fingerprint: content fingerprint of the video, used for deduplication
+    """
+
+    def __init__(self, platform, account, run, name=None, store_id=None, fingerprint=None):
+        self.job_id = next(_job_ids)
+        self.store_id = store_id
+        self.fingerprint = fingerprint
+        self.platform = platform
+        self.account = account
+        self.run = run
+        self.name = name or f"{platform}/{account}#{self.job_id}"
+        self.state = JOB_PENDING
+        self.result = None
+        self.error = None
+        self.submitted_at = None
+        self.started_at = None
+        self.finished_at = None
+        self.timings = {}
+        self.task = None
+
+    @property
+    def account_key(self):
+        return self.platform, self.account
+
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    async def execute(self):
+        if asyncio.iscoroutinefunction(self.run):
+            return await self.run()
+        return await asyncio.to_thread(self.run)
+
+    def __repr__(self):
+        return f"<UploadJob {self.name} {self.state}>"
+
+
+class UploadScheduler(object):
+    """
+    Run upload jobs concurrently with per-platform and per-account caps.
+
+    Pending jobs are queued per (platform, account) and picked round-robin, so an
+    account with many videos cannot starve the others. With a `store` the state of
+    jobs that have a `store_id` is persisted, see utils.job_store. With a `dedup`
+    index, jobs with a `fingerprint` already published to the account are skipped
+    right before they would start, and recorded once they are done. With a `pacer`
+    (utils.pacing.UploadPacer) a job only starts once its account and platform have a
+    token, other accounts keep running meanwhile.
+    """
+
+    def __init__(self, platform_limits: dict = None, account_limit: int = ACCOUNT_CONCURRENCY,
+                 default_platform_limit: int = 1, store=None, dedup=None, pacer=None):
+        self.platform_limits = dict(PLATFORM_CONCURRENCY, **(platform_limits or {}))
+        self.account_limit = max(1, account_limit)
+        self.default_platform_limit = max(1, default_platform_limit)
+        self.store = store
+        self.dedup = dedup
+        self.pacer = pacer
+        self.jobs = []
+        self._queues = {}
+        self._rotation = deque()
+        self._running_platform = {}
+        self._running_account = {}
+        self._idle = None
+        self._wakeup = None
+
+    def submit(self, job: UploadJob) -> UploadJob:
+        job.submitted_at = time.monotonic()
+        self.jobs.append(job)
+        queue = self._queues.get(job.account_key)
+        if queue is None:
+            queue = self._queues[job.account_key] = deque()
+            self._rotation.append(job.account_key)
+        queue.append(job)
+        if self._idle is not None:
+            self._dispatch()
+        return job
+
+    def add(self, platform, account, run, name=None, store_id=None, fingerprint=None) -> UploadJob:
+        return self.submit(UploadJob(platform, account, run, name, store_id, fingerprint))
+
+    def _has_capacity(self, platform, account_key) -> bool:
+        platform_limit = self.platform_limits.get(platform, self.default_platform_limit)
+        return self._running_platform.get(platform, 0) < platform_limit \
+            and self._running_account.get(account_key, 0) < self.account_limit
+
+    def _dispatch(self):
+        started = True
+        while started:
+            started = False
+            # 从轮转的开头找第一个能开始任务的账号，只有开始了任务的账号移到队尾，
+            # 因容量不足或风控间隔被跳过的账号保持原位，下次空出位置时优先
+            for account_key in self._rotation:
+                queue = self._queues[account_key]
+                if not queue or not self._has_capacity(account_key[0], account_key):
+                    continue
+                job = queue.popleft()
+                if self._is_duplicate(job):
+                    self._skip(job)
+                elif self._paced(job):
+                    queue.appendleft(job)
+                    continue
+                else:
+                    self._start(job)
+                    self._rotation.remove(account_key)
+                    self._rotation.append(account_key)
+                started = True
+                break
+        if self._idle is not None and not any(self._queues.values()) and not any(self._running_platform.values()):
+            self._idle.set()
+
+    def _paced(self, job: UploadJob) -> bool:
+        """True when the pacer holds `job` back, the queues are dispatched again once it may start."""
+        if self.pacer is None:
+            return False
+        wait = self.pacer.try_acquire(job.platform, job.account)
+        if wait == 0:
+            return False
+        loop = asyncio.get_running_loop()
+        when = loop.time() + wait
+        if self._wakeup is None or self._wakeup.when() > when:
+            if self._wakeup is not None:
+                self._wakeup.cancel()
+            self._wakeup = loop.call_at(when, self._wake)
+        return True
+
+    def _wake(self):
+        self._wakeup = None
+        if self._idle is not None:
+            self._dispatch()
+
+    def _is_duplicate(self, job: UploadJob) -> bool:
+        return self.dedup is not None and job.fingerprint is not None \
+            and self.dedup.is_published(job.fingerprint, job.platform, job.account)
+
+    def _skip(self, job: UploadJob):
+        job.state = JOB_SKIPPED
+        scheduler_logger.info(f"[+] 跳过已发布的视频 {job.name}")
+        if self.store is not None and job.store_id is not None:
+            self.store.mark_finished(job.store_id, JOB_SKIPPED, "already published")
+
+    def _start(self, job: UploadJob):
+        self._running_platform[job.platform] = self._running_platform.get(job.platform, 0) + 1
+        self._running_account[job.account_key] = self._running_account.get(job.account_key, 0) + 1
+        job.state = JOB_RUNNING
+        job.started_at = time.monotonic()
+        job.timings["queued"] = round(job.started_at - job.submitted_at, 3)
+        if self.store is not None and job.store_id is not None:
+            self.store.mark_running(job.store_id)
+        job.task = asyncio.create_task(job.execute())
+        job.task.add_done_callback(lambda task: self._finish(job, task))
+        scheduler_logger.info(f"[+] 开始任务 {job.name}")
+
+    def _finish(self, job: UploadJob, task: asyncio.Task):
+        self._running_platform[job.platform] -= 1
+        self._running_account[job.account_key] -= 1
+        job.finished_at = time.monotonic()
+        if self.pacer is not None:
+            # 账号的发布间隔从上传结束时开始计算
+            self.pacer.release(job.platform, job.account)
+        if task.cancelled():
+            job.state = JOB_CANCELLED
+            scheduler_logger.warning(f"[-] 任务已取消 {job.name}")
+        elif task.exception() is not None:
+            job.state = JOB_FAILED
+            job.error = task.exception()
+            scheduler_logger.error(f"[-] 任务失败 {job.name}: {job.error}")
+        elif task.result() is False:
+            # 上传器返回 False 表示平台拒绝了这次上传
+            job.state = JOB_FAILED
+            job.result = False
+            job.error = "upload returned False"
+            scheduler_logger.error(f"[-] 任务失败 {job.name}: {job.error}")
+        else:
+            job.state = JOB_DONE
+            job.result = task.result()
+            scheduler_logger.success(f"[+] 任务完成 {job.name} 用时 {job.duration:.1f}s")
+        job.timings["run"] = round(job.duration, 3)
+        if job.state == JOB_DONE and self.dedup is not None and job.fingerprint is not None:
+            self.dedup.record(job.fingerprint, job.platform, job.account, job.name)
+        if self.store is not None and job.store_id is not None:
+            self.store.mark_finished(job.store_id, job.state, job.error, job.timings)
+        self._dispatch()
+
+    def cancel(self, job_id=None, account=None, platform=None) -> int:
+        """
+        Cancel pending and running jobs, all of them when no filter is given.
+        :returns: number of cancelled jobs
+        """
+        cancelled = 0
+        for job in self.jobs:
+            if job.state not in (JOB_PENDING, JOB_RUNNING):
+                continue
+            if (job_id is not None and job.job_id != job_id) or (account is not None and job.account != account) \
+                    or (platform is not None and job.platform != platform):
+                continue
+            if job.state == JOB_PENDING:
+                self._queues[job.account_key].remove(job)
+                job.state = JOB_CANCELLED
+                if self.store is not None and job.store_id is not None:
+                    self.store.mark_finished(job.store_id, JOB_CANCELLED)
+            else:
+                job.task.cancel()
+            cancelled += 1
+        if self._idle is not None:
+            self._dispatch()
+        return cancelled
+
+    async def run(self) -> list:
+        """Run until every submitted job has finished, failed or been cancelled."""
+        self._idle = asyncio.Event()
+        self._dispatch()
+        try:
+            await self._idle.wait()
+            # 取消的任务会在下一轮事件循环中回调 _finish
+            await asyncio.gather(*[job.task for job in self.jobs if job.task], return_exceptions=True)
+        except asyncio.CancelledError:
+            self.cancel()
+            await asyncio.gather(*[job.task for job in self.jobs if job.task], return_exceptions=True)
+            raise
+        finally:
+            self._idle = None
+            if self._wakeup is not None:
+                self._wakeup.cancel()
+                self._wakeup = None
+            if self.store is not None:
+                self.store.flush()
+        counts = {}
+        for job in self.jobs:
+            counts[job.state] = counts.get(job.state, 0) + 1
+        scheduler_logger.info(f"[+] 所有任务结束: {counts}")
+        return self.jobs
@@ -0,0 +1,220 @@
+import asyncio
+import itertools
+import time
+
+from utils.log import browser_logger
+
+# 一次 evaluate 内完成全部 done / failed / progress 规则的检测，可选地安装 MutationObserver，
+# 状态变化时通过 expose_binding 推送给 python，而不是每隔几秒逐个 selector 调用 count()
+STATUS_PROBE_JS = """
+({rules, binding, key}) => {
+    const root = document.body || document.documentElement;
+    const isEnabled = (el) => !el.disabled && el.getAttribute('aria-disabled') !== 'true'
+        && !/disabled/i.test(typeof el.className === 'string' ? el.className : '');
+    const isVisible = (el) => !!(el.offsetParent || el.getClientRects().length);
+    const matchOne = (cond) => {
+        // 文本规则先对整棵树做一次快速判断，避免对大量节点逐个取 textContent
+        if (cond.text && !(root.textContent || '').includes(cond.text)) return !!cond.absent;
+        const found = Array.from(document.querySelectorAll(cond.selector)).some(el =>
+            (!cond.text || (el.textContent || '').includes(cond.text))
+            && (!cond.not_text || !(el.textContent || '').includes(cond.not_text))
+            && (!cond.visible || isVisible(el))
+            && (cond.enabled === undefined || isEnabled(el) === cond.enabled));
+        return cond.absent ? !found : found;
+    };
+    const firstMatch = (group) => {
+        for (const rule of group) {
+            if (rule.all.every(matchOne)) return rule.name;
+        }
+        return null;
+    };
+    const evaluate = () => {
+        let progress = null;
+        if (rules.progress) {
+            const el = document.querySelector(rules.progress.selector);
+            if (el) progress = rules.progress.attr ? el.getAttribute(rules.progress.attr) : (el.textContent || '').trim();
+        }
+        return {done: firstMatch(rules.done), failed: firstMatch(rules.failed), progress: progress};
+    };
+    if (binding && window[binding]) {
+        if (window[key]) window[key].disconnect();
+        let last = JSON.stringify(evaluate());
+        let scheduled = false;
+        const push = () => {
+            scheduled = false;
+            const state = evaluate();
+            const serialized = JSON.stringify(state);
+            if (serialized !== last) {
+                last = serialized;
+                window[binding](state);
+            }
+        };
+        // 上传进度会引起大量 DOM 变化，合并到 100ms 内只检测一次
+        const observer = new MutationObserver(() => {
+            if (!scheduled) {
+                scheduled = true;
+                setTimeout(push, 100);
+            }
+        });
+        observer.observe(root, {childList: true, subtree: true, attributes: true, characterData: true});
+        window[key] = observer;
+    }
+    return evaluate();
+}
+"""
+
+_probe_ids = itertools.count(1)
+
+
+def _normalize_rules(rules) -> list:
+    """
+    A rule is a condition dict or a list of condition dicts that must all match.
+    Condition keys: selector (css), text, not_text, visible, enabled, absent.
+    """
+    normalized = []
+    for rule in rules or []:
+        conditions = [rule] if isinstance(rule, dict) else list(rule)
+        name = " & ".join(
+            condition["selector"] + (f' "{condition["text"]}"' if condition.get("text") else "")
+            for condition in conditions)
+        normalized.append({"name": name, "all": conditions})
+    return normalized
+
+
+class UploadStatusProbe(object):
+    """
+    Upload status of a creator page gathered in a single round trip.
+
+    `snapshot()` evaluates every rule in one `evaluate` call, `wait()` additionally
+    installs a MutationObserver that pushes state changes through `expose_binding`,
+    so a finished or failed upload is noticed within ~100ms instead of on the next poll.
+    Only plain css is allowed in the rules, playwright pseudo classes such as
+    `:has-text` and `:visible` are expressed with the `text` / `visible` keys.
+    """
+
+    def __init__(self, page, done, failed=None, progress=None, frame=None, logger=browser_logger):
+        """
+        :param page: playwright Page, the binding is exposed on it
+        :param done: rules meaning the upload has finished
+        :param failed: rules meaning the upload has failed
+        :param progress: {"selector": css, "attr": attribute name or None for the text}
+        :param frame: Frame holding the upload form, defaults to the main frame
+        """
+        self.page = page
+        self.frame = frame
+        self.logger = logger
+        self.rules = {"done": _normalize_rules(done), "failed": _normalize_rules(failed), "progress": progress}
+        probe_id = next(_probe_ids)
+        self.binding = f"__uploadStatusPush{probe_id}"
+        self.key = f"__uploadStatusObserver{probe_id}"
+        self._bound = False
+        self._pushed = None
+        self._changed = None
+        self.round_trips = 0
+
+    def _target(self):
+        if self.frame is not None and not self.frame.is_detached():
+            return self.frame
+        return self.page.main_frame
+
+    def _on_push(self, source, state):
+        self._pushed = state
+        if self._changed is not None:
+            self._changed.set()
+
+    async def _evaluate(self, install: bool) -> dict:
+        self.round_trips += 1
+        try:
+            return await self._target().evaluate(STATUS_PROBE_JS, {
+                "rules": self.rules,
+                "binding": self.binding if install else None,
+                "key": self.key,
+            })
+        except Exception as e:
+            # 页面跳转或 iframe 重建时执行上下文会被销毁，下一次检测会重新安装 observer
+            self.logger.debug(f"  [-] upload status probe failed: {e}")
+            return {"done": None, "failed": None, "progress": None}
+
+    async def snapshot(self) -> dict:
+        """:returns: {"done": rule name or None, "failed": rule name or None, "progress": str or None}"""
+        return await self._evaluate(install=False)
+
+    async def _wake_on(self, event):
+        await event.wait()
+        if self._changed is not None:
+            self._changed.set()
+
+    async def wait(self, timeout: float = None, poll_interval: float = 5.0, on_progress=None,
+                   monitor=None, network_poll_interval: float = 1.0, grace: float = None) -> dict:
+        """
+        Wait until a done or failed rule matches, or `timeout` seconds have passed.
+        A full re-check still runs every `poll_interval` seconds in case the observer was lost.
+        :param on_progress: called with the progress value whenever it changes
+        :param monitor: UploadNetworkMonitor, once it sees the commit request the DOM is re-checked at
+                        once and then every `network_poll_interval` seconds, the DOM rules still decide
+        :param grace: opt-in, report the upload done `grace` seconds after the commit request even when
+                      no DOM rule agrees
+        :returns: the last state, both done and failed are None on timeout
+        """
+        if not self._bound:
+            await self.page.expose_binding(self.binding, self._on_push)
+            self._bound = True
+        self._changed = asyncio.Event()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        committed_at = None
+        watcher = None
+        if monitor is not None and monitor.enabled:
+            watcher = asyncio.ensure_future(self._wake_on(monitor.completed))
+        state = await self._evaluate(install=True)
+        last_progress = None
+        try:
+            while True:
+                if state.get("progress") != last_progress:
+                    last_progress = state.get("progress")
+                    if on_progress and last_progress is not None:
+                        on_progress(last_progress)
+                if state.get("done") or state.get("failed"):
+                    return state
+                wait_for = poll_interval
+                if watcher is not None and monitor.completed.is_set():
+                    if committed_at is None:
+                        # 平台已接收文件，立即重新检测页面，之后缩短检测间隔
+                        committed_at = time.monotonic()
+                        state = await self._evaluate(install=True)
+                        continue
+                    wait_for = min(wait_for, network_poll_interval)
+                    if grace is not None:
+                        remaining_grace = committed_at + grace - time.monotonic()
+                        if remaining_grace <= 0:
+                            return dict(state, done=f"network {monitor.commit_url}")
+                        wait_for = min(wait_for, remaining_grace)
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return state
+                    wait_for = min(wait_for, remaining)
+                self._changed.clear()
+                self._pushed = None
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=wait_for)
+                    state = self._pushed or state
+                except asyncio.TimeoutError:
+                    if committed_at is None:
+                        self.logger.info("  [-] 正在上传视频中...")
+                    state = await self._evaluate(install=True)
+        finally:
+            self._changed = None
+            if watcher is not None:
+                watcher.cancel()
+            try:
+                await self._target().evaluate(f"() => window['{self.key}'] && window['{self.key}'].disconnect()")
+            except Exception:
+                pass
+
+
+async def get_upload_frame(page, iframe_selector):
+    """:returns: the Frame of `iframe_selector` if the page has one, else None"""
+    handle = await page.query_selector(iframe_selector)
+    if handle is None:
+        return None
+    return await handle.content_frame()
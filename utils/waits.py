@@ -0,0 +1,165 @@
+import asyncio
+import re
+import time
+
+from utils.log import browser_logger
+
+_OBSERVE_JS = """
+(target, quietMs, timeoutMs, firstMutation) => new Promise(resolve => {
+    let quietTimer = null;
+    const finish = (value) => {
+        observer.disconnect();
+        clearTimeout(quietTimer);
+        clearTimeout(guardTimer);
+        resolve(value);
+    };
+    const arm = () => {
+        clearTimeout(quietTimer);
+        quietTimer = setTimeout(() => finish(true), quietMs);
+    };
+    const observer = new MutationObserver(() => firstMutation ? finish(true) : arm());
+    observer.observe(target, {childList: true, subtree: true, attributes: true, characterData: true});
+    const guardTimer = setTimeout(() => finish(false), timeoutMs);
+    if (!firstMutation) arm();
+})
+"""
+
+# 在页面中按 selector 查找观察目标
+DOM_SETTLED_JS = f"""
+([selector, quietMs, timeoutMs, firstMutation]) => ({_OBSERVE_JS})(
+    (selector && document.querySelector(selector)) || document.body || document.documentElement,
+    quietMs, timeoutMs, firstMutation)
+"""
+
+# 直接观察 locator 指向的元素，元素位于 iframe 中时同样有效
+ELEMENT_SETTLED_JS = f"""
+(element, [quietMs, timeoutMs]) => ({_OBSERVE_JS})(element, quietMs, timeoutMs, false)
+"""
+
+
+def _log_wait(description, start, satisfied):
+    elapsed = (time.perf_counter() - start) * 1000
+    browser_logger.debug(f"  [wait] {description}: {'ok' if satisfied else 'timeout'} {elapsed:.0f}ms")
+    return satisfied
+
+
+async def wait_for_state(locator, state="visible", timeout=5000, description=None) -> bool:
+    """
+    Wait until a locator reaches `state` (attached / detached / visible / hidden).
+    :returns: True when reached, False on timeout, never raises
+    """
+    start = time.perf_counter()
+    try:
+        await locator.first.wait_for(state=state, timeout=timeout)
+        satisfied = True
+    except Exception:
+        satisfied = False
+    return _log_wait(description or f"{locator} {state}", start, satisfied)
+
+
+async def wait_for_url(page, url_pattern, timeout=10000, description=None) -> bool:
+    """
+    Wait until the page URL matches `url_pattern` (regex or substring), or changes when it is None.
+    """
+    start = time.perf_counter()
+    if url_pattern is None:
+        old_url = page.url
+        predicate = lambda url: url != old_url
+    else:
+        pattern = re.compile(url_pattern) if isinstance(url_pattern, str) else url_pattern
+        predicate = lambda url: bool(pattern.search(url))
+    try:
+        if not predicate(page.url):
+            await page.wait_for_url(predicate, timeout=timeout, wait_until="commit")
+        satisfied = True
+    except Exception:
+        satisfied = False
+    return _log_wait(description or f"url {url_pattern or 'change'}", start, satisfied)
+
+
+async def wait_for_network_idle(page, url_pattern, idle_ms=500, timeout=10000, description=None,
+                                action=None) -> bool:
+    """
+    Wait until no request whose URL matches `url_pattern` has been in flight for `idle_ms`.
+    Only the given endpoints are tracked, unrelated background traffic is ignored.
+    :param action: coroutine function triggering the requests, awaited once the listeners are attached
+                   so that no request is missed; at least one matching request is then waited for
+    """
+    start = time.perf_counter()
+    pattern = re.compile(url_pattern) if isinstance(url_pattern, str) else url_pattern
+    in_flight = set()
+    seen = action is None
+    changed = asyncio.Event()
+
+    def on_request(request):
+        nonlocal seen
+        if pattern.search(request.url):
+            in_flight.add(request)
+            seen = True
+            changed.set()
+
+    def on_done(request):
+        if request in in_flight:
+            in_flight.discard(request)
+            changed.set()
+
+    page.on("request", on_request)
+    page.on("requestfinished", on_done)
+    page.on("requestfailed", on_done)
+    deadline = start + timeout / 1000
+    satisfied = False
+    try:
+        if action is not None:
+            await action()
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            changed.clear()
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=min(remaining, idle_ms / 1000))
+            except asyncio.TimeoutError:
+                if seen and not in_flight:
+                    satisfied = True
+                    break
+    finally:
+        page.remove_listener("request", on_request)
+        page.remove_listener("requestfinished", on_done)
+        page.remove_listener("requestfailed", on_done)
+    return _log_wait(description or f"network idle {pattern.pattern}", start, satisfied)
+
+
+async def wait_for_dom_settled(page, selector=None, quiet_ms=300, timeout=2000, description=None) -> bool:
+    """
+    Wait until the DOM under `selector` (default body) has had no mutation for `quiet_ms`.
+    Replaces fixed sleeps after typing or clicking, which usually trigger a short re-render.
+    """
+    return await _observe_dom(page, selector, quiet_ms, timeout, False, description or f"dom settled {selector or 'body'}")
+
+
+async def wait_for_dom_mutation(page, selector=None, timeout=2000, description=None) -> bool:
+    """Wait for the first DOM mutation under `selector` (default body)."""
+    return await _observe_dom(page, selector, 0, timeout, True, description or f"dom mutation {selector or 'body'}")
+
+
+async def wait_for_element_settled(locator, quiet_ms=300, timeout=2000, description=None) -> bool:
+    """
+    Wait until the subtree of the element behind `locator` has had no mutation for `quiet_ms`.
+    Use it instead of wait_for_dom_settled when the element lives inside an iframe.
+    """
+    start = time.perf_counter()
+    try:
+        satisfied = await locator.first.evaluate(ELEMENT_SETTLED_JS, [quiet_ms, timeout], timeout=timeout)
+    except Exception:
+        satisfied = False
+    return _log_wait(description or f"{locator} settled", start, satisfied)
+
+
+async def _observe_dom(page, selector, quiet_ms, timeout, first_mutation, description) -> bool:
+    start = time.perf_counter()
+    try:
+        satisfied = await page.evaluate(DOM_SETTLED_JS, [selector, quiet_ms, timeout, first_mutation])
+    except Exception:
+        # 页面跳转会销毁执行上下文，此时视为 DOM 已发生变化
+        satisfied = True
+    return _log_wait(description, start, satisfied)